@@ -18,3 +18,5 @@ admin.site.register(Choice)
 admin.site.register(ExamResult)
 admin.site.register(UserAnswer)
 admin.site.register(AnswerInterval)
+admin.site.register(ExamAttempt)
+admin.site.register(Job)
@@ -0,0 +1,213 @@
+# Classical item analysis of exams, computed with NumPy over the answer matrix
+
+import datetime
+import itertools
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+from main.models import ExamResult, UserAnswer
+from main.manifest import MANIFEST_TIMEOUT, get_exam_manifest
+from main.tasks import enqueue, task
+
+# Items that discriminate less than this are worth a second look
+LOW_DISCRIMINATION = 0.2
+
+_FETCH_CHUNK_SIZE = 10000
+
+
+def answer_matrix(exam_id, manifest):
+    """Load the students × questions answers of an exam's submitted students.
+
+    Returns (students, choice_index): the submitting user ids, and a matrix
+    with the position of the picked choice within its question, or -1 for
+    no answer. Columns follow the manifest order. Answers come from a single
+    query; the choices they point at are resolved through the manifest.
+    """
+    students = np.fromiter(
+        ExamResult.objects.filter(exam_id=exam_id).order_by('user_id').values_list('user_id', flat=True),
+        dtype=np.int64,
+    )
+    # Choice id -> (question column, position of the choice in the question)
+    choice_ids = []
+    columns = []
+    positions = []
+    for column, question in enumerate(manifest.questions):
+        for position, choice in enumerate(question['choices']):
+            choice_ids.append(choice['id'])
+            columns.append(column)
+            positions.append(position)
+    choice_ids = np.array(choice_ids, dtype=np.int64)
+    order = np.argsort(choice_ids)
+    choice_ids, columns, positions = choice_ids[order], np.array(columns)[order], np.array(positions)[order]
+
+    # Filtering by question ids needs no join; answers of students who did not
+    # submit are dropped below, which is cheaper in NumPy than in SQL
+    pairs = (
+        UserAnswer.objects.filter(question_id__in=manifest.question_ids, choice__isnull=False)
+        .values_list('user_id', 'choice_id')
+        .iterator(chunk_size=_FETCH_CHUNK_SIZE)
+    )
+    answers = np.fromiter(itertools.chain.from_iterable(pairs), dtype=np.int64).reshape(-1, 2)
+
+    matrix = np.full((len(students), len(manifest.questions)), -1, dtype=np.int16)
+    if len(answers) and len(choice_ids) and len(students):
+        # Answers whose choice is no longer part of the exam are dropped too
+        found = np.searchsorted(choice_ids, answers[:, 1]).clip(max=len(choice_ids) - 1)
+        student_rows = np.searchsorted(students, answers[:, 0]).clip(max=len(students) - 1)
+        keep = (choice_ids[found] == answers[:, 1]) & (students[student_rows] == answers[:, 0])
+        matrix[student_rows[keep], columns[found[keep]]] = positions[found[keep]]
+    return students, matrix
+
+
+def item_statistics(manifest, matrix):
+    """Difficulty, discrimination and distractor rates of every question, and KR-20.
+
+    p_value is the share of students who answered correctly. point_biserial
+    correlates an item with the rest of the score (the total without the
+    item itself), so an item does not inflate its own discrimination.
+    Values that are undefined, such as a correlation for an item everyone
+    got right, are None.
+    """
+    students, questions = matrix.shape
+    if not students:
+        return {
+            'students': 0,
+            'mean_score': None,
+            'kr20': None,
+            'items': [
+                {
+                    'number': column + 1, 'question': question, 'p_value': None, 'point_biserial': None,
+                    'low_discrimination': False, 'unanswered_rate': None,
+                    'choices': [{'choice': choice, 'rate': None} for choice in question['choices']],
+                }
+                for column, question in enumerate(manifest.questions)
+            ],
+        }
+    max_choices = max((len(question['choices']) for question in manifest.questions), default=0)
+    # Correctness of every (question, choice position) pair, padded to max_choices
+    key = np.zeros((questions, max(max_choices, 1)), dtype=bool)
+    for column, question in enumerate(manifest.questions):
+        key[column, :len(question['choices'])] = [choice['is_correct'] for choice in question['choices']]
+
+    answered = matrix >= 0
+    columns = np.broadcast_to(np.arange(questions), matrix.shape)
+    correct = (answered & key[columns, matrix.clip(min=0)]).astype(np.float64)
+
+    totals = correct.sum(axis=1)
+    p_values = correct.mean(axis=0)
+
+    rest = totals[:, None] - correct
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = ((correct - correct.mean(axis=0)) * (rest - rest.mean(axis=0))).mean(axis=0)
+        point_biserial = covariance / (correct.std(axis=0) * rest.std(axis=0))
+
+    # Share of students picking each choice position of each question
+    flat = (columns * key.shape[1] + matrix)[answered]
+    counts = np.bincount(flat, minlength=key.size).reshape(key.shape)
+    rates = counts / students
+
+    variance = totals.var()
+    if questions > 1 and variance > 0:
+        kr20 = questions / (questions - 1) * (1 - (p_values * (1 - p_values)).sum() / variance)
+    else:
+        kr20 = None
+
+    items = []
+    for column, question in enumerate(manifest.questions):
+        discrimination = _number(point_biserial[column])
+        items.append({
+            'number': column + 1,
+            'question': question,
+            'p_value': _number(p_values[column]),
+            'point_biserial': discrimination,
+            'low_discrimination': discrimination is not None and discrimination < LOW_DISCRIMINATION,
+            'unanswered_rate': _number(1 - answered[:, column].mean()),
+            'choices': [
+                {'choice': choice, 'rate': _number(rates[column, position])}
+                for position, choice in enumerate(question['choices'])
+            ],
+        })
+    return {
+        'students': students,
+        'mean_score': _number(totals.mean()),
+        'kr20': _number(kr20) if kr20 is not None else None,
+        'items': items,
+    }
+
+
+def _number(value):
+    return None if np.isnan(value) else round(float(value), 3)
+
+
+def in_background():
+    return getattr(settings, 'ITEM_ANALYSIS_IN_BACKGROUND', True)
+
+
+def refresh_delay():
+    return getattr(settings, 'ITEM_ANALYSIS_DELAY', 60)
+
+
+def _analysis_key(exam_id, manifest):
+    # A new submission, a deleted result or an edited exam each give a new key
+    latest = ExamResult.objects.filter(exam_id=exam_id).aggregate(latest=Max('pk'), count=Count('pk'))
+    return f"item-analysis:{exam_id}:{manifest.version}:{latest['latest']}:{latest['count']}"
+
+
+def _latest_key(exam_id):
+    return f'item-analysis-latest:{exam_id}'
+
+
+def get_item_analysis(exam_id, manifest):
+    """Compute the item analysis of an exam, or return it from the cache.
+
+    Loading the answer matrix of a large exam takes seconds, so pages use
+    get_cached_item_analysis and leave this to the item_analysis job.
+    """
+    key = _analysis_key(exam_id, manifest)
+    analysis = cache.get(key)
+    if analysis is None:
+        students, matrix = answer_matrix(exam_id, manifest)
+        analysis = item_statistics(manifest, matrix)
+        cache.set(key, analysis, MANIFEST_TIMEOUT)
+        # Shown while the analysis of newer submissions is being computed
+        cache.set(_latest_key(exam_id), analysis, MANIFEST_TIMEOUT)
+    return analysis
+
+
+def get_cached_item_analysis(exam_id, manifest):
+    """Return (analysis, up_to_date) without computing anything in the request.
+
+    When the cached analysis is missing or older than the latest submission,
+    a job to compute it is queued and the last computed analysis, or None,
+    is returned. Without ITEM_ANALYSIS_IN_BACKGROUND it is computed in place.
+    """
+    if not in_background():
+        return get_item_analysis(exam_id, manifest), True
+    key = _analysis_key(exam_id, manifest)
+    analysis = cache.get(key)
+    if analysis is not None:
+        return analysis, True
+    # Page views of the same submissions share one job
+    enqueue('item_analysis', key=key, exam_id=exam_id)
+    return cache.get(_latest_key(exam_id)), False
+
+
+def schedule_item_analysis(exam_id):
+    """Queue the item analysis of an exam to be refreshed after a submission.
+
+    Submissions within ITEM_ANALYSIS_DELAY seconds of each other share one
+    job, which runs at the end of that window, so a class submitting at the
+    bell loads the answer matrix once rather than once per student.
+    """
+    delay = refresh_delay()
+    window = int(timezone.now().timestamp() // delay)
+    run_at = datetime.datetime.fromtimestamp((window + 1) * delay, tz=datetime.timezone.utc)
+    return enqueue('item_analysis', key=f'item-analysis-refresh:{exam_id}:{window}', run_at=run_at, exam_id=exam_id)
+
+
+@task('item_analysis')
+def item_analysis_job(job, exam_id):
+    analysis = get_item_analysis(exam_id, get_exam_manifest(exam_id))
+    return {'exam_id': exam_id, 'students': analysis['students']}
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from . import manifest, roles, search
+        # Imported for the system checks and tasks they register
+        from . import analytics, checks, purge
+        manifest.connect_signals()
+        roles.connect_signals()
+        search.connect_signals()
@@ -0,0 +1,139 @@
+# Native async versions of the student hot-path views, used when the app is
+# served over ASGI (see ASYNC_STUDENT_VIEWS in settings).
+
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render, resolve_url
+from main.models import Exam, ExamAttempt, ExamResult, Question, Choice, UserAnswer
+from . import views
+from .autosave import answer_buffer, pending_answers_for, write_behind_enabled
+from .grading import aget_answered_question_ids
+from .manifest import aget_exam_manifest
+
+
+def async_login_required(view_func):
+    # Same behaviour as login_required, which only supports sync views in Django 4.2
+    @wraps(view_func)
+    async def _wrapper_view(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if is_authenticated:
+            return await view_func(request, *args, **kwargs)
+        return redirect_to_login(request.get_full_path(), resolve_url(settings.LOGIN_URL))
+
+    return _wrapper_view
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404
+
+
+@async_login_required
+async def answer_exam(request, exam_id, page_number=1):
+    # Only page views are async; answering and submitting keep the sync view
+    if request.method != 'GET':
+        return await sync_to_async(views.answer_exam)(request, exam_id, page_number)
+
+    exam = await aget_object_or_404(Exam.objects.all(), pk=exam_id)
+    exam_result = await ExamResult.objects.filter(user=request.user, exam=exam).afirst()
+    if exam_result:
+        return redirect('student_view_results', exam_result_id=exam_result.pk)
+
+    # Questions and choices come from the cached exam manifest, not the ORM
+    manifest = await aget_exam_manifest(exam.id)
+    paginator = Paginator(manifest.questions, 1)
+    page_obj = paginator.get_page(page_number)
+
+    # The attempt holds the server-side clock for this user and exam
+    attempt = await ExamAttempt.astart(request.user, exam)
+    remaining_time = attempt.remaining_seconds()
+
+    # Get answered question IDs for the current user and exam, including buffered autosaves
+    answered_question_ids = await aget_answered_question_ids(manifest, request.user)
+    pending_answers = pending_answers_for(request.user.id)
+    unanswered_question_ids = [question_id for question_id in manifest.question_ids if question_id not in answered_question_ids]
+    await attempt.atrack(page_obj.number, len(answered_question_ids))
+
+    question = page_obj.object_list[0] if page_obj else None
+    user_answer = None
+    total_time_previous_sessions = 0
+    if question:
+        user_answer, created = await UserAnswer.objects.aget_or_create(user=request.user, question_id=question['id'])
+        total_time_previous_sessions = user_answer.time_spent.total_seconds()
+        await user_answer.astart_visit()
+        if question['id'] in pending_answers:
+            user_answer.choice_id = pending_answers[question['id']]
+
+    # If there are no unanswered questions, point at the last page
+    first_unanswered_page_number = manifest.page_number(unanswered_question_ids[0]) if unanswered_question_ids else paginator.num_pages
+
+    context = {
+        'exam': exam,
+        'page_obj': page_obj,
+        'question': question,
+        'user_answer': user_answer,
+        'total_time_previous_sessions': total_time_previous_sessions,
+        'remaining_time': remaining_time,
+        'unanswered_question_ids': unanswered_question_ids,
+        'first_unanswered_page_number': first_unanswered_page_number,
+    }
+    # Context processors query the database, so render in a thread
+    return await sync_to_async(render)(request, 'student/answer_exam.html', context)
+
+
+@async_login_required
+async def save_answer(request):
+    if request.method == 'POST':
+        try:
+            question_id = int(request.POST.get('question_id'))
+            choice_id = int(request.POST['choice_id']) if request.POST.get('choice_id') else None
+            exam_id = int(request.POST['exam_id']) if request.POST.get('exam_id') else None
+        except (TypeError, ValueError):
+            raise Http404
+
+        if exam_id is not None:
+            # Validate against the cached exam manifest instead of the database
+            manifest = await aget_exam_manifest(exam_id)
+            if manifest.question(question_id) is None:
+                raise Http404
+            if choice_id is not None and not manifest.has_choice(question_id, choice_id):
+                raise Http404
+        else:
+            question = await aget_object_or_404(Question.objects.all(), pk=question_id)
+            if choice_id is not None:
+                await aget_object_or_404(Choice.objects.all(), pk=choice_id, question=question)
+
+        if write_behind_enabled():
+            answer_buffer.add(request.user.id, question_id, choice_id)
+        else:
+            await UserAnswer.objects.aupdate_or_create(
+                user=request.user,
+                question_id=question_id,
+                defaults={'choice_id': choice_id}
+            )
+
+        return JsonResponse({'status': 'success'})
+
+
+@async_login_required
+async def remove_unanswered_question(request):
+    if request.method == 'POST':
+        try:
+            question_id = int(request.POST.get('question_id'))
+        except (TypeError, ValueError):
+            raise Http404
+
+        # The attempt at the exam of the question, found in one lookup
+        attempt = await aget_object_or_404(ExamAttempt.objects.all(), user=request.user, exam__questions=question_id)
+
+        # Refresh the answered count of the attempt, including buffered autosaves
+        answered_count = len(await aget_answered_question_ids(await aget_exam_manifest(attempt.exam_id), request.user))
+        await attempt.atrack(attempt.current_position, answered_count)
+
+        return JsonResponse({'status': 'success', 'answered_count': answered_count})
@@ -0,0 +1,122 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import connection, connections
+from main.models import UserAnswer
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled():
+    return getattr(settings, 'AUTOSAVE_WRITE_BEHIND', False)
+
+
+def record_answer(user_id, question_id, choice_id):
+    if write_behind_enabled():
+        # Coalesced in memory and written in batches by the answer buffer
+        answer_buffer.add(user_id, question_id, choice_id)
+    else:
+        UserAnswer.objects.update_or_create(
+            user_id=user_id,
+            question_id=question_id,
+            defaults={'choice_id': choice_id}
+        )
+
+
+def pending_answers_for(user_id):
+    return answer_buffer.pending_for_user(user_id) if write_behind_enabled() else {}
+
+
+def upsert_answers(answers):
+    # answers maps (user_id, question_id) to choice_id. The unique constraint on
+    # (user, question) lets the whole batch be written as one upsert statement.
+    if not answers:
+        return
+    # MySQL upserts on any unique key and does not take a conflict target
+    unique_fields = ['user', 'question'] if connection.features.supports_update_conflicts_with_target else None
+    UserAnswer.objects.bulk_create(
+        [UserAnswer(user_id=user_id, question_id=question_id, choice_id=choice_id) for (user_id, question_id), choice_id in answers.items()],
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=['choice'],
+    )
+
+
+class AnswerBuffer:
+    """Per-process buffer that coalesces autosaved answers until they are flushed."""
+
+    def __init__(self, flush_interval=None):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        # Held from taking a snapshot until it is written, so an older snapshot
+        # (e.g. a timer flush) can never be written after a newer one (a submit flush)
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def add(self, user_id, question_id, choice_id):
+        with self._lock:
+            # Later clicks on the same question replace earlier ones
+            self._pending.setdefault(user_id, {})[question_id] = choice_id
+            self._schedule()
+
+    def discard(self, user_id, question_id):
+        with self._lock:
+            user_pending = self._pending.get(user_id)
+            if user_pending:
+                user_pending.pop(question_id, None)
+
+    def pending_for_user(self, user_id):
+        with self._lock:
+            return dict(self._pending.get(user_id, {}))
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(user_pending) for user_pending in self._pending.values())
+
+    def flush(self, user_id=None):
+        with self._flush_lock:
+            return self._flush(user_id)
+
+    def _flush(self, user_id):
+        with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {user_id: self._pending.pop(user_id, {})}
+        answers = {
+            (pending_user_id, question_id): choice_id
+            for pending_user_id, user_pending in pending.items()
+            for question_id, choice_id in user_pending.items()
+        }
+        try:
+            upsert_answers(answers)
+        except Exception:
+            # Put the answers back unless a newer click arrived in the meantime
+            with self._lock:
+                for (pending_user_id, question_id), choice_id in answers.items():
+                    self._pending.setdefault(pending_user_id, {}).setdefault(question_id, choice_id)
+                self._schedule()
+            raise
+        return len(answers)
+
+    def _schedule(self):
+        if self.flush_interval is None or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Failed to flush buffered answers')
+        finally:
+            # Timer threads are short-lived, so don't leave their connections open
+            connections.close_all()
+
+
+answer_buffer = AnswerBuffer(flush_interval=getattr(settings, 'AUTOSAVE_FLUSH_INTERVAL', 2))
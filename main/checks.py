@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries only live in the process that wrote them
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # Exam manifest and user role versions are kept in the default cache. With
+    # a per-process cache, a bump in one worker is never seen by the others,
+    # which keep serving the old answer key or the old role.
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [
+            Warning(
+                f'The default cache ({backend}) is not shared between processes.',
+                hint='Exam manifest and role versions are kept in it; use Memcached, Redis or the '
+                     'database cache when running more than one worker process.',
+                id='main.W001',
+            )
+        ]
+    return []
@@ -0,0 +1,63 @@
+# Deep copies of exams: the exam, its questions and their choices, written with bulk inserts
+
+from django.db import connection, transaction
+from main.models import Choice, Exam, Question
+from main.search import index_objects
+
+BATCH_SIZE = 500
+
+
+def copy_name(exam, course):
+    # Copies within a course need a name that tells them apart
+    if course.pk != exam.course_id:
+        return exam.name
+    return f'{exam.name} (copy)'[:Exam._meta.get_field('name').max_length]
+
+
+def clone_exam(exam, course=None, name=None):
+    """Copy an exam with its questions and choices into course, its own by default.
+
+    Questions keep their texts, explanations and explanation media; image
+    files are shared with the original rather than duplicated. Questions and
+    choices are inserted in bulk, with the new question ids mapped from the
+    old ones in memory, so the copy takes a handful of queries however large
+    the exam is. Results, attempts and answers are not copied.
+    """
+    course = course or exam.course
+    with transaction.atomic():
+        copy = Exam.objects.create(
+            name=name or copy_name(exam, course),
+            description=exam.description,
+            course=course,
+            duration=exam.duration,
+            exam_type=exam.exam_type,
+        )
+        questions = list(Question.objects.filter(exam=exam).order_by('pk'))
+        old_ids = [question.pk for question in questions]
+        for question in questions:
+            question.pk = None
+            question.exam = copy
+        if connection.features.can_return_rows_from_bulk_insert:
+            Question.objects.bulk_create(questions, batch_size=BATCH_SIZE)
+        else:
+            # Without RETURNING the new ids are only known by saving one at a time
+            for question in questions:
+                question.save()
+        question_ids = dict(zip(old_ids, (question.pk for question in questions)))
+
+        Choice.objects.bulk_create(
+            [
+                Choice(question_id=question_ids[question_id], choice_text=choice_text, is_correct=is_correct)
+                for question_id, choice_text, is_correct in Choice.objects.filter(question_id__in=old_ids)
+                .order_by('pk').values_list('question_id', 'choice_text', 'is_correct').iterator(chunk_size=BATCH_SIZE)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        # bulk_create skips the signals that keep the search index in sync
+        index_objects(questions)
+    return copy
+
+
+def clone_course_exams(source, target):
+    """Copy every exam of source into target, e.g. at the start of a term."""
+    return [clone_exam(exam, target) for exam in Exam.objects.filter(course=source).select_related('course').order_by('pk')]
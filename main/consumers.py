@@ -0,0 +1,173 @@
+import asyncio
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.urls import reverse
+from main.models import Exam, ExamAttempt, ExamResult, UserAnswer
+from .autosave import pending_answers_for, record_answer
+from .grading import get_answered_question_ids, submit_exam
+from .manifest import exam_group_name, get_exam_manifest
+
+
+class ExamConsumer(AsyncJsonWebsocketConsumer):
+    """One socket per student for an exam in progress.
+
+    Messages from the client:
+        {"type": "answer", "question_id": 1, "choice_id": 2}
+        {"type": "navigate", "page": 3}
+        {"type": "submit"}
+
+    Messages to the client:
+        {"type": "question", ...}   the current question and progress
+        {"type": "saved", ...}      an answer was recorded
+        {"type": "tick", "remaining_time": 120}
+        {"type": "submitted", "result_url": "..."}
+        {"type": "error", "message": "..."}
+    """
+
+    # Seconds between countdown messages; the deadline is always the server's
+    tick_interval = 1
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.exam_id = self.scope['url_route']['kwargs']['exam_id']
+        self.ticker = None
+        self.user_answer = None
+        self.page = 1
+        if not self.user.is_authenticated or not await self.start_attempt():
+            await self.close()
+            return
+
+        self.group_name = exam_group_name(self.exam_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_json(await self.open_question(self.attempt.current_position))
+        self.ticker = asyncio.ensure_future(self.tick())
+
+    async def disconnect(self, code):
+        if self.ticker:
+            self.ticker.cancel()
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        await self.close_visit()
+
+    async def receive_json(self, content):
+        message_type = content.get('type')
+        try:
+            if message_type == 'answer':
+                await self.send_json(await self.save_answer(content.get('question_id'), content.get('choice_id')))
+            elif message_type == 'navigate':
+                await self.send_json(await self.open_question(int(content.get('page', 1))))
+            elif message_type == 'submit':
+                await self.submit()
+            else:
+                await self.send_json({'type': 'error', 'message': f'Unknown message type: {message_type}'})
+        except (TypeError, ValueError):
+            await self.send_json({'type': 'error', 'message': 'Invalid message.'})
+
+    async def exam_changed(self, event):
+        # The teacher edited the exam: show the current question from the new manifest
+        await self.send_json(await self.open_question(self.page))
+
+    async def tick(self):
+        while True:
+            remaining_time = self.attempt.remaining_seconds()
+            if remaining_time is not None:
+                await self.send_json({'type': 'tick', 'remaining_time': int(remaining_time)})
+                if remaining_time <= 0:
+                    await self.submit()
+                    return
+            await asyncio.sleep(self.tick_interval)
+
+    async def submit(self):
+        if self.ticker and self.ticker is not asyncio.current_task():
+            self.ticker.cancel()
+        result_url = await self.submit_attempt()
+        await self.send_json({'type': 'submitted', 'result_url': result_url})
+        await self.close()
+
+    @database_sync_to_async
+    def start_attempt(self):
+        self.exam = Exam.objects.filter(pk=self.exam_id).first()
+        if self.exam is None or ExamResult.objects.filter(user=self.user, exam=self.exam).exists():
+            return False
+        self.attempt = ExamAttempt.start(self.user, self.exam)
+        return True
+
+    @database_sync_to_async
+    def open_question(self, page):
+        manifest = get_exam_manifest(self.exam_id)
+        self.page = min(max(page, 1), max(len(manifest), 1))
+        question = manifest.questions[self.page - 1] if manifest.questions else None
+        # Staying on the same question (a repeated navigate, or an exam_changed
+        # broadcast) keeps the open visit rather than counting a new one
+        if self.user_answer is not None and (question is None or self.user_answer.question_id != question['id']):
+            self._close_visit()
+
+        selected_choice_id = None
+        time_spent = 0
+        if question:
+            if self.user_answer is None:
+                self.user_answer, created = UserAnswer.objects.get_or_create(user=self.user, question_id=question['id'])
+                # The answer_exam page load that opened this socket has already started the visit
+                if self.user_answer.visit_started_at is None:
+                    self.user_answer.start_visit()
+            selected_choice_id = pending_answers_for(self.user.id).get(question['id'], self.user_answer.choice_id)
+            time_spent = self.user_answer.time_spent.total_seconds()
+
+        answered_question_ids = get_answered_question_ids(manifest, self.user)
+        self.attempt.track(self.page, len(answered_question_ids))
+        return {
+            'type': 'question',
+            'page': self.page,
+            'page_count': len(manifest),
+            # Choices are sent without is_correct
+            'question': question and {
+                'id': question['id'],
+                'question_text': question['question_text'],
+                'choices': [{'id': choice['id'], 'choice_text': choice['choice_text']} for choice in question['choices']],
+            },
+            'selected_choice_id': selected_choice_id,
+            'time_spent': time_spent,
+            'remaining_time': self.attempt.remaining_seconds(),
+            **self.progress(manifest, answered_question_ids),
+        }
+
+    @database_sync_to_async
+    def save_answer(self, question_id, choice_id):
+        question_id = int(question_id)
+        choice_id = int(choice_id) if choice_id is not None else None
+        manifest = get_exam_manifest(self.exam_id)
+        if manifest.question(question_id) is None or (choice_id is not None and not manifest.has_choice(question_id, choice_id)):
+            return {'type': 'error', 'message': 'Invalid answer.'}
+
+        record_answer(self.user.id, question_id, choice_id)
+        answered_question_ids = get_answered_question_ids(manifest, self.user)
+        self.attempt.track(self.page, len(answered_question_ids))
+        return {
+            'type': 'saved',
+            'question_id': question_id,
+            'choice_id': choice_id,
+            **self.progress(manifest, answered_question_ids),
+        }
+
+    def progress(self, manifest, answered_question_ids):
+        unanswered_question_ids = [question_id for question_id in manifest.question_ids if question_id not in answered_question_ids]
+        return {
+            'unanswered_question_ids': unanswered_question_ids,
+            'first_unanswered_page': manifest.page_number(unanswered_question_ids[0]) if unanswered_question_ids else len(manifest),
+        }
+
+    @database_sync_to_async
+    def submit_attempt(self):
+        self._close_visit()
+        exam_result = submit_exam(self.exam, self.user, self.attempt)
+        return reverse('student_view_results', kwargs={'exam_result_id': exam_result.pk})
+
+    @database_sync_to_async
+    def close_visit(self):
+        self._close_visit()
+
+    def _close_visit(self):
+        if self.user_answer is not None:
+            self.user_answer.end_visit()
+            self.user_answer = None
@@ -0,0 +1,120 @@
+# CSV exports of results, streamed so memory does not grow with the number of rows
+
+import csv
+from itertools import groupby
+from django.http import StreamingHttpResponse
+from django.utils.text import slugify
+from main.models import Exam, ExamResult, UserAnswer
+from main.manifest import get_exam_manifest
+
+CHUNK_SIZE = 2000
+
+# Spreadsheets run cells that start with these as formulas
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    # csv.writer writes into this and gets the formatted line back
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_response(filename, header, rows):
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow([_cell(value) for value in header])
+        for row in rows:
+            yield writer.writerow([_cell(value) for value in row])
+
+    response = StreamingHttpResponse(lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_exam_results(exam):
+    header = [
+        'Username', 'First Name', 'Last Name', 'Email', 'Score', 'Total Questions', 'Percentage',
+        'Incorrect Answers', 'Unanswered Questions', 'Answered At', 'Time Taken (s)', 'Time Up',
+    ]
+    rows = (
+        ExamResult.objects.filter(exam=exam).order_by('pk')
+        .values_list(
+            'user__username', 'user__first_name', 'user__last_name', 'user__email', 'score', 'total_questions',
+            'percentage', 'incorrect_answers', 'unanswered_questions', 'answered_at', 'start_time', 'end_time', 'time_up',
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    def result_rows():
+        for *student, score, total, percentage, incorrect, unanswered, answered_at, start_time, end_time, time_up in rows:
+            time_taken = round((end_time - start_time).total_seconds()) if start_time and end_time else None
+            yield [*student, score, total, percentage, incorrect, unanswered, answered_at.isoformat(), time_taken, time_up]
+
+    return csv_response(f'{slugify(exam.name)}-results.csv', header, result_rows())
+
+
+def export_course_gradebook(course):
+    """One row per student with their percentage on every exam of the course."""
+    exams = list(Exam.objects.filter(course=course).order_by('pk').values_list('pk', 'name'))
+    positions = {exam_id: i for i, (exam_id, name) in enumerate(exams)}
+    header = ['Username', 'First Name', 'Last Name', 'Email', *(f'{name} (%)' for exam_id, name in exams), 'Average (%)']
+    # Ordered by student, so each student's results arrive together and are written as one row.
+    # Filtering by the listed exams leaves out exams that are deleted but not purged yet.
+    rows = (
+        ExamResult.objects.filter(exam_id__in=list(positions)).order_by('user_id', 'exam_id')
+        .values_list('user_id', 'user__username', 'user__first_name', 'user__last_name', 'user__email', 'exam_id', 'percentage')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    def student_rows():
+        for user_id, results in groupby(rows, key=lambda row: row[0]):
+            results = list(results)
+            percentages = [None] * len(exams)
+            for row in results:
+                percentages[positions[row[5]]] = row[6]
+            taken = [percentage for percentage in percentages if percentage is not None]
+            average = round(sum(taken) / len(taken), 2) if taken else None
+            yield [*results[0][1:5], *percentages, average]
+
+    return csv_response(f'{slugify(course.name)}-gradebook.csv', header, student_rows())
+
+
+def export_answer_matrix(exam):
+    """One row per student who submitted, with the choice they picked for every question."""
+    manifest = get_exam_manifest(exam.id)
+    questions = manifest.questions
+    header = ['Username', 'First Name', 'Last Name', *(f"Q{i}: {question['question_text']}" for i, question in enumerate(questions, 1)), 'Correct']
+    answer_key = ['Answer key', '', '', *((question['correct_answer'] or {}).get('choice_text') for question in questions), len(questions)]
+    rows = (
+        UserAnswer.objects.filter(question__exam=exam, user__in=ExamResult.objects.filter(exam=exam).values('user_id'))
+        .order_by('user_id', 'question_id')
+        .values_list('user_id', 'user__username', 'user__first_name', 'user__last_name', 'question_id', 'choice_id')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    def student_rows():
+        yield answer_key
+        for user_id, answers in groupby(rows, key=lambda row: row[0]):
+            cells = [None] * len(questions)
+            correct = 0
+            student = None
+            for row in answers:
+                student = row[1:4]
+                position = manifest.page_number(row[4])
+                choice = manifest.choice(row[5])
+                if position is None or choice is None:
+                    continue
+                cells[position - 1] = choice['choice_text']
+                correct += choice['is_correct']
+            yield [*student, *cells, correct]
+
+    return csv_response(f'{slugify(exam.name)}-answers.csv', header, student_rows())
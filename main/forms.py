@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.models import User, Group
-from .models import Course, Exam, Choice, Question
+from .models import Course, Exam, Question
 from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth import get_user_model
 
@@ -45,10 +45,20 @@ class QuestionForm(forms.ModelForm):
         model = Question
         fields = ['question_text', 'explanation_text', 'explanation_image', 'explanation_video']
 
-class ChoiceForm(forms.ModelForm):
-    class Meta:
-        model = Choice
-        fields = ['choice_text', 'is_correct']
+class QuestionImportForm(forms.Form):
+    FORMAT_CHOICES = [('', 'From the file name'), ('csv', 'CSV'), ('json', 'JSON'), ('jsonl', 'JSON Lines'), ('yaml', 'YAML')]
+
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=FORMAT_CHOICES, required=False)
+
+class ExamCloneForm(forms.Form):
+    course = forms.ModelChoiceField(queryset=Course.objects.none(), empty_label=None)
+    name = forms.CharField(max_length=100)
+
+    def __init__(self, *args, teacher, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Exams can only be copied into the teacher's own courses
+        self.fields['course'].queryset = Course.objects.filter(teacher=teacher).order_by('name')
 
 class CustomPasswordResetForm(PasswordResetForm):
     def clean_email(self):
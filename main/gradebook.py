@@ -0,0 +1,30 @@
+# Students × exams grid of a course, built from one query over the results of a page of students
+
+from main.models import ExamResult
+
+
+def gradebook_rows(exams, students):
+    """One row per student with their result on each exam, in the order given.
+
+    Cells are None for exams the student has not taken, otherwise a dict with
+    the percentage and the submitted and time_up flags. Filtering by exam ids
+    rather than by course keeps the lookup on the (user, exam) unique index.
+    """
+    positions = {exam.pk: i for i, exam in enumerate(exams)}
+    cells = {student.pk: [None] * len(exams) for student in students}
+    results = (
+        ExamResult.objects.filter(user_id__in=list(cells), exam_id__in=list(positions))
+        .values_list('user_id', 'exam_id', 'percentage', 'submitted', 'time_up')
+    )
+    for user_id, exam_id, percentage, submitted, time_up in results:
+        cells[user_id][positions[exam_id]] = {'percentage': percentage, 'submitted': submitted, 'time_up': time_up}
+
+    rows = []
+    for student in students:
+        taken = [cell['percentage'] for cell in cells[student.pk] if cell and cell['percentage'] is not None]
+        rows.append({
+            'student': student,
+            'cells': cells[student.pk],
+            'average': round(sum(taken) / len(taken), 2) if taken else None,
+        })
+    return rows
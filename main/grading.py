@@ -0,0 +1,146 @@
+import datetime
+from django.db import transaction
+from django.utils import timezone
+from main.models import ExamResult, UserAnswer
+from .autosave import answer_buffer, pending_answers_for, write_behind_enabled
+from .manifest import get_exam_manifest
+from .stats import record_result
+from . import analytics
+
+
+# Columns of each row in ExamResult.snapshot['questions']. Texts are copied so
+# the graded paper stays as the student saw it even if the exam is edited later.
+SNAPSHOT_COLUMNS = [
+    'question_id', 'question_text', 'choice_id', 'choice_text',
+    'correct_choice_id', 'correct_choice_text', 'is_correct', 'time_spent',
+]
+
+
+def get_user_answers(exam, user):
+    # Map of question id to (chosen choice id, time spent) for every answer of the user
+    return {
+        question_id: (choice_id, time_spent)
+        for question_id, choice_id, time_spent in UserAnswer.objects.filter(user=user, question__exam_id=exam.id)
+        .order_by('-id')
+        .values_list('question_id', 'choice_id', 'time_spent')
+    }
+
+
+def _answered_question_ids_query(manifest, user):
+    return UserAnswer.objects.filter(user=user, question__exam_id=manifest.exam_id).exclude(choice__isnull=True).values_list('question_id', flat=True)
+
+
+def _with_pending_answers(manifest, user, answered_question_ids):
+    # Autosaves that are still buffered take precedence over the database
+    for question_id, choice_id in pending_answers_for(user.id).items():
+        if choice_id is None:
+            answered_question_ids.discard(question_id)
+        else:
+            answered_question_ids.add(question_id)
+    return answered_question_ids & set(manifest.question_ids)
+
+
+def get_answered_question_ids(manifest, user):
+    answered_question_ids = set(_answered_question_ids_query(manifest, user))
+    return _with_pending_answers(manifest, user, answered_question_ids)
+
+
+async def aget_answered_question_ids(manifest, user):
+    answered_question_ids = {question_id async for question_id in _answered_question_ids_query(manifest, user)}
+    return _with_pending_answers(manifest, user, answered_question_ids)
+
+
+def grade_exam(exam, user):
+    # The answer key comes from the cached exam manifest, so grading only
+    # needs the user's answers: one query no matter how long the exam is.
+    manifest = get_exam_manifest(exam.id)
+    user_answers = get_user_answers(exam, user)
+
+    total_questions = len(manifest)
+    answered = 0
+    score = 0
+    rows = []
+    for question in manifest.questions:
+        choice_id, time_spent = user_answers.get(question['id'], (None, datetime.timedelta()))
+        is_correct = choice_id in manifest.correct_choice_ids
+        if choice_id is not None:
+            answered += 1
+            score += is_correct
+        choice = manifest.choice(choice_id)
+        correct_choice = question['correct_answer']
+        rows.append([
+            question['id'], question['question_text'],
+            choice_id, choice and choice['choice_text'],
+            correct_choice and correct_choice['id'], correct_choice and correct_choice['choice_text'],
+            int(is_correct), round(time_spent.total_seconds()),
+        ])
+    percentage = round((score / total_questions) * 100, 2) if total_questions else 0
+
+    return {
+        'score': score,
+        'total_questions': total_questions,
+        'percentage': percentage,
+        'unanswered_questions': total_questions - answered,
+        'incorrect_answers': answered - score,
+        'snapshot': {'questions': rows},
+    }
+
+
+def get_result_sheet(exam_result):
+    # The graded paper of a result, rendered from its snapshot and the cached manifest
+    snapshot = exam_result.snapshot
+    if snapshot is None:
+        # Results graded before snapshots existed are snapshotted on first view
+        snapshot = grade_exam(exam_result.exam, exam_result.user)['snapshot']
+        ExamResult.objects.filter(pk=exam_result.pk).update(snapshot=snapshot)
+        exam_result.snapshot = snapshot
+
+    # Explanations are not part of the grade, so they follow the current exam
+    manifest = get_exam_manifest(exam_result.exam_id)
+    sheet = []
+    for question_id, question_text, choice_id, choice_text, correct_choice_id, correct_choice_text, is_correct, time_spent in snapshot['questions']:
+        question = manifest.question(question_id) or {}
+        sheet.append({
+            'question_id': question_id,
+            'question_text': question_text,
+            'explanation_text': question.get('explanation_text'),
+            'explanation_image_url': question.get('explanation_image_url'),
+            'explanation_video': question.get('explanation_video'),
+            'choice_id': choice_id,
+            'choice_text': choice_text,
+            'correct_choice_id': correct_choice_id,
+            'correct_choice_text': correct_choice_text,
+            'is_correct': bool(is_correct),
+            'time_spent': datetime.timedelta(seconds=time_spent),
+        })
+    return sheet
+
+
+def submit_exam(exam, user, attempt):
+    # Buffered autosaves must be written before grading
+    if write_behind_enabled():
+        answer_buffer.flush(user.id)
+
+    with transaction.atomic():
+        # A second submit (e.g. from another tab) returns the first result
+        exam_result = ExamResult.objects.select_for_update().filter(user=user, exam=exam).first()
+        if exam_result:
+            return exam_result
+
+        # Score, incorrect and unanswered counts are graded against the manifest answer key
+        grade = grade_exam(exam, user)
+        end_time = timezone.now()
+        exam_result = ExamResult.objects.create(
+            exam=exam,
+            user=user,
+            **grade,
+            answered_at=end_time,
+            start_time=attempt.started_at,
+            end_time=end_time,
+            submitted=True,
+            time_up=attempt.remaining_seconds(end_time) == 0,
+        )
+        record_result(exam_result)
+        if analytics.in_background():
+            analytics.schedule_item_analysis(exam.id)
+        return exam_result
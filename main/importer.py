@@ -0,0 +1,261 @@
+# Bulk import of question banks from CSV, JSON or YAML files
+
+import csv
+import io
+import json
+import os
+import re
+import yaml
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import connection, transaction
+from main.models import Choice, Question
+from main.manifest import bump_manifest_version
+from main.search import index_objects
+
+FORMATS = ['csv', 'json', 'jsonl', 'yaml']
+EXTENSIONS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.yaml': 'yaml', '.yml': 'yaml'}
+
+# Rows validated and written per transaction
+BATCH_SIZE = 500
+
+_JSON_READ_SIZE = 64 * 1024
+
+
+class UnreadableRow:
+    # Yielded in place of a row that could not be parsed, when the rest of the file still can
+    def __init__(self, error):
+        self.error = error
+
+
+def detect_format(filename):
+    return EXTENSIONS.get(os.path.splitext(filename or '')[1].lower())
+
+
+def read_rows(stream, format):
+    """Yield question dicts from a text stream, one at a time.
+
+    CSV files have question_text, explanation_text and explanation_video
+    columns, choice_1, choice_2, ... columns and a correct column with the
+    numbers of the correct choices, e.g. "1" or "2,3". JSON files hold an
+    array or a sequence of objects, JSON Lines files one object per line and
+    YAML files a list or one document per question. Their objects have a
+    choices list of {text, is_correct}. A JSON Lines line that does not
+    decode is yielded as an UnreadableRow and the lines after it are still read.
+    """
+    if format == 'csv':
+        return _csv_rows(stream)
+    if format == 'json':
+        return _json_rows(stream)
+    if format == 'jsonl':
+        return _jsonl_rows(stream)
+    if format == 'yaml':
+        return _yaml_rows(stream)
+    raise ValueError(f'Unknown question bank format: {format}')
+
+
+def _csv_rows(stream):
+    for record in csv.DictReader(stream):
+        numbers = sorted(int(key.split('_', 1)[1]) for key in record if key and re.fullmatch(r'choice_\d+', key))
+        correct = set(re.findall(r'\d+', record.get('correct') or ''))
+        yield {
+            'question_text': record.get('question_text'),
+            'explanation_text': record.get('explanation_text'),
+            'explanation_video': record.get('explanation_video'),
+            'choices': [
+                {'text': record[f'choice_{number}'], 'is_correct': str(number) in correct}
+                for number in numbers if (record[f'choice_{number}'] or '').strip()
+            ],
+        }
+
+
+def _json_rows(stream):
+    # Decodes one object at a time, so the whole file is never held in memory
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,[')
+        if buffer.startswith(']'):
+            buffer = buffer[1:]
+            continue
+        if buffer:
+            try:
+                row, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A number or literal may continue in the next chunk
+                if end < len(buffer) or eof or isinstance(row, dict):
+                    buffer = buffer[end:]
+                    yield row
+                    continue
+        elif eof:
+            return
+        chunk = stream.read(_JSON_READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+
+
+def _jsonl_rows(stream):
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as exc:
+            yield UnreadableRow(f'Could not parse the line: {exc}')
+
+
+def _yaml_rows(stream):
+    # Built from the parser's events one question at a time, the items of a
+    # top-level list as well as separate documents, so a large list is never
+    # loaded in one go
+    loader = yaml.SafeLoader(stream)
+    try:
+        loader.get_event()  # Stream start
+        while not loader.check_event(yaml.StreamEndEvent):
+            loader.get_event()  # Document start
+            if loader.check_event(yaml.SequenceStartEvent):
+                loader.get_event()
+                while not loader.check_event(yaml.SequenceEndEvent):
+                    yield loader.construct_document(loader.compose_node(None, None))
+                loader.get_event()
+            else:
+                document = loader.construct_document(loader.compose_node(None, None))
+                if document is not None:
+                    yield document
+            loader.get_event()  # Document end
+            loader.anchors = {}
+    finally:
+        loader.dispose()
+
+
+def _is_true(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y', 'x')
+    return bool(value)
+
+
+def clean_row(row):
+    """Return (question, choices, errors) for one parsed row."""
+    if isinstance(row, UnreadableRow):
+        return None, [], [row.error]
+    if not isinstance(row, dict):
+        return None, [], ['Expected an object with question_text and choices.']
+    errors = []
+    question_text = str(row.get('question_text') or '').strip()
+    if not question_text:
+        errors.append('question_text is required.')
+    explanation_video = str(row.get('explanation_video') or '').strip()
+    if explanation_video:
+        try:
+            URLValidator()(explanation_video)
+        except ValidationError:
+            errors.append(f'explanation_video is not a valid URL: {explanation_video}')
+
+    choices = []
+    raw_choices = row.get('choices') or []
+    if not isinstance(raw_choices, list):
+        raw_choices = []
+        errors.append('choices must be a list.')
+    for number, choice in enumerate(raw_choices, 1):
+        if isinstance(choice, str):
+            choice = {'text': choice}
+        text = str((choice.get('text') or choice.get('choice_text') or '') if isinstance(choice, dict) else '').strip()
+        if not text:
+            errors.append(f'Choice {number} has no text.')
+            continue
+        choices.append(Choice(choice_text=text, is_correct=_is_true(choice.get('is_correct'))))
+    if len(choices) < 2:
+        errors.append('A question needs at least two choices.')
+    if not any(choice.is_correct for choice in choices):
+        errors.append('At least one choice must be marked as correct.')
+
+    question = Question(
+        question_text=question_text,
+        explanation_text=str(row.get('explanation_text') or '').strip() or None,
+        explanation_video=explanation_video or None,
+    )
+    return question, choices, errors
+
+
+def import_questions(exam, stream, format, batch_size=BATCH_SIZE, on_batch=None):
+    """Import a question bank into exam, reporting bad rows instead of stopping.
+
+    Rows are validated and written batch_size at a time, each batch in its
+    own transaction, so a failure late in a large file keeps earlier batches.
+    Questions whose text is already in the exam, or earlier in the file, are
+    reported as duplicates, which makes re-running an interrupted import safe.
+    on_batch is called with the running report after every batch.
+    """
+    report = {'rows': 0, 'created': 0, 'errors': []}
+    seen = set()
+    batch = []
+    try:
+        for row in read_rows(stream, format):
+            report['rows'] += 1
+            batch.append((report['rows'], row))
+            if len(batch) == batch_size:
+                _import_batch(exam, batch, seen, report)
+                batch = []
+                if on_batch:
+                    on_batch(report)
+    except (csv.Error, json.JSONDecodeError, yaml.YAMLError, UnicodeDecodeError) as exc:
+        # The rest of the file cannot be read; what was parsed so far is still imported
+        report['errors'].append({'row': report['rows'] + 1, 'errors': [f'Could not parse the file: {exc}']})
+    if batch:
+        _import_batch(exam, batch, seen, report)
+        if on_batch:
+            on_batch(report)
+    report['errors'].sort(key=lambda error: error['row'])
+    return report
+
+
+def _import_batch(exam, batch, seen, report):
+    cleaned = []
+    for number, row in batch:
+        question, choices, errors = clean_row(row)
+        if errors:
+            report['errors'].append({'row': number, 'errors': errors})
+        else:
+            cleaned.append((number, question, choices))
+
+    # One query checks the whole batch against the questions already in the exam
+    existing = set(
+        Question.objects.filter(exam=exam, question_text__in=[question.question_text for number, question, choices in cleaned])
+        .values_list('question_text', flat=True)
+    )
+    valid = []
+    for number, question, choices in cleaned:
+        if question.question_text in existing or question.question_text in seen:
+            report['errors'].append({'row': number, 'errors': ['The exam already has this question.']})
+            continue
+        seen.add(question.question_text)
+        question.exam = exam
+        valid.append((question, choices))
+    if not valid:
+        return
+
+    questions = [question for question, choices in valid]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            Question.objects.bulk_create(questions)
+        else:
+            # Without RETURNING the new ids are only known by saving one at a time
+            for question in questions:
+                question.save()
+        for question, choices in valid:
+            for choice in choices:
+                choice.question = question
+        Choice.objects.bulk_create([choice for question, choices in valid for choice in choices])
+        # bulk_create skips the signals that keep the search index in sync
+        index_objects(questions)
+    bump_manifest_version(exam.id)
+    report['created'] += len(questions)
+
+
+def open_upload(upload):
+    # Uploaded files are bytes; Excel writes a BOM in front of UTF-8 CSV files
+    return io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from django.contrib.auth.decorators import login_required
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.urls import include, path
+from main import async_views, urls, views
+from main.seeding import seed_dataset
+
+# Routes that have both a sync and a native async implementation
+VARIANTS = {
+    'sync': {
+        'answer_exam': login_required(views.answer_exam),
+        'save_answer': login_required(views.save_answer),
+        'remove_unanswered_question': login_required(views.remove_unanswered_question),
+    },
+    'async': {
+        'answer_exam': async_views.answer_exam,
+        'save_answer': async_views.save_answer,
+        'remove_unanswered_question': async_views.remove_unanswered_question,
+    },
+}
+
+
+class VariantURLConf:
+    # The project URLs with the student hot path swapped for one variant
+    def __init__(self, variant):
+        patterns = []
+        for pattern in urls.urlpatterns:
+            view = VARIANTS[variant].get(getattr(pattern, 'name', None))
+            patterns.append(path(str(pattern.pattern), view, name=pattern.name) if view else pattern)
+        self.urlpatterns = [path('', include(patterns))]
+
+
+def percentile(latencies, percent):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Compare requests per second and tail latency of the sync and async student views under concurrent ASGI load.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50)
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and variant.')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so real data is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        exam, students = self.seed(options)
+        questions = list(exam.questions.order_by('id').prefetch_related('choices'))
+        rng = random.Random(options['seed'])
+
+        report = {'students': len(students), 'questions': len(questions), 'concurrency': options['concurrency']}
+        for variant in VARIANTS:
+            clients = []
+            for student in students:
+                client = AsyncClient()
+                client.force_login(student)
+                clients.append(client)
+
+            def answer_exam_page(client):
+                return client.get(f'/answer-exam/{exam.id}/{rng.randint(1, len(questions))}/')
+
+            def save_answer(client):
+                question = rng.choice(questions)
+                choice = rng.choice(question.choices.all())
+                return client.post('/save-answer/', {'exam_id': exam.id, 'question_id': question.id, 'choice_id': choice.id})
+
+            def remove_unanswered_question(client):
+                return client.post('/remove-unanswered-question/', {'question_id': rng.choice(questions).id})
+
+            with override_settings(ROOT_URLCONF=VariantURLConf(variant)):
+                report[variant] = {
+                    'answer_exam': asyncio.run(self.load(clients, answer_exam_page, options)),
+                    'save_answer': asyncio.run(self.load(clients, save_answer, options)),
+                    'remove_unanswered_question': asyncio.run(self.load(clients, remove_unanswered_question, options)),
+                }
+        return report
+
+    def seed(self, options):
+        # Every student has an open attempt, which remove_unanswered_question needs
+        dataset = seed_dataset(
+            teachers=1, courses=1, exams=1, questions=options['questions'], students=options['students'],
+            started=1, submitted=0, prefix='bench', seed=options['seed'],
+        )
+        return dataset['exams'][0], dataset['students']
+
+    async def load(self, clients, make_request, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies = []
+        errors = 0
+
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await make_request(clients[i % len(clients)])
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(options['requests'])))
+        elapsed = time.perf_counter() - started
+        return {
+            'requests': options['requests'],
+            'errors': errors,
+            'requests_per_second': round(options['requests'] / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
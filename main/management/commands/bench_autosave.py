@@ -0,0 +1,104 @@
+import json
+import random
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from main.autosave import answer_buffer
+from main.models import UserAnswer
+from main.seeding import seed_dataset
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+class Command(BaseCommand):
+    help = 'Compare DB writes per student-minute of save_answer with write-behind autosave on and off.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=50)
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--clicks-per-minute', type=int, default=30)
+        parser.add_argument('--seconds-per-question', type=int, default=15)
+        parser.add_argument('--flush-interval', type=int, default=getattr(settings, 'AUTOSAVE_FLUSH_INTERVAL', 2))
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so real data is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        exam, students = self.seed(options)
+        clicks = self.plan_clicks(exam, students, options)
+
+        report = {'students': len(students), 'questions': options['questions'], 'clicks': len(clicks)}
+        for write_behind in (False, True):
+            UserAnswer.objects.all().delete()
+            writes, queries = self.replay(exam, students, clicks, write_behind, options['flush_interval'])
+            self.check_final_answers(clicks)
+            report['write_behind' if write_behind else 'direct'] = {
+                'db_writes': writes,
+                'db_queries': queries,
+                'db_writes_per_student_minute': round(writes / len(students), 2),
+            }
+        return report
+
+    def seed(self, options):
+        # No attempts or answers yet; the replay writes every answer
+        dataset = seed_dataset(
+            teachers=1, courses=1, exams=1, questions=options['questions'], students=options['students'],
+            started=0, submitted=0, prefix='bench', seed=options['seed'],
+        )
+        return dataset['exams'][0], dataset['students']
+
+    def plan_clicks(self, exam, students, options):
+        # One simulated minute: each student clicks at a steady rate and moves
+        # to the next question every seconds_per_question seconds.
+        rng = random.Random(options['seed'])
+        questions = list(exam.questions.order_by('id').prefetch_related('choices'))
+        interval = 60 / options['clicks_per_minute']
+        clicks = []
+        for student in students:
+            for i in range(options['clicks_per_minute']):
+                second = i * interval
+                question = questions[int(second // options['seconds_per_question']) % len(questions)]
+                choice = rng.choice(question.choices.all())
+                clicks.append((second, student, question.id, choice.id))
+        clicks.sort(key=lambda click: click[0])
+        return clicks
+
+    def replay(self, exam, students, clicks, write_behind, flush_interval):
+        clients = {}
+        for student in students:
+            clients[student.id] = Client()
+            clients[student.id].force_login(student)
+
+        url = reverse('save_answer')
+        flush_interval = max(1, flush_interval)
+        answer_buffer.flush_interval = None
+        next_flush = flush_interval
+        with override_settings(AUTOSAVE_WRITE_BEHIND=write_behind), CaptureQueriesContext(connection) as context:
+            for second, student, question_id, choice_id in clicks:
+                if write_behind and second >= next_flush:
+                    answer_buffer.flush()
+                    next_flush += flush_interval
+                clients[student.id].post(url, {'exam_id': exam.id, 'question_id': question_id, 'choice_id': choice_id})
+            # Submitting flushes whatever is left
+            answer_buffer.flush()
+
+        writes = sum(1 for query in context.captured_queries if query['sql'].lstrip().upper().startswith(WRITE_STATEMENTS))
+        return writes, len(context.captured_queries)
+
+    def check_final_answers(self, clicks):
+        expected = {}
+        for second, student, question_id, choice_id in clicks:
+            expected[(student.id, question_id)] = choice_id
+        saved = {(user_id, question_id): choice_id for user_id, question_id, choice_id in UserAnswer.objects.values_list('user_id', 'question_id', 'choice_id')}
+        if saved != expected:
+            raise AssertionError('Saved answers do not match the last click of every student')
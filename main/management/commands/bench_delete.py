@@ -0,0 +1,82 @@
+import datetime
+import json
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.db import connection
+from main.models import AnswerInterval, Course, UserAnswer
+from main.purge import purge
+from main.seeding import add_dataset_arguments, dataset_options, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed two identical courses and delete one with Django's collector (Course.delete) and the other "
+        'with main.purge, reporting time, queries and peak Python memory of each as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser, teachers=1, courses=1, exams=5, questions=50, students=500)
+        parser.add_argument('--intervals', type=int, default=2, help='Answer intervals per answer.')
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so real data is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        options = {**options, 'teachers': 1}
+        courses = {}
+        for name in ('collector', 'purge'):
+            dataset = seed_dataset(prefix=f'bench-{name}', **dataset_options(options))
+            courses[name] = dataset['exams'][0].course
+            self.add_intervals(dataset['exams'], options['intervals'])
+        return {
+            'database': connection.vendor,
+            'rows': self.count_rows(courses['purge']),
+            'collector': self.measure(lambda: Course.all_objects.get(pk=courses['collector'].pk).delete()),
+            'purge': self.measure(lambda: purge('course', courses['purge'].pk)),
+        }
+
+    def add_intervals(self, exams, per_answer):
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        answer_ids = UserAnswer.objects.filter(question__exam__in=exams).values_list('pk', flat=True)
+        AnswerInterval.objects.bulk_create(
+            [
+                AnswerInterval(
+                    useranswer_id=answer_id,
+                    start_time=start + datetime.timedelta(minutes=i),
+                    end_time=start + datetime.timedelta(minutes=i, seconds=30),
+                )
+                for answer_id in answer_ids.iterator() for i in range(per_answer)
+            ],
+            batch_size=2000,
+        )
+
+    def count_rows(self, course):
+        return {
+            'exams': course.exams.count(),
+            'questions': course.exams.values('questions').count(),
+            'answers': UserAnswer.objects.filter(question__exam__course=course).count(),
+            'answer_intervals': AnswerInterval.objects.filter(useranswer__question__exam__course=course).count(),
+        }
+
+    def measure(self, delete):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            delete()
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'seconds': round(seconds, 3), 'queries': len(queries), 'peak_memory_mb': round(peak / 2 ** 20, 1)}
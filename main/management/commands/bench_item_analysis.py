@@ -0,0 +1,91 @@
+import json
+import random
+import time
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from main.analytics import answer_matrix, get_item_analysis, item_statistics
+from main.manifest import get_exam_manifest
+from main.models import Course, Exam, Choice, Question, UserAnswer, ExamResult
+
+
+class Command(BaseCommand):
+    help = 'Time loading the answer matrix and computing the item analysis of one large exam.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=10000)
+        parser.add_argument('--questions', type=int, default=200)
+        parser.add_argument('--choices', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so real data is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        started = time.perf_counter()
+        exam = self.seed(options, random.Random(options['seed']))
+        seeded = time.perf_counter()
+        cache.clear()
+        manifest = get_exam_manifest(exam.id)
+
+        timings = {}
+        started_step = time.perf_counter()
+        students, matrix = answer_matrix(exam.id, manifest)
+        timings['load_ms'] = round((time.perf_counter() - started_step) * 1000, 1)
+        started_step = time.perf_counter()
+        analysis = item_statistics(manifest, matrix)
+        timings['compute_ms'] = round((time.perf_counter() - started_step) * 1000, 1)
+        get_item_analysis(exam.id, manifest)
+        started_step = time.perf_counter()
+        get_item_analysis(exam.id, manifest)
+        timings['cached_ms'] = round((time.perf_counter() - started_step) * 1000, 1)
+        return {
+            'students': len(students),
+            'questions': len(manifest),
+            'seed_seconds': round(seeded - started, 1),
+            **timings,
+            'kr20': analysis['kr20'],
+        }
+
+    def seed(self, options, rng):
+        teacher = User.objects.create_user('bench-teacher', password='bench')
+        course = Course.objects.create(name='Bench', description='Bench', teacher=teacher)
+        exam = Exam.objects.create(name='Bench', description='Bench', course=course)
+        Question.objects.bulk_create([Question(exam=exam, question_text=f'Question {i}') for i in range(options['questions'])])
+        questions = list(exam.questions.order_by('pk').values_list('pk', flat=True))
+        Choice.objects.bulk_create([
+            Choice(question_id=question_id, choice_text=f'Choice {j}', is_correct=j == 0)
+            for question_id in questions for j in range(options['choices'])
+        ])
+        choices = {}
+        for question_id, choice_id, is_correct in Choice.objects.order_by('pk').values_list('question_id', 'pk', 'is_correct'):
+            choices.setdefault(question_id, []).append((choice_id, is_correct))
+        # Harder questions and stronger students, so the statistics are not all noise
+        difficulty = {question_id: rng.uniform(0.3, 0.9) for question_id in questions}
+
+        User.objects.bulk_create([User(username=f'bench-student-{i}') for i in range(options['students'])], batch_size=2000)
+        students = list(User.objects.filter(username__startswith='bench-student-').values_list('pk', flat=True))
+        for start in range(0, len(students), 200):
+            answers = []
+            results = []
+            for student_id in students[start:start + 200]:
+                ability = rng.uniform(-0.2, 0.2)
+                score = 0
+                for question_id in questions:
+                    if rng.random() < 0.05:
+                        continue
+                    correct = rng.random() < difficulty[question_id] + ability
+                    choice_id = choices[question_id][0][0] if correct else rng.choice(choices[question_id][1:])[0]
+                    answers.append(UserAnswer(user_id=student_id, question_id=question_id, choice_id=choice_id))
+                    score += correct
+                results.append(ExamResult(exam=exam, user_id=student_id, score=score, total_questions=len(questions)))
+            UserAnswer.objects.bulk_create(answers, batch_size=5000)
+            ExamResult.objects.bulk_create(results)
+        return exam
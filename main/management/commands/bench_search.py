@@ -0,0 +1,103 @@
+import itertools
+import json
+import random
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from main.models import Course, Exam, Question
+from main.search import SEARCH_FIELDS, get_search_backend, search
+
+SYLLABLES = 'ba be bi bo bu ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu'.split()
+
+
+def vocabulary(rng, size):
+    # Made-up words whose frequencies follow Zipf's law, like real question text
+    words = sorted({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for i in range(size * 2)})[:size]
+    rng.shuffle(words)
+    return words, list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+
+class Command(BaseCommand):
+    help = 'Compare LIKE scans with the full-text index on a seeded corpus of questions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=100000)
+        parser.add_argument('--questions-per-exam', type=int, default=200)
+        parser.add_argument('--vocabulary', type=int, default=20000, help='Distinct words in the corpus.')
+        parser.add_argument('--searches', type=int, default=50, help='Searches per scope and variant.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so real data is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        words, cum_weights = vocabulary(rng, options['vocabulary'])
+        started = time.perf_counter()
+        exam_ids = self.seed(options, rng, words, cum_weights)
+        seeded = time.perf_counter()
+        backend = get_search_backend()
+        for model in SEARCH_FIELDS:
+            backend.rebuild(model)
+        indexed = time.perf_counter()
+
+        report = {
+            'backend': type(backend).__name__,
+            'questions': Question.objects.count(),
+            'seed_seconds': round(seeded - started, 1),
+            'index_seconds': round(indexed - seeded, 1),
+        }
+        # Searches use words a teacher would type: common, but not stop words
+        terms = rng.choices(words[20:2000], k=options['searches'])
+        scopes = {
+            # question_list: the questions of one exam
+            'exam': lambda: Question.objects.filter(exam_id=rng.choice(exam_ids)),
+            # every question in the system
+            'all': lambda: Question.objects.all(),
+        }
+        for scope, make_queryset in scopes.items():
+            report[scope] = {
+                'like': self.time(terms, lambda term: make_queryset().filter(question_text__icontains=term)),
+                'index': self.time(terms, lambda term: search(make_queryset(), term)),
+            }
+        return report
+
+    def seed(self, options, rng, words, cum_weights):
+        teacher = User.objects.create_user('bench-teacher', password='bench')
+        course = Course.objects.create(name='Bench', description='Bench', teacher=teacher)
+        exam_ids = []
+        remaining = options['questions']
+        while remaining > 0:
+            exam = Exam.objects.create(name=f'Exam {len(exam_ids)}', description='Bench', course=course)
+            exam_ids.append(exam.id)
+            count = min(remaining, options['questions_per_exam'])
+            Question.objects.bulk_create(
+                [Question(exam=exam, question_text=' '.join(rng.choices(words, cum_weights=cum_weights, k=12))) for i in range(count)],
+                batch_size=2000,
+            )
+            remaining -= count
+        return exam_ids
+
+    def time(self, terms, make_queryset):
+        latencies = []
+        rows = 0
+        for term in terms:
+            started = time.perf_counter()
+            # A results page: the count and the first 10 rows
+            queryset = make_queryset(term)
+            rows += queryset.count()
+            list(queryset[:10])
+            latencies.append(time.perf_counter() - started)
+        return {
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+            'mean_rows': round(rows / len(terms), 1),
+        }
@@ -0,0 +1,152 @@
+import json
+import random
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from main.models import ExamAttempt
+from main.seeding import add_dataset_arguments, dataset_options, seed_dataset
+from main.timing import percentile
+
+PASSWORD = 'bench'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic dataset and drive the teacher pages, the answer_exam flow and the results views '
+        'through the test client, reporting latency percentiles and query counts per view as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--rounds', type=int, default=3, help='Times each teacher page is requested.')
+        parser.add_argument('--flows', type=int, default=20, help='Exams taken start to submit by students.')
+        parser.add_argument('--output', help='Also write the report to this file.')
+        parser.add_argument('--baseline', help='Report of an earlier run to compare against.')
+
+    def handle(self, *args, **options):
+        # Run against a throwaway test database so real data is never touched
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                report['change'] = self.compare(json.load(baseline), report)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(output)
+        self.stdout.write(output)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        dataset = seed_dataset(prefix='bench', password=PASSWORD, **dataset_options(options))
+        seed_seconds = time.perf_counter() - started
+
+        self.samples = {}
+        for i in range(options['rounds']):
+            for teacher in dataset['teachers']:
+                self.teacher_pages(teacher, dataset)
+        for student, exam in self.untaken_exams(rng, dataset, options['flows']):
+            self.take_exam(rng, student, exam)
+
+        return {
+            'database': connection.vendor,
+            'settings': {
+                'async_student_views': getattr(settings, 'ASYNC_STUDENT_VIEWS', False),
+                'autosave_write_behind': getattr(settings, 'AUTOSAVE_WRITE_BEHIND', False),
+            },
+            'dataset': dataset_options(options),
+            'seed_seconds': round(seed_seconds, 1),
+            'views': {name: self.summarize(samples) for name, samples in sorted(self.samples.items())},
+        }
+
+    def client(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def request(self, client, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data or {})
+            elapsed = time.perf_counter() - started
+        name = response.resolver_match.url_name if response.resolver_match else path
+        self.samples.setdefault(name, []).append((elapsed, len(queries), response.status_code >= 400))
+        return response
+
+    def teacher_pages(self, teacher, dataset):
+        client = self.client(teacher)
+        self.request(client, 'get', reverse('course_list'))
+        self.request(client, 'get', reverse('search_teacher_exam_list'))
+        self.request(client, 'get', reverse('search_teacher_exam_list'), {'search': 'Exam'})
+        exams = [exam for exam in dataset['exams'] if exam.course.teacher_id == teacher.pk]
+        for course_id in sorted({exam.course_id for exam in exams}):
+            self.request(client, 'get', reverse('teacher_exam_list', kwargs={'course_id': course_id}))
+        for exam in exams:
+            self.request(client, 'get', reverse('question_list', kwargs={'exam_id': exam.pk}))
+            self.request(client, 'get', reverse('exam_results', kwargs={'exam_id': exam.pk}))
+            self.request(client, 'get', reverse('exam_time_heatmap', kwargs={'exam_id': exam.pk}))
+        for exam_result in dataset['results']:
+            if exam_result.exam.course.teacher_id == teacher.pk:
+                self.request(client, 'get', reverse('teacher_view_exam_result', kwargs={'exam_result_id': exam_result.pk}))
+
+    def untaken_exams(self, rng, dataset, count):
+        started = set(ExamAttempt.objects.values_list('user_id', 'exam_id'))
+        pairs = [
+            (student, exam) for student in dataset['students'] for exam in dataset['exams']
+            if (student.pk, exam.pk) not in started
+        ]
+        return rng.sample(pairs, min(count, len(pairs)))
+
+    def take_exam(self, rng, student, exam):
+        client = self.client(student)
+        questions = list(exam.questions.order_by('pk').prefetch_related('choices'))
+        response = None
+        for number, question in enumerate(questions, 1):
+            url = reverse('answer_exam', kwargs={'exam_id': exam.pk, 'page_number': number})
+            self.request(client, 'get', url)
+            choice = rng.choice(question.choices.all())
+            # The page autosaves a click before the form is posted
+            self.request(client, 'post', reverse('save_answer'), {'exam_id': exam.pk, 'question_id': question.pk, 'choice_id': choice.pk})
+            action = 'next' if number < len(questions) else 'submit'
+            response = self.request(client, 'post', url, {f'question_{question.pk}': choice.pk, action: action, 'remaining_time': 600})
+        if response is None or response.status_code != 302:
+            return
+        # Submitting redirects to student_view_results
+        self.request(client, 'get', response.url)
+        exam_result_id = response.url.rstrip('/').rsplit('/', 1)[-1]
+        self.request(client, 'get', reverse('results', kwargs={'exam_result_id': exam_result_id}))
+
+    def summarize(self, samples):
+        latencies = sorted(elapsed * 1000 for elapsed, queries, error in samples)
+        queries = sorted(queries for elapsed, queries, error in samples)
+        return {
+            'requests': len(samples),
+            'errors': sum(error for elapsed, queries, error in samples),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2),
+            'queries_p50': percentile(queries, 50),
+            'queries_max': queries[-1],
+        }
+
+    def compare(self, baseline, report):
+        # Ratio of tail latency and difference in queries, per view both runs measured
+        change = {}
+        for name, current in report['views'].items():
+            previous = baseline.get('views', {}).get(name)
+            if not previous:
+                continue
+            change[name] = {
+                'p95_ratio': round(current['p95_ms'] / previous['p95_ms'], 2) if previous['p95_ms'] else None,
+                'queries_max_delta': current['queries_max'] - previous['queries_max'],
+            }
+        return change
@@ -0,0 +1,56 @@
+import datetime
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import AnswerInterval, UserAnswer
+
+
+class Command(BaseCommand):
+    help = 'Fold AnswerInterval rows into UserAnswer time_spent and visit counts, then delete them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of answers folded per transaction.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        answers = 0
+        intervals = 0
+        while True:
+            useranswer_ids = list(
+                AnswerInterval.objects.order_by('useranswer_id')
+                .values_list('useranswer_id', flat=True)
+                .distinct()[:batch_size]
+            )
+            if not useranswer_ids:
+                break
+            # Each batch is folded and deleted in one transaction, so rerunning
+            # the command after an interruption never counts an interval twice.
+            with transaction.atomic():
+                intervals += self.fold(useranswer_ids)
+            answers += len(useranswer_ids)
+            self.stdout.write(f'Compacted {answers} answers ({intervals} intervals)')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {intervals} intervals folded into {answers} answers.'))
+
+    def fold(self, useranswer_ids):
+        totals = {}
+        for useranswer_id, start_time, end_time in AnswerInterval.objects.filter(useranswer_id__in=useranswer_ids).values_list('useranswer_id', 'start_time', 'end_time'):
+            total = totals.setdefault(useranswer_id, {'time_spent': datetime.timedelta(), 'visits': 0, 'first': None, 'last': None})
+            total['visits'] += 1
+            if start_time and end_time:
+                total['time_spent'] += max(end_time - start_time, datetime.timedelta())
+            if start_time:
+                total['first'] = min(total['first'] or start_time, start_time)
+                total['last'] = max(total['last'] or start_time, start_time)
+
+        user_answers = list(UserAnswer.objects.select_for_update().filter(pk__in=totals))
+        for user_answer in user_answers:
+            total = totals[user_answer.pk]
+            user_answer.time_spent += total['time_spent']
+            user_answer.visit_count += total['visits']
+            if total['first']:
+                user_answer.first_visited_at = min(filter(None, [user_answer.first_visited_at, total['first']]))
+                user_answer.last_visited_at = max(filter(None, [user_answer.last_visited_at, total['last']]))
+        UserAnswer.objects.bulk_update(user_answers, ['time_spent', 'visit_count', 'first_visited_at', 'last_visited_at'])
+
+        deleted, _ = AnswerInterval.objects.filter(useranswer_id__in=useranswer_ids).delete()
+        return deleted
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.cloning import clone_course_exams
+from main.models import Course
+
+
+class Command(BaseCommand):
+    help = "Copy every exam of a course, with its questions and choices, into another course or a new one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--to', type=int, dest='target_id', help='Existing course to copy the exams into.')
+        target.add_argument('--new-course', metavar='NAME', help='Create a course with this name for the same teacher.')
+
+    def handle(self, *args, **options):
+        source = self.get_course(options['course_id'])
+        if options['target_id'] is not None:
+            target = self.get_course(options['target_id'])
+        else:
+            target = Course.objects.create(name=options['new_course'], description=source.description, teacher=source.teacher)
+        for copy in clone_course_exams(source, target):
+            self.stdout.write(f'Copied {copy.name} ({copy.questions.count()} questions)')
+        self.stdout.write(self.style.SUCCESS(f'Done: exams of {source.name} copied into {target.name} (course {target.pk}).'))
+
+    def get_course(self, course_id):
+        try:
+            return Course.objects.get(pk=course_id)
+        except Course.DoesNotExist:
+            raise CommandError(f'Course {course_id} does not exist.')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.importer import BATCH_SIZE, FORMATS, detect_format, import_questions
+from main.models import Exam
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV, JSON or YAML question bank into an exam.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows validated and written per transaction.')
+
+    def handle(self, *args, **options):
+        try:
+            exam = Exam.objects.get(pk=options['exam_id'])
+        except Exam.DoesNotExist:
+            raise CommandError(f"Exam {options['exam_id']} does not exist.")
+        format = options['format'] or detect_format(options['path'])
+        if format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format.')
+
+        def progress(report):
+            self.stdout.write(f"Read {report['rows']} rows, created {report['created']} questions")
+
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            report = import_questions(exam, stream, format, batch_size=options['batch_size'], on_batch=progress)
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {' '.join(error['errors'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {report['created']} of {report['rows']} questions imported into {exam.name}, "
+            f"{len(report['errors'])} rows with errors."
+        ))
@@ -0,0 +1,284 @@
+import http.cookiejar
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.urls import reverse
+from main.seeding import seed_dataset
+from main.timing import percentile
+
+PASSWORD = 'load'
+
+# Messages and MySQL error codes of statements that gave up waiting for a lock
+LOCK_MESSAGES = ('database is locked', 'database table is locked', 'lock wait timeout', 'deadlock')
+LOCK_ERROR_CODES = (1205, 1213)
+
+STATEMENT_TABLE = re.compile(r'^\s*(INSERT\s+INTO|UPDATE|DELETE\s+FROM|SELECT\b.*?\bFROM)\s+[`"]?(\w+)', re.IGNORECASE | re.DOTALL)
+
+
+def is_lock_error(exc):
+    if not isinstance(exc, DatabaseError):
+        return False
+    code = exc.args[0] if exc.args and isinstance(exc.args[0], int) else None
+    return code in LOCK_ERROR_CODES or any(message in str(exc).lower() for message in LOCK_MESSAGES)
+
+
+def statement_key(sql):
+    # 'UPDATE main_useranswer', 'SELECT django_session', ...
+    match = STATEMENT_TABLE.match(sql)
+    if not match:
+        return sql.split(None, 1)[0].upper()
+    return f'{match.group(1).split()[0].upper()} {match.group(2)}'
+
+
+def summarize(latencies, errors=0):
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'p50_ms': round(percentile(ordered, 50), 2) if ordered else None,
+        'p95_ms': round(percentile(ordered, 95), 2) if ordered else None,
+        'p99_ms': round(percentile(ordered, 99), 2) if ordered else None,
+        'max_ms': round(ordered[-1], 2) if ordered else None,
+    }
+
+
+class LoadStats:
+    """Latencies and outcomes shared by every simulated student."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = {}
+        self.outcomes = Counter()
+        self.statements = {}
+        self.statement_lock_errors = Counter()
+        self.completed = 0
+
+    def record_step(self, step, elapsed, outcome):
+        with self._lock:
+            latencies, errors = self.steps.setdefault(step, ([], Counter()))
+            latencies.append(elapsed * 1000)
+            if outcome != 'ok':
+                errors[outcome] += 1
+            self.outcomes[outcome] += 1
+
+    def record_completed(self):
+        with self._lock:
+            self.completed += 1
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with execute_wrapper on the connection of each worker thread
+        key = statement_key(sql)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except DatabaseError as exc:
+            if is_lock_error(exc):
+                with self._lock:
+                    self.statement_lock_errors[key] += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.statements.setdefault(key, []).append(elapsed)
+
+
+class InProcessSession:
+    # Requests go through the full middleware stack in this process; every
+    # worker thread gets its own database connection, as under a threaded server
+    def __init__(self, user):
+        self.client = Client()
+        self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        response = getattr(self.client, method)(path, data or {})
+        return response.status_code, response.get('Location')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPSession:
+    # Requests go to a running server, e.g. runserver or gunicorn on localhost
+    def __init__(self, base_url, user):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+        self.request('get', reverse('login_user'))
+        status, location = self.request('post', reverse('login_user'), {'username': user.username, 'password': PASSWORD})
+        if status != 302:
+            raise RuntimeError(f'Could not log in {user.username} (HTTP {status})')
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data or {}).encode() if method == 'post' else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method.upper())
+        csrf_token = next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), None)
+        if csrf_token:
+            request.add_header('X-CSRFToken', csrf_token)
+            request.add_header('Referer', self.base_url + '/')
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers.get('Location')
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate many students opening the same exam at once and taking it with think times, '
+        'reporting throughput, errors, tail latency per step and database lock contention as JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=500)
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument('--ramp', type=float, default=30, help='Seconds over which the students open the exam.')
+        parser.add_argument('--think', type=float, default=3, help='Mean seconds a student spends on a question.')
+        parser.add_argument('--url', help='Base URL of a running server on this database, e.g. http://127.0.0.1:8000. '
+                                          'Without it the app is driven in-process against a throwaway database.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Lock timeouts are counted in the report rather than logged one traceback at a time
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        if options['url']:
+            # The server must see the students, so they go into its database and are removed afterwards
+            prefix = f'load-{int(time.time())}'
+            try:
+                report = self.run(options, prefix)
+            finally:
+                User.objects.filter(username__startswith=f'{prefix}-').delete()
+        else:
+            report = self.run_in_test_database(options)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_in_test_database(self, options):
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if connection.vendor == 'sqlite':
+            # A file, not the shared in-memory database, so threads lock like in production
+            fd, test_settings['NAME'] = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            return self.run(options, 'load')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, options, prefix):
+        dataset = seed_dataset(
+            teachers=1, courses=1, exams=1, questions=options['questions'], students=options['students'],
+            started=0, prefix=prefix, password=PASSWORD, seed=options['seed'],
+        )
+        exam = dataset['exams'][0]
+        questions = [
+            (question.pk, [choice.pk for choice in question.choices.all()])
+            for question in exam.questions.order_by('pk').prefetch_related('choices')
+        ]
+        students = dataset['students']
+        stats = LoadStats()
+
+        # Logging in is not part of the storm, so every session is ready first
+        with ThreadPoolExecutor(max_workers=min(len(students), 32)) as pool:
+            sessions = list(pool.map(lambda student: self.session(options, student), students))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(students)) as pool:
+            for i, session in enumerate(sessions):
+                pool.submit(self.student, session, exam.pk, questions, stats, random.Random(options['seed'] + i), options)
+        elapsed = time.perf_counter() - started
+
+        requests = sum(stats.outcomes.values())
+        errors = requests - stats.outcomes['ok']
+        return {
+            'mode': 'http' if options['url'] else 'in-process',
+            'database': connection.vendor,
+            'students': len(students),
+            'questions': len(questions),
+            'ramp_seconds': options['ramp'],
+            'think_seconds': options['think'],
+            'duration_seconds': round(elapsed, 1),
+            'completed_students': stats.completed,
+            'requests': requests,
+            'throughput_rps': round(requests / elapsed, 1),
+            'errors': {
+                'total': errors,
+                'rate': round(errors / requests, 4) if requests else 0,
+                'by_kind': {kind: count for kind, count in stats.outcomes.items() if kind != 'ok'},
+            },
+            'steps': {step: summarize(latencies, sum(errors.values())) for step, (latencies, errors) in sorted(stats.steps.items())},
+            'lock_contention': {
+                'lock_errors': stats.outcomes['lock'],
+                # Lock errors no statement raised came from COMMIT
+                'lock_errors_at_commit': stats.outcomes['lock'] - sum(stats.statement_lock_errors.values()),
+                # Statements wait on locks before they fail, so slow writes show contention too.
+                # Only measured in-process; a server has to be watched from its own logs.
+                'statements': {
+                    key: summarize(latencies, stats.statement_lock_errors[key])
+                    for key, latencies in sorted(stats.statements.items(), key=lambda item: -max(item[1]))
+                },
+            },
+        }
+
+    def session(self, options, student):
+        try:
+            return HTTPSession(options['url'], student) if options['url'] else InProcessSession(student)
+        finally:
+            connection.close()
+
+    def student(self, session, exam_id, questions, stats, rng, options):
+        if not options['url']:
+            with connection.execute_wrapper(stats):
+                self.take_exam(session, exam_id, questions, stats, rng, options)
+            connection.close()
+        else:
+            self.take_exam(session, exam_id, questions, stats, rng, options)
+
+    def take_exam(self, session, exam_id, questions, stats, rng, options):
+        time.sleep(rng.uniform(0, options['ramp']))
+        location = None
+        for number, (question_id, choice_ids) in enumerate(questions, 1):
+            url = reverse('answer_exam', kwargs={'exam_id': exam_id, 'page_number': number})
+            if not self.step(session, stats, 'start' if number == 1 else 'navigate', 'get', url):
+                return
+            time.sleep(rng.expovariate(1 / options['think']) if options['think'] else 0)
+            choice_id = rng.choice(choice_ids)
+            data = {'exam_id': exam_id, 'question_id': question_id, 'choice_id': choice_id}
+            if not self.step(session, stats, 'save_answer', 'post', reverse('save_answer'), data):
+                return
+            action = 'next' if number < len(questions) else 'submit'
+            data = {f'question_{question_id}': choice_id, action: action, 'remaining_time': 600}
+            location = self.step(session, stats, 'answer' if action == 'next' else 'submit', 'post', url, data)
+            if not location:
+                return
+        # Submitting redirects to the student's results
+        if isinstance(location, str) and self.step(session, stats, 'results', 'get', location):
+            stats.record_completed()
+
+    def step(self, session, stats, name, method, path, data=None):
+        # Returns the redirect target, or True, of a successful request; None ends the student's run
+        started = time.perf_counter()
+        try:
+            status, location = session.request(method, path, data)
+        except Exception as exc:
+            stats.record_step(name, time.perf_counter() - started, 'lock' if is_lock_error(exc) else f'error:{type(exc).__name__}')
+            return None
+        stats.record_step(name, time.perf_counter() - started, 'ok' if status < 400 else f'http_{status}')
+        if status >= 400:
+            return None
+        return location or True
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from main.purge import purge_deleted
+
+
+class Command(BaseCommand):
+    help = 'Finish purging courses and exams that were deleted but are still in the database.'
+
+    def handle(self, *args, **options):
+        purged = purge_deleted()
+        for kind, object_id in purged:
+            self.stdout.write(f'Purged {kind} {object_id}')
+        self.stdout.write(self.style.SUCCESS(f'Done: {len(purged)} purged.'))
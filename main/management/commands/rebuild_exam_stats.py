@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import Exam
+from main.stats import rebuild_exam_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the running result statistics of exams from their results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_ids', nargs='*', type=int, help='Exams to rebuild; all exams by default.')
+
+    def handle(self, *args, **options):
+        exams = Exam.objects.order_by('pk')
+        if options['exam_ids']:
+            exams = exams.filter(pk__in=options['exam_ids'])
+        rebuilt = 0
+        for exam_id in exams.values_list('pk', flat=True).iterator():
+            # Locks out submits of the exam while its totals are replaced
+            with transaction.atomic():
+                rebuild_exam_stats(exam_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the statistics of {rebuilt} exams.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from main.search import SEARCH_FIELDS, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of courses, exams and questions.'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        for model in SEARCH_FIELDS:
+            backend.rebuild(model)
+            self.stdout.write(f'Indexed {model.objects.count()} {model._meta.verbose_name_plural}')
+        self.stdout.write(self.style.SUCCESS('Done.'))
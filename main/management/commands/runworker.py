@@ -0,0 +1,27 @@
+import signal
+from django.core.management.base import BaseCommand
+from main.tasks import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (deletes, and other work taken off the request path) on a pool of threads or processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Jobs run at the same time.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between looks at the queue when idle.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        worker = Worker(concurrency=options['concurrency'], pool=options['pool'], poll_interval=options['poll_interval'])
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the running jobs finish...')
+            worker.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+        pool = 'processes' if options['pool'] == 'process' else 'threads'
+        self.stdout.write(f"Worker {worker.name}: {options['concurrency']} {pool}")
+        ran = worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f'Done: {ran} jobs run.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from main.seeding import add_dataset_arguments, dataset_options, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Seed a synthetic dataset of teachers, courses, exams, questions and students with partially completed attempts.'
+
+    def add_arguments(self, parser):
+        add_dataset_arguments(parser)
+        parser.add_argument('--prefix', default='seed', help='Prefix of the seeded usernames.')
+        parser.add_argument('--password', default='password', help='Password of every seeded user.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users named {prefix}-* already exist; choose another --prefix.')
+        dataset = seed_dataset(prefix=prefix, password=options['password'], **dataset_options(options))
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(dataset['teachers'])} teachers, {len(dataset['exams'])} exams, "
+            f"{len(dataset['students'])} students and {len(dataset['results'])} submitted results."
+        ))
@@ -0,0 +1,153 @@
+import uuid
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+from django.db.models.signals import post_delete, post_save
+from main.models import Choice, Exam, Question
+
+# Manifests are immutable per version, so they can stay cached for a long time.
+# Editing an exam bumps the version and old entries simply expire.
+MANIFEST_TIMEOUT = 60 * 60 * 24
+
+
+def _version_key(exam_id):
+    return f'exam-manifest-version:{exam_id}'
+
+
+def _manifest_key(exam_id, version):
+    return f'exam-manifest:{exam_id}:{version}'
+
+
+def get_manifest_version(exam_id):
+    return cache.get_or_set(_version_key(exam_id), lambda: uuid.uuid4().hex, None)
+
+
+def exam_group_name(exam_id):
+    # Channel layer group of the open exam sockets of one exam
+    return f'exam_{exam_id}'
+
+
+def bump_manifest_version(exam_id):
+    # Called whenever the questions or choices of an exam change
+    cache.set(_version_key(exam_id), uuid.uuid4().hex, None)
+
+    # Tell open exam sockets to reload the current question
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        async_to_sync(channel_layer.group_send)(exam_group_name(exam_id), {'type': 'exam.changed'})
+
+
+def _changed_exam_id(sender, instance):
+    if sender is Exam:
+        return instance.pk
+    if sender is Question:
+        return instance.exam_id
+    # Choices: the question is usually cached by the form or query that loaded them
+    try:
+        return instance.question.exam_id
+    except Question.DoesNotExist:
+        return None
+
+
+def _bump_changed(sender, instance, **kwargs):
+    # Admin and other ORM edits save rows one by one, so bump once they are
+    # committed; bumping earlier would let a concurrent request cache the old
+    # questions under the new version
+    exam_id = _changed_exam_id(sender, instance)
+    if exam_id is not None:
+        transaction.on_commit(lambda: bump_manifest_version(exam_id))
+
+
+def connect_signals():
+    # bulk_create, bulk_update and update() send no signals; their callers bump themselves
+    for model in (Exam, Question, Choice):
+        post_save.connect(_bump_changed, sender=model, dispatch_uid=f'manifest-bump-{model.__name__}')
+        post_delete.connect(_bump_changed, sender=model, dispatch_uid=f'manifest-bump-deleted-{model.__name__}')
+
+
+class ExamManifest:
+    """Ordered questions, choices and answer keys of one exam version."""
+
+    def __init__(self, exam_id, version, questions):
+        self.exam_id = exam_id
+        self.version = version
+        self.questions = questions
+        self.question_ids = [question['id'] for question in questions]
+        self.correct_choice_ids = frozenset(
+            choice['id'] for question in questions for choice in question['choices'] if choice['is_correct']
+        )
+        self._positions = {question_id: i for i, question_id in enumerate(self.question_ids)}
+        self._choices = {choice['id']: choice for question in questions for choice in question['choices']}
+
+    def __len__(self):
+        return len(self.questions)
+
+    def question(self, question_id):
+        position = self._positions.get(question_id)
+        return None if position is None else self.questions[position]
+
+    def choice(self, choice_id):
+        return self._choices.get(choice_id)
+
+    def page_number(self, question_id):
+        # Exams show one question per page, so the page is the 1-based position
+        position = self._positions.get(question_id)
+        return None if position is None else position + 1
+
+    def has_choice(self, question_id, choice_id):
+        choice = self._choices.get(choice_id)
+        return choice is not None and choice['question_id'] == question_id
+
+
+def _manifest_questions(exam_id):
+    choices = Prefetch('choices', queryset=Choice.objects.order_by('id'))
+    return Question.objects.filter(exam_id=exam_id).order_by('id').prefetch_related(choices)
+
+
+def _question_entry(question):
+    question_choices = [
+        {
+            'id': choice.id,
+            'question_id': question.id,
+            'choice_text': choice.choice_text,
+            'is_correct': choice.is_correct,
+        }
+        for choice in question.choices.all()
+    ]
+    return {
+        'id': question.id,
+        'question_text': question.question_text,
+        'explanation_text': question.explanation_text,
+        'explanation_image_url': question.explanation_image.url if question.explanation_image else None,
+        'explanation_video': question.explanation_video,
+        'choices': question_choices,
+        'correct_answer': next((choice for choice in question_choices if choice['is_correct']), None),
+    }
+
+
+def build_exam_manifest(exam_id, version):
+    questions = [_question_entry(question) for question in _manifest_questions(exam_id)]
+    return ExamManifest(exam_id, version, questions)
+
+
+def get_exam_manifest(exam_id):
+    version = get_manifest_version(exam_id)
+    key = _manifest_key(exam_id, version)
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = build_exam_manifest(exam_id, version)
+        cache.set(key, manifest, MANIFEST_TIMEOUT)
+    return manifest
+
+
+async def aget_exam_manifest(exam_id):
+    version = await cache.aget_or_set(_version_key(exam_id), lambda: uuid.uuid4().hex, None)
+    key = _manifest_key(exam_id, version)
+    manifest = await cache.aget(key)
+    if manifest is None:
+        questions = [_question_entry(question) async for question in _manifest_questions(exam_id)]
+        manifest = ExamManifest(exam_id, version, questions)
+        await cache.aset(key, manifest, MANIFEST_TIMEOUT)
+    return manifest
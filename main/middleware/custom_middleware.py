@@ -2,6 +2,8 @@
 
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+from main.roles import resolve_user_role
 
 class RedirectUnauthenticatedMiddleware:
     def __init__(self, get_response):
@@ -34,4 +36,13 @@ class Redirect404Middleware:
         response = self.get_response(request)
         if response.status_code == 404:
             return redirect(reverse('home'))
-        return response
\ No newline at end of file
+        return response
+
+class UserRoleMiddleware:
+    # Exposes the Teacher/Student role as request.user_role, resolved on first use
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.user_role = SimpleLazyObject(lambda: resolve_user_role(request))
+        return self.get_response(request)
@@ -0,0 +1,177 @@
+# instrumentation.py
+#
+# Opt-in request instrumentation. Add
+# 'main.middleware.instrumentation.RequestInstrumentationMiddleware' at the top
+# of MIDDLEWARE to record, per URL name, wall time, query count, DB time and
+# queries repeated within one request. Totals are kept per process and served
+# to staff as JSON by the instrumentation_stats view.
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; the last bucket is open ended
+WALL_MS_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+DB_MS_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 1000]
+
+# Duplicate fingerprints kept per URL name
+TOP_DUPLICATES = 10
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_queries):
+    """Declare the most queries a view may run per request.
+
+    The budget covers the whole request, including session and user lookups.
+    It is checked by RequestInstrumentationMiddleware; with
+    QUERY_BUDGETS_RAISE set, going over raises QueryBudgetExceeded so tests fail.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def fingerprint(sql):
+    # Parameters are already separate from the SQL; IN lists of any length look the same
+    return re.sub(r'\((?:%s, )*%s\)', '(...)', sql)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def as_dict(self, requests):
+        labels = [f'<={bound}' for bound in self.buckets] + [f'>{self.buckets[-1]}']
+        return {
+            'mean': round(self.total / requests, 2) if requests else 0,
+            'max': round(self.max, 2),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.wall_ms = Histogram(WALL_MS_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_ms = Histogram(DB_MS_BUCKETS)
+        self.duplicates = Counter()
+        self.over_budget = 0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'wall_ms': self.wall_ms.as_dict(self.requests),
+            'queries': self.queries.as_dict(self.requests),
+            'db_ms': self.db_ms.as_dict(self.requests),
+            'over_budget': self.over_budget,
+            'duplicate_queries': [
+                {'sql': sql, 'repeats': repeats} for sql, repeats in self.duplicates.most_common(TOP_DUPLICATES)
+            ],
+        }
+
+
+class StatsRegistry:
+    """Per-process totals of every instrumented URL name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, name, sample):
+        with self._lock:
+            stats = self._views.setdefault(name, ViewStats())
+            stats.requests += 1
+            stats.wall_ms.add(sample['wall_ms'])
+            stats.queries.add(sample['queries'])
+            stats.db_ms.add(sample['db_ms'])
+            stats.duplicates.update(sample['duplicates'])
+            stats.over_budget += sample['over_budget']
+
+    def snapshot(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._views.items())}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+stats_registry = StatsRegistry()
+
+
+class QueryRecorder:
+    # Installed with connection.execute_wrapper for the duration of one request
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class RequestInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        match = request.resolver_match
+        name = (match.view_name if match else None) or '<unresolved>'
+        budget = getattr(match.func, 'query_budget', None) if match else None
+        over_budget = budget is not None and recorder.count > budget
+        sample = {
+            'view': name,
+            'status': response.status_code,
+            'wall_ms': round(wall_ms, 2),
+            'queries': recorder.count,
+            'db_ms': round(recorder.seconds * 1000, 2),
+            'duplicates': {sql: repeats for sql, repeats in recorder.fingerprints.items() if repeats > 1},
+            'over_budget': over_budget,
+        }
+        stats_registry.record(name, sample)
+        if getattr(settings, 'REQUEST_INSTRUMENTATION_LOG', True):
+            logger.info(json.dumps(sample))
+
+        if over_budget:
+            message = f'{name} ran {recorder.count} queries, over its budget of {budget}'
+            if getattr(settings, 'QUERY_BUDGETS_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
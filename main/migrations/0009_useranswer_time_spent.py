@@ -0,0 +1,39 @@
+# Generated by Django 4.2.6 on 2026-10-18 11:52
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_examattempt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='useranswer',
+            name='first_visited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='useranswer',
+            name='last_visited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='useranswer',
+            name='time_spent',
+            field=models.DurationField(default=datetime.timedelta),
+        ),
+        migrations.AddField(
+            model_name='useranswer',
+            name='visit_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='useranswer',
+            name='visit_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
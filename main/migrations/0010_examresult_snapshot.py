@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_useranswer_time_spent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examresult',
+            name='snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
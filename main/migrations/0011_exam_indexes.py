@@ -0,0 +1,65 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:04
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def dedupe_user_answers(apps, schema_editor):
+    # The app always read the oldest answer of a (user, question) pair, so that
+    # row is kept. Time and visits of the duplicates are added to it, and their
+    # legacy intervals are moved over before the duplicates are deleted.
+    UserAnswer = apps.get_model('main', 'UserAnswer')
+    AnswerInterval = apps.get_model('main', 'AnswerInterval')
+    duplicates = (
+        UserAnswer.objects.values('user_id', 'question_id')
+        .annotate(rows=Count('id'), keep_id=Min('id'))
+        .filter(rows__gt=1)
+    )
+    for group in list(duplicates):
+        answers = UserAnswer.objects.filter(user_id=group['user_id'], question_id=group['question_id'])
+        totals = answers.aggregate(
+            time_spent=Sum('time_spent'),
+            visit_count=Sum('visit_count'),
+            first_visited_at=Min('first_visited_at'),
+            last_visited_at=Max('last_visited_at'),
+        )
+        extra = answers.exclude(pk=group['keep_id'])
+        AnswerInterval.objects.filter(useranswer__in=extra).update(useranswer_id=group['keep_id'])
+        extra.delete()
+        UserAnswer.objects.filter(pk=group['keep_id']).update(**totals)
+
+
+def dedupe_exam_results(apps, schema_editor):
+    # Only the first result of a student was ever shown, so later ones go
+    ExamResult = apps.get_model('main', 'ExamResult')
+    duplicates = (
+        ExamResult.objects.values('user_id', 'exam_id')
+        .annotate(rows=Count('id'), keep_id=Min('id'))
+        .filter(rows__gt=1)
+    )
+    for group in list(duplicates):
+        ExamResult.objects.filter(user_id=group['user_id'], exam_id=group['exam_id']).exclude(pk=group['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_examresult_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_user_answers, migrations.RunPython.noop),
+        migrations.RunPython(dedupe_exam_results, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='answerinterval',
+            index=models.Index(fields=['useranswer', 'start_time'], name='answerinterval_start_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='examresult',
+            constraint=models.UniqueConstraint(fields=('user', 'exam'), name='unique_exam_result'),
+        ),
+        migrations.AddConstraint(
+            model_name='useranswer',
+            constraint=models.UniqueConstraint(fields=('user', 'question'), name='unique_user_answer'),
+        ),
+    ]
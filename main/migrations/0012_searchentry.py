@@ -0,0 +1,70 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+SEARCH_FIELDS = {
+    'Course': (1, 'course', ['name', 'description']),
+    'Exam': (2, 'exam', ['name', 'description', 'exam_type', 'course__name']),
+    'Question': (3, 'question', ['question_text']),
+}
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE main_searchentry USING fts5("
+            "kind UNINDEXED, object_id UNINDEXED, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    elif vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE TABLE main_searchentry ('
+            'rowid BIGINT NOT NULL PRIMARY KEY, kind VARCHAR(16) NOT NULL, object_id BIGINT NOT NULL, body LONGTEXT NOT NULL, '
+            'KEY main_searchentry_object (kind, object_id), FULLTEXT KEY main_searchentry_body (body)'
+            ') ENGINE=InnoDB'
+        )
+    else:
+        schema_editor.create_model(apps.get_model('main', 'SearchEntry'))
+
+
+def drop_search_table(apps, schema_editor):
+    schema_editor.execute('DROP TABLE main_searchentry')
+
+
+def index_existing(apps, schema_editor):
+    SearchEntry = apps.get_model('main', 'SearchEntry')
+    for model_name, (code, kind, fields) in SEARCH_FIELDS.items():
+        entries = []
+        for row in apps.get_model('main', model_name).objects.values_list('pk', *fields).iterator():
+            body = ' '.join(str(value) for value in row[1:] if value)
+            entries.append(SearchEntry(id=row[0] * 4 + code, kind=kind, object_id=row[0], body=body))
+        SearchEntry.objects.bulk_create(entries, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_exam_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='SearchEntry',
+                    fields=[
+                        ('id', models.BigIntegerField(db_column='rowid', primary_key=True, serialize=False)),
+                        ('kind', models.CharField(max_length=16)),
+                        ('object_id', models.BigIntegerField()),
+                        ('body', models.TextField()),
+                    ],
+                    options={
+                        'db_table': 'main_searchentry',
+                        'managed': False,
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_search_table, drop_search_table),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
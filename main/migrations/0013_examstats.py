@@ -0,0 +1,51 @@
+# Generated by Django 4.2.6 on 2026-10-18 12:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import main.models
+
+HISTOGRAM_BUCKETS = 10
+
+
+def compute_existing(apps, schema_editor):
+    Exam = apps.get_model('main', 'Exam')
+    ExamResult = apps.get_model('main', 'ExamResult')
+    ExamStats = apps.get_model('main', 'ExamStats')
+    pass_percentage = getattr(settings, 'EXAM_PASS_PERCENTAGE', 50)
+    stats = {
+        exam_id: ExamStats(exam_id=exam_id, histogram=[0] * HISTOGRAM_BUCKETS)
+        for exam_id in Exam.objects.values_list('pk', flat=True)
+    }
+    for exam_id, percentage in ExamResult.objects.values_list('exam_id', 'percentage').iterator(chunk_size=2000):
+        percentage = percentage or 0
+        row = stats[exam_id]
+        row.count += 1
+        row.percentage_sum += percentage
+        row.percentage_sum_squares += percentage ** 2
+        row.pass_count += percentage >= pass_percentage
+        row.histogram[min(max(int(percentage // (100 / HISTOGRAM_BUCKETS)), 0), HISTOGRAM_BUCKETS - 1)] += 1
+    ExamStats.objects.bulk_create(stats.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_searchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExamStats',
+            fields=[
+                ('exam', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='main.exam')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('percentage_sum', models.FloatField(default=0)),
+                ('percentage_sum_squares', models.FloatField(default=0)),
+                ('pass_count', models.PositiveIntegerField(default=0)),
+                ('histogram', models.JSONField(default=main.models.empty_histogram)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(compute_existing, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,9 @@
 import datetime
+import math
 from django.db import models
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 import uuid
 
@@ -9,11 +11,23 @@ Group.objects.get_or_create(name='Teacher')
 Group.objects.get_or_create(name='Student')
 
 
+class LiveManager(models.Manager):
+    # Courses and exams waiting to be purged in the background (see main.purge)
+    # are hidden as soon as they are deleted
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Course(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(null=True)
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='courses')
     created_at = models.DateTimeField(default=timezone.now)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     def __str__(self):
         return self.name
 
@@ -32,7 +46,11 @@ class Exam(models.Model):
     exam_type = models.CharField(max_length=4, choices=EXAM_TYPES, default='Exam')
     
     exam_hash = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
+
     def __str__(self):
         return self.name
 
@@ -62,7 +80,57 @@ class UserAnswer(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     choice = models.ForeignKey(Choice, on_delete=models.CASCADE, blank=True, null=True)
-    
+    # Time on question is accumulated here instead of one AnswerInterval row per view
+    time_spent = models.DurationField(default=datetime.timedelta)
+    visit_count = models.PositiveIntegerField(default=0)
+    first_visited_at = models.DateTimeField(null=True, blank=True)
+    last_visited_at = models.DateTimeField(null=True, blank=True)
+    # Start of the visit that is still open, if any
+    visit_started_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'question'], name='unique_user_answer'),
+        ]
+
+    def start_visit(self, now=None):
+        now = now or timezone.now()
+        UserAnswer.objects.filter(pk=self.pk).update(**self._visit_start_changes(now))
+        self._visit_started(now)
+
+    async def astart_visit(self, now=None):
+        now = now or timezone.now()
+        await UserAnswer.objects.filter(pk=self.pk).aupdate(**self._visit_start_changes(now))
+        self._visit_started(now)
+
+    def _visit_start_changes(self, now):
+        return {
+            'visit_count': models.F('visit_count') + 1,
+            'first_visited_at': Coalesce('first_visited_at', models.Value(now)),
+            'last_visited_at': now,
+            'visit_started_at': now,
+        }
+
+    def _visit_started(self, now):
+        self.visit_count += 1
+        self.first_visited_at = self.first_visited_at or now
+        self.last_visited_at = now
+        self.visit_started_at = now
+
+    def end_visit(self, now=None):
+        # Only the request that still sees the open visit adds its duration
+        if self.visit_started_at is None:
+            return
+        now = now or timezone.now()
+        elapsed = max(now - self.visit_started_at, datetime.timedelta())
+        updated = UserAnswer.objects.filter(pk=self.pk, visit_started_at=self.visit_started_at).update(
+            time_spent=models.F('time_spent') + elapsed,
+            visit_started_at=None,
+        )
+        if updated:
+            self.time_spent += elapsed
+        self.visit_started_at = None
+
 
 
 class AnswerInterval(models.Model):
@@ -70,6 +138,11 @@ class AnswerInterval(models.Model):
     start_time = models.DateTimeField(null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['useranswer', 'start_time'], name='answerinterval_start_idx'),
+        ]
+
 
 class ExamResult(models.Model):
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
@@ -84,3 +157,216 @@ class ExamResult(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     submitted = models.BooleanField(default=False)
     time_up = models.BooleanField(default=False)
+    # Graded paper written once at submit, see main.grading.SNAPSHOT_COLUMNS
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # One result per student and exam; also the index for (user, exam) lookups
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exam'], name='unique_exam_result'),
+        ]
+
+
+class ExamAttempt(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exam_attempts')
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='attempts')
+    started_at = models.DateTimeField(default=timezone.now)
+    deadline = models.DateTimeField(null=True, blank=True)
+    current_position = models.PositiveIntegerField(default=1)
+    answered_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'exam'], name='unique_exam_attempt'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.exam}'
+
+    @classmethod
+    def start(cls, user, exam):
+        # The server clock starts on the first visit and is never reset by later ones
+        attempt, created = cls.objects.get_or_create(user=user, exam=exam, defaults=cls._start_defaults(exam))
+        return attempt
+
+    @classmethod
+    async def astart(cls, user, exam):
+        attempt, created = await cls.objects.aget_or_create(user=user, exam=exam, defaults=cls._start_defaults(exam))
+        return attempt
+
+    @staticmethod
+    def _start_defaults(exam):
+        started_at = timezone.now()
+        return {
+            'started_at': started_at,
+            'deadline': started_at + exam.duration if exam.duration is not None else None,
+        }
+
+    def remaining_seconds(self, now=None):
+        if self.deadline is None:
+            return None
+        now = now or timezone.now()
+        return max(0, (self.deadline - now).total_seconds())
+
+    def track(self, position, answered_count):
+        changes = self._track_changes(position, answered_count)
+        if changes:
+            ExamAttempt.objects.filter(pk=self.pk).update(**changes)
+
+    async def atrack(self, position, answered_count):
+        changes = self._track_changes(position, answered_count)
+        if changes:
+            await ExamAttempt.objects.filter(pk=self.pk).aupdate(**changes)
+
+    def _track_changes(self, position, answered_count):
+        changes = {}
+        if self.current_position != position:
+            changes['current_position'] = position
+        if self.answered_count != answered_count:
+            changes['answered_count'] = answered_count
+        for field, value in changes.items():
+            setattr(self, field, value)
+        return changes
+
+
+def empty_histogram():
+    return [0] * ExamStats.HISTOGRAM_BUCKETS
+
+
+class ExamStats(models.Model):
+    # Running totals of an exam's result percentages, updated by main.stats in
+    # the transaction that creates each ExamResult
+    HISTOGRAM_BUCKETS = 10
+
+    exam = models.OneToOneField(Exam, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    count = models.PositiveIntegerField(default=0)
+    percentage_sum = models.FloatField(default=0)
+    percentage_sum_squares = models.FloatField(default=0)
+    pass_count = models.PositiveIntegerField(default=0)
+    # Results per 10% band; the last band includes 100%
+    histogram = models.JSONField(default=empty_histogram)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @classmethod
+    def bucket(cls, percentage):
+        return min(max(int(percentage // (100 / cls.HISTOGRAM_BUCKETS)), 0), cls.HISTOGRAM_BUCKETS - 1)
+
+    @property
+    def mean(self):
+        return self.percentage_sum / self.count if self.count else None
+
+    @property
+    def std(self):
+        # Population standard deviation; rounding can push the variance just below zero
+        if not self.count:
+            return None
+        return math.sqrt(max(self.percentage_sum_squares / self.count - self.mean ** 2, 0))
+
+    @property
+    def pass_rate(self):
+        return self.pass_count / self.count * 100 if self.count else None
+
+    @property
+    def median_estimate(self):
+        # Only the histogram is kept, so the median is estimated by
+        # interpolating inside the band holding the middle result. It can be
+        # off by more than a band when the results around the middle are
+        # spread apart, so pages show it as an estimate.
+        if not self.count:
+            return None
+        width = 100 / self.HISTOGRAM_BUCKETS
+        half = self.count / 2
+        seen = 0
+        for i, results in enumerate(self.histogram):
+            if results and seen + results >= half:
+                return i * width + (half - seen) / results * width
+            seen += results
+        return 100.0
+
+    def histogram_bars(self):
+        width = 100 // self.HISTOGRAM_BUCKETS
+        tallest = max(self.histogram, default=0)
+        return [
+            {
+                'label': f'{i * width}-{(i + 1) * width}%',
+                'results': results,
+                'height': round(results / tallest * 100) if tallest else 0,
+            }
+            for i, results in enumerate(self.histogram)
+        ]
+
+
+class Job(models.Model):
+    # A unit of background work, run by `manage.py runworker` (see main.tasks)
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    # Enqueuing again with the same key returns the existing job
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # Queued jobs wait until then; retries are pushed back a little more each time
+    run_at = models.DateTimeField(default=timezone.now)
+    progress = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by progress updates; running jobs without one for too long are requeued
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk} ({self.status})'
+
+    def set_progress(self, progress, total=None, message=None):
+        self.progress = progress
+        self.total = total if total is not None else self.total
+        self.message = message if message is not None else self.message
+        self.heartbeat_at = timezone.now()
+        Job.objects.filter(pk=self.pk).update(
+            progress=self.progress, total=self.total, message=self.message[:200], heartbeat_at=self.heartbeat_at,
+        )
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'task': self.task,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'message': self.message,
+            'attempts': self.attempts,
+            'result': self.result,
+            # The last line of the traceback, without the stack
+            'error': self.error.strip().splitlines()[-1] if self.error else None,
+        }
+
+
+class SearchEntry(models.Model):
+    # Full-text index of courses, exams and questions. The table is created per
+    # database backend (an FTS5 virtual table on SQLite, a FULLTEXT-indexed
+    # table on MySQL) and kept in sync by main.search.
+    id = models.BigIntegerField(primary_key=True, db_column='rowid')
+    kind = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    body = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'main_searchentry'
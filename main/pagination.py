@@ -0,0 +1,133 @@
+from django.core import signing
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+# Counting stops here; larger result sets are shown as "1000+"
+COUNT_LIMIT = 1000
+
+_TOKEN_SALT = 'main.pagination'
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE):
+    # per_page comes from the query string, so it is clamped to MAX_PAGE_SIZE
+    try:
+        per_page = int(request.GET.get('per_page', default))
+    except (TypeError, ValueError):
+        return default
+    return min(max(per_page, 1), MAX_PAGE_SIZE)
+
+
+class KeysetPaginator:
+    """Cursor pagination that seeks past the last row instead of using OFFSET.
+
+    ordering names the fields or annotations to sort by, ending with a unique
+    one such as 'pk' so the order is stable. Pages are addressed by opaque
+    signed tokens, so any page costs the same as the first.
+    """
+
+    def __init__(self, queryset, ordering, per_page=DEFAULT_PAGE_SIZE):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+
+    @cached_property
+    def _bounded_count(self):
+        return self.queryset.order_by()[:COUNT_LIMIT + 1].count()
+
+    @property
+    def count(self):
+        # Only runs if a template asks for it, and never counts past COUNT_LIMIT
+        return min(self._bounded_count, COUNT_LIMIT)
+
+    @property
+    def count_is_capped(self):
+        return self._bounded_count > COUNT_LIMIT
+
+    def page(self, token=None):
+        cursor = self._decode(token)
+        if cursor is None:
+            return self._forward_page(None, has_previous=False)
+        direction, values = cursor
+        if direction == 'prev':
+            return self._backward_page(values)
+        return self._forward_page(values, has_previous=True)
+
+    def _forward_page(self, values, has_previous):
+        rows = list(self._seek(values, reverse=False)[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return KeysetPage(self, rows[:self.per_page], has_next=has_next, has_previous=has_previous)
+
+    def _backward_page(self, values):
+        rows = list(self._seek(values, reverse=True)[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(self, rows, has_next=True, has_previous=has_previous)
+
+    def _seek(self, values, reverse):
+        ordering = [self._flip(field) for field in self.ordering] if reverse else self.ordering
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(ordering, values))
+        return queryset
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, values):
+        # (a > x) OR (a = x AND b > y) OR ..., with < for descending keys
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def _key(self, row):
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def token(self, direction, row):
+        return signing.dumps([direction, self._key(row)], salt=_TOKEN_SALT, compress=True)
+
+    def _decode(self, token):
+        if not token:
+            return None
+        try:
+            direction, values = signing.loads(token, salt=_TOKEN_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            # Tampered or stale tokens fall back to the first page
+            return None
+        if direction not in ('next', 'prev') or len(values) != len(self.ordering):
+            return None
+        return direction, values
+
+
+class KeysetPage:
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next and bool(object_list)
+        self._has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_token(self):
+        return self.paginator.token('next', self.object_list[-1]) if self._has_next else None
+
+    def previous_token(self):
+        return self.paginator.token('prev', self.object_list[0]) if self._has_previous else None
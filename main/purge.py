@@ -0,0 +1,118 @@
+# Deleting courses and exams with everything under them, in the background.
+#
+# Model.delete() makes Django's collector load every question, choice, answer
+# and answer interval into memory to cascade. A purge instead deletes
+# bottom-up with one DELETE ... WHERE ... IN (subquery) per table, a batch of
+# questions per transaction. The course or exam is marked deleted first, which
+# hides it right away (see models.LiveManager); the rows go in a 'purge' job
+# run by `manage.py runworker`. Courses and exams still marked deleted, e.g.
+# after their job failed for good, are purged by `manage.py purge_deleted`.
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from main.models import AnswerInterval, Choice, Course, Exam, ExamAttempt, ExamResult, ExamStats, Job, Question, UserAnswer
+from main.search import remove_objects
+from main.tasks import enqueue, run_now, task
+
+# Questions whose answers, choices and index entries are deleted per transaction
+BATCH_SIZE = 100
+
+
+def in_background():
+    return getattr(settings, 'PURGE_IN_BACKGROUND', True)
+
+
+def _raw_delete(queryset):
+    # A single DELETE statement: no rows are loaded, no signals are sent and
+    # nothing cascades, so callers delete the tables below first
+    return queryset._raw_delete(queryset.db)
+
+
+def job_key(kind, object_id, deleted_at):
+    # One purge job per deletion; the time tells apart objects that reuse an id
+    return f'purge:{kind}:{object_id}:{deleted_at.isoformat()}'
+
+
+def latest_job(kind, object_id):
+    return Job.objects.filter(task='purge', idempotency_key__startswith=f'purge:{kind}:{object_id}:').order_by('-pk').first()
+
+
+def delete_later(obj, user=None):
+    """Mark a course or exam deleted now and queue the job that purges it.
+
+    Returns the job. Without PURGE_IN_BACKGROUND the job runs as soon as the
+    transaction commits, in the request.
+    """
+    kind = 'course' if isinstance(obj, Course) else 'exam'
+    now = timezone.now()
+    with transaction.atomic():
+        if kind == 'course':
+            Course.all_objects.filter(pk=obj.pk).update(deleted_at=now)
+            Exam.all_objects.filter(course_id=obj.pk, deleted_at__isnull=True).update(deleted_at=now)
+        else:
+            Exam.all_objects.filter(pk=obj.pk).update(deleted_at=now)
+        job = enqueue('purge', key=job_key(kind, obj.pk, now), user=user, kind=kind, object_id=obj.pk)
+    obj.deleted_at = now
+    if not in_background():
+        transaction.on_commit(lambda: run_now(job))
+    return job
+
+
+@task('purge')
+def purge_job(job, kind, object_id):
+    purge(kind, object_id, on_progress=job.set_progress)
+    return {'kind': kind, 'id': object_id}
+
+
+def purge(kind, object_id, on_progress=None):
+    """Delete a course or exam that was marked deleted, and everything under it.
+
+    on_progress is called with the number of questions and exams deleted so
+    far and the total after every batch. Safe to run again after a failure:
+    every batch is its own transaction and only deletes rows still there.
+    """
+    exam_ids = Exam.all_objects.filter(**{'course_id' if kind == 'course' else 'pk': object_id})
+    exam_ids = list(exam_ids.values_list('pk', flat=True))
+    question_ids = list(Question.objects.filter(exam_id__in=exam_ids).order_by('pk').values_list('pk', flat=True))
+    total = len(question_ids) + len(exam_ids)
+    on_progress = on_progress or (lambda done, total: None)
+    on_progress(0, total)
+    for start in range(0, len(question_ids), BATCH_SIZE):
+        batch = question_ids[start:start + BATCH_SIZE]
+        with transaction.atomic():
+            _delete_questions(batch)
+        on_progress(start + len(batch), total)
+    with transaction.atomic():
+        _delete_exams(exam_ids)
+        if kind == 'course':
+            remove_objects(Course, [object_id])
+            _raw_delete(Course.all_objects.filter(pk=object_id))
+    on_progress(total, total)
+
+
+def _delete_questions(question_ids):
+    _raw_delete(AnswerInterval.objects.filter(useranswer__question_id__in=question_ids))
+    _raw_delete(UserAnswer.objects.filter(question_id__in=question_ids))
+    _raw_delete(Choice.objects.filter(question_id__in=question_ids))
+    remove_objects(Question, question_ids)
+    _raw_delete(Question.objects.filter(pk__in=question_ids))
+
+
+def _delete_exams(exam_ids):
+    for model in (ExamResult, ExamAttempt, ExamStats):
+        _raw_delete(model.objects.filter(exam_id__in=exam_ids))
+    remove_objects(Exam, exam_ids)
+    _raw_delete(Exam.all_objects.filter(pk__in=exam_ids))
+
+
+def purge_deleted():
+    """Purge every course and exam still marked deleted, e.g. after their job failed for good."""
+    purged = []
+    for course_id in Course.all_objects.filter(deleted_at__isnull=False).values_list('pk', flat=True):
+        purge('course', course_id)
+        purged.append(('course', course_id))
+    for exam_id in Exam.all_objects.filter(deleted_at__isnull=False).values_list('pk', flat=True):
+        purge('exam', exam_id)
+        purged.append(('exam', exam_id))
+    return purged
@@ -0,0 +1,76 @@
+# Saving a question together with its choices, as one set of bulk writes
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from main.models import Choice
+from main.manifest import bump_manifest_version
+
+
+def choices_from_post(data):
+    """Read the choice rows of the create and edit question forms.
+
+    Each row sends a choice_text[], a choice_id[] that is empty for new
+    choices and an is_correct[] of 'on' or '', so the lists line up however
+    many rows were removed from the page. Returns the rows as dicts and the
+    ids of the choices whose delete_choice_<id> button was pressed.
+    """
+    texts = data.getlist('choice_text[]')
+    ids = data.getlist('choice_id[]')
+    correct = data.getlist('is_correct[]')
+    choices = []
+    for i, choice_text in enumerate(texts):
+        choice_id = ids[i] if i < len(ids) else ''
+        choices.append({
+            'id': int(choice_id) if choice_id.isdigit() else None,
+            'choice_text': choice_text,
+            'is_correct': i < len(correct) and correct[i] == 'on',
+        })
+    deleted = {
+        int(key[len('delete_choice_'):]) for key in data
+        if key.startswith('delete_choice_') and key[len('delete_choice_'):].isdigit()
+    }
+    return choices, deleted
+
+
+def save_question(question, choices, deleted=()):
+    """Save a question and the submitted rows of its choices.
+
+    Rows with the id of one of the question's choices update it and rows
+    without an id become new choices. Only the choices in deleted are
+    removed; existing choices without a row, e.g. ones deleted from the
+    page meanwhile, are left alone so the answers pointing at them survive.
+    Nothing is written unless at least one of the resulting choices is
+    correct. The writes are a fixed set of queries in one transaction,
+    however many choices change.
+    """
+    with transaction.atomic():
+        existing = {choice.pk: choice for choice in question.choices.all()} if question.pk else {}
+        removed = existing.keys() & set(deleted)
+        changed = []
+        to_create = []
+        for row in choices:
+            if row['id'] is None:
+                to_create.append(Choice(choice_text=row['choice_text'], is_correct=row['is_correct']))
+                continue
+            # Ids of other questions' choices, or of choices deleted meanwhile, are ignored
+            choice = existing.get(row['id'])
+            if choice is None or choice.pk in removed:
+                continue
+            if (choice.choice_text, choice.is_correct) != (row['choice_text'], row['is_correct']):
+                choice.choice_text, choice.is_correct = row['choice_text'], row['is_correct']
+                changed.append(choice)
+
+        kept = [choice for choice in existing.values() if choice.pk not in removed]
+        if not any(choice.is_correct for choice in [*kept, *to_create]):
+            raise ValidationError('At least one choice must be marked as correct.')
+
+        question.save()
+        if removed:
+            Choice.objects.filter(question=question, pk__in=removed).delete()
+        if changed:
+            Choice.objects.bulk_update(changed, ['choice_text', 'is_correct'])
+        for choice in to_create:
+            choice.question = question
+        Choice.objects.bulk_create(to_create)
+    bump_manifest_version(question.exam_id)
+    return question
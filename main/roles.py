@@ -0,0 +1,75 @@
+import uuid
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed
+
+TEACHER = 'Teacher'
+STUDENT = 'Student'
+
+SESSION_KEY = 'user_role'
+
+
+class UserRole:
+    def __init__(self, groups):
+        self.groups = frozenset(groups)
+
+    @property
+    def is_teacher(self):
+        return TEACHER in self.groups
+
+    @property
+    def is_student(self):
+        return STUDENT in self.groups
+
+
+def _version_key(user_id):
+    return f'user-role-version:{user_id}'
+
+
+# Versions live in the default cache, which must be shared between worker
+# processes for a membership change to reach all of them (see main.checks)
+def get_role_version(user_id):
+    return cache.get_or_set(_version_key(user_id), lambda: uuid.uuid4().hex, None)
+
+
+def bump_role_version(user_ids):
+    cache.set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+def resolve_user_role(request):
+    # Group names are cached in the session next to the user's role version,
+    # so they are only read from the database again after a membership change
+    user = request.user
+    if not user.is_authenticated:
+        return UserRole([])
+    session = getattr(request, 'session', None)
+    if session is None:
+        return UserRole(user.groups.values_list('name', flat=True))
+    version = get_role_version(user.id)
+    cached = session.get(SESSION_KEY)
+    if cached and cached['user_id'] == user.id and cached['version'] == version:
+        return UserRole(cached['groups'])
+
+    groups = list(user.groups.values_list('name', flat=True))
+    session[SESSION_KEY] = {'user_id': user.id, 'version': version, 'groups': groups}
+    return UserRole(groups)
+
+
+def get_user_role(request):
+    # request.user_role is set by UserRoleMiddleware; requests built without it resolve directly
+    role = getattr(request, 'user_role', None)
+    return role if role is not None else resolve_user_role(request)
+
+
+def _membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        user_ids = pk_set if reverse else [instance.pk]
+    elif action == 'pre_clear':
+        user_ids = list(instance.user_set.values_list('pk', flat=True)) if reverse else [instance.pk]
+    else:
+        return
+    bump_role_version(user_ids)
+
+
+def connect_signals():
+    m2m_changed.connect(_membership_changed, sender=User.groups.through, dispatch_uid='user-role-membership')
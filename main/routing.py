@@ -0,0 +1,6 @@
+from django.urls import path
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/answer-exam/<int:exam_id>/', consumers.ExamConsumer.as_asgi()),
+]
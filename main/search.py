@@ -0,0 +1,198 @@
+import operator
+import re
+from functools import reduce
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from main.models import Course, Exam, Question, SearchEntry
+
+# Fields whose text is indexed for each searchable model
+SEARCH_FIELDS = {
+    Course: ['name', 'description'],
+    Exam: ['name', 'description', 'exam_type', 'course__name'],
+    Question: ['question_text'],
+}
+
+# Kind stored on the index entries and the code used to derive their ids
+KINDS = {Course: ('course', 1), Exam: ('exam', 2), Question: ('question', 3)}
+
+
+def entry_id(model, object_id):
+    # Entries are addressed by an id derived from the object, so keeping the
+    # index in sync is a primary key write instead of a scan of the index
+    return object_id * 4 + KINDS[model][1]
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query)
+
+
+def document(obj):
+    values = []
+    for field in SEARCH_FIELDS[type(obj)]:
+        value = obj
+        for attribute in field.split('__'):
+            value = getattr(value, attribute)
+        values.append(value)
+    return ' '.join(str(value) for value in values if value)
+
+
+class SearchBackend:
+    """Keeps SearchEntry rows in sync and ranks querysets against them."""
+
+    batch_size = 2000
+
+    def index(self, objects):
+        objects = list(objects)
+        if not objects:
+            return
+        model = type(objects[0])
+        kind = KINDS[model][0]
+        entries = [
+            SearchEntry(id=entry_id(model, obj.pk), kind=kind, object_id=obj.pk, body=document(obj))
+            for obj in objects
+        ]
+        self.remove(model, [obj.pk for obj in objects])
+        SearchEntry.objects.bulk_create(entries, batch_size=self.batch_size)
+
+    def remove(self, model, object_ids):
+        SearchEntry.objects.filter(id__in=[entry_id(model, object_id) for object_id in object_ids]).delete()
+
+    def rebuild(self, model):
+        SearchEntry.objects.filter(kind=KINDS[model][0]).delete()
+        queryset = model.objects.order_by('pk')
+        if model is Exam:
+            queryset = queryset.select_related('course')
+        batch = []
+        for obj in queryset.iterator(chunk_size=self.batch_size):
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                self.index(batch)
+                batch = []
+        self.index(batch)
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def _search(self, queryset, match, rank, match_params, rank_params):
+        # Joins the index into the queryset so filtering, ranking and
+        # pagination all happen in a single statement. search_rank is higher
+        # for better matches on every backend.
+        entries = SearchEntry._meta.db_table
+        table = queryset.model._meta.db_table
+        pk_column = queryset.model._meta.pk.column
+        return queryset.extra(
+            tables=[entries],
+            # Both join conditions are given so the planner can either drive the
+            # search from the index or look entries up by id for a narrow queryset
+            where=[
+                f'{entries}.object_id = {table}.{pk_column}',
+                f'{entries}.rowid = {table}.{pk_column} * 4 + %s',
+                f'{entries}.kind = %s',
+                match,
+            ],
+            params=[KINDS[queryset.model][1], KINDS[queryset.model][0], *match_params],
+        ).annotate(search_rank=RawSQL(rank, rank_params, output_field=FloatField())).order_by('-search_rank', 'pk')
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+        # Every term must match, as a prefix so partial words still find results
+        expression = ' '.join('"%s"*' % term for term in terms)
+        entries = SearchEntry._meta.db_table
+        # bm25 is lower for better matches
+        return self._search(queryset, f'{entries} MATCH %s', f'-bm25({entries})', [expression], [])
+
+
+class MySQLFulltextBackend(SearchBackend):
+    # InnoDB's defaults for innodb_ft_min_token_size and its stopword list
+    min_token_size = 3
+    stopwords = frozenset(
+        'a about an are as at be by com de en for from how i in is it la of on or that the this to was what when where '
+        'who will with und www'.split()
+    )
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset
+        # Words MySQL does not index would make a required +term match nothing,
+        # so they are matched with LIKE on the indexed text instead
+        indexed = [term for term in terms if len(term) >= self.min_token_size and term.lower() not in self.stopwords]
+        if not indexed:
+            return LikeBackend().search(queryset, query)
+        entries = SearchEntry._meta.db_table
+        expression = ' '.join(f'+{term}*' for term in indexed)
+        rank = f'MATCH ({entries}.body) AGAINST (%s IN BOOLEAN MODE)'
+        others = [term for term in terms if term not in indexed]
+        match = ' AND '.join([rank, *(f'{entries}.body LIKE %s' for term in others)])
+        likes = ['%' + term.replace('_', '\\_') + '%' for term in others]
+        return self._search(queryset, match, rank, [expression, *likes], [expression])
+
+
+class LikeBackend(SearchBackend):
+    # Fallback for databases without a full-text backend: no index, no ranking
+    def index(self, objects):
+        pass
+
+    def remove(self, model, object_ids):
+        pass
+
+    def rebuild(self, model):
+        pass
+
+    def search(self, queryset, query):
+        if not search_terms(query):
+            return queryset
+        fields = SEARCH_FIELDS[queryset.model]
+        queryset = queryset.filter(reduce(operator.or_, (Q(**{f'{field}__icontains': query}) for field in fields)))
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTS5Backend,
+    'mysql': MySQLFulltextBackend,
+}
+
+
+def get_search_backend():
+    return BACKENDS.get(connection.vendor, LikeBackend)()
+
+
+def search(queryset, query):
+    # Ranked full-text search of a Course, Exam or Question queryset
+    return get_search_backend().search(queryset, query)
+
+
+def search_ordering(query, *ordering):
+    # Ordering of a list that may be searched: best matches first when there is a query
+    return ['-search_rank', *ordering] if search_terms(query) else list(ordering)
+
+
+def index_objects(objects):
+    get_search_backend().index(objects)
+
+
+def remove_objects(model, object_ids):
+    get_search_backend().remove(model, object_ids)
+
+
+def _index_saved(sender, instance, **kwargs):
+    index_objects([instance])
+    if sender is Course:
+        # Exams are found by the name of their course too
+        index_objects(instance.exams.select_related('course'))
+
+
+def _remove_deleted(sender, instance, **kwargs):
+    remove_objects(sender, [instance.pk])
+
+
+def connect_signals():
+    for model in SEARCH_FIELDS:
+        post_save.connect(_index_saved, sender=model, dispatch_uid=f'search-index-{model.__name__}')
+        post_delete.connect(_remove_deleted, sender=model, dispatch_uid=f'search-remove-{model.__name__}')
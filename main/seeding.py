@@ -0,0 +1,144 @@
+# Synthetic datasets for benchmarks and local load testing
+
+import datetime
+import random
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.utils import timezone
+from main.models import Course, Exam, Choice, Question, UserAnswer, ExamAttempt
+from main.grading import submit_exam
+from main.search import SEARCH_FIELDS, get_search_backend
+
+BATCH_SIZE = 2000
+
+
+def seed_dataset(teachers=2, courses=2, exams=3, questions=20, choices=4, students=50,
+                 started=0.6, submitted=0.5, prefix='seed', password='password', seed=0):
+    """Create teachers, their courses, exams and questions, and students with attempts.
+
+    courses is per teacher, exams per course and questions per exam. Each
+    student starts an exam with probability started and answers a random
+    prefix of it; a submitted share of the started attempts is graded through
+    submit_exam, so results carry snapshots like real ones. All users share
+    one password. Returns the created users and exams.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        teacher_users = _create_users(f'{prefix}-teacher', teachers, 'Teacher', password)
+        student_users = _create_users(f'{prefix}-student', students, 'Student', password)
+        exam_list = _create_exams(rng, teacher_users, courses, exams, questions, choices)
+        results = _create_attempts(rng, student_users, exam_list, started, submitted)
+
+    # bulk_create skips the signals that keep the search index in sync
+    backend = get_search_backend()
+    for model in SEARCH_FIELDS:
+        backend.rebuild(model)
+    return {'teachers': teacher_users, 'students': student_users, 'exams': exam_list, 'results': results}
+
+
+def _create_users(prefix, count, group_name, password):
+    # Hashing once keeps seeding fast; every user gets the same password
+    password = make_password(password)
+    User.objects.bulk_create(
+        [User(username=f'{prefix}-{i}', password=password) for i in range(count)],
+        batch_size=BATCH_SIZE,
+    )
+    users = list(User.objects.filter(username__startswith=f'{prefix}-').order_by('pk'))
+    group = Group.objects.get_or_create(name=group_name)[0]
+    User.groups.through.objects.bulk_create(
+        [User.groups.through(user_id=user.pk, group_id=group.pk) for user in users],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    return users
+
+
+def _create_exams(rng, teachers, courses, exams, questions, choices):
+    Course.objects.bulk_create([
+        Course(name=f'Course {i} of {teacher.username}', description='Seeded course', teacher=teacher)
+        for teacher in teachers for i in range(courses)
+    ])
+    course_list = Course.objects.filter(teacher__in=teachers).order_by('pk')
+    Exam.objects.bulk_create([
+        Exam(
+            name=f'Exam {i} of {course.name}',
+            description='Seeded exam',
+            course=course,
+            duration=datetime.timedelta(hours=1),
+            exam_type=rng.choice(Exam.EXAM_TYPES)[0],
+        )
+        for course in course_list for i in range(exams)
+    ], batch_size=BATCH_SIZE)
+    exam_list = list(Exam.objects.filter(course__in=course_list).select_related('course').order_by('pk'))
+    Question.objects.bulk_create([
+        Question(exam=exam, question_text=f'Question {i} of {exam.name}')
+        for exam in exam_list for i in range(questions)
+    ], batch_size=BATCH_SIZE)
+    question_ids = Question.objects.filter(exam__in=exam_list).values_list('pk', flat=True)
+    Choice.objects.bulk_create([
+        Choice(question_id=question_id, choice_text=f'Choice {j}', is_correct=j == correct)
+        for question_id in question_ids.iterator()
+        for correct in [rng.randrange(choices)]
+        for j in range(choices)
+    ], batch_size=BATCH_SIZE)
+    return exam_list
+
+
+def _create_attempts(rng, students, exams, started, submitted):
+    choices = {}
+    for question_id, exam_id, choice_id in Choice.objects.filter(question__exam__in=exams).order_by('pk').values_list('question_id', 'question__exam_id', 'pk'):
+        choices.setdefault(exam_id, {}).setdefault(question_id, []).append(choice_id)
+
+    now = timezone.now()
+    attempts = []
+    answers = []
+    to_submit = []
+    for student in students:
+        for exam in exams:
+            if rng.random() >= started:
+                continue
+            started_at = now - datetime.timedelta(minutes=rng.randint(5, 50))
+            attempts.append(ExamAttempt(user=student, exam=exam, started_at=started_at, deadline=started_at + exam.duration))
+            exam_choices = list(choices.get(exam.pk, {}).items())
+            answered = exam_choices[:rng.randint(1, len(exam_choices))] if exam_choices else []
+            for question_id, choice_ids in answered:
+                spent = datetime.timedelta(seconds=rng.randint(5, 120))
+                answers.append(UserAnswer(
+                    user=student,
+                    question_id=question_id,
+                    choice_id=rng.choice(choice_ids),
+                    time_spent=spent,
+                    visit_count=1,
+                    first_visited_at=started_at,
+                    last_visited_at=started_at + spent,
+                ))
+            if rng.random() < submitted:
+                to_submit.append((student, exam))
+    ExamAttempt.objects.bulk_create(attempts, batch_size=BATCH_SIZE)
+    UserAnswer.objects.bulk_create(answers, batch_size=BATCH_SIZE)
+
+    results = []
+    for student, exam in to_submit:
+        attempt = ExamAttempt.objects.get(user=student, exam=exam)
+        results.append(submit_exam(exam, student, attempt))
+    return results
+
+
+def add_dataset_arguments(parser, **defaults):
+    # Dataset size options shared by the seeding and benchmark commands
+    sizes = {'teachers': 2, 'courses': 2, 'exams': 3, 'questions': 20, 'choices': 4, 'students': 50, **defaults}
+    parser.add_argument('--teachers', type=int, default=sizes['teachers'])
+    parser.add_argument('--courses', type=int, default=sizes['courses'], help='Courses per teacher.')
+    parser.add_argument('--exams', type=int, default=sizes['exams'], help='Exams per course.')
+    parser.add_argument('--questions', type=int, default=sizes['questions'], help='Questions per exam.')
+    parser.add_argument('--choices', type=int, default=sizes['choices'], help='Choices per question.')
+    parser.add_argument('--students', type=int, default=sizes['students'])
+    parser.add_argument('--started', type=float, default=0.6, help='Share of student and exam pairs with an attempt.')
+    parser.add_argument('--submitted', type=float, default=0.5, help='Share of attempts that are submitted.')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def dataset_options(options):
+    names = ['teachers', 'courses', 'exams', 'questions', 'choices', 'students', 'started', 'submitted', 'seed']
+    return {name: options[name] for name in names}
@@ -0,0 +1,49 @@
+# Per-exam result statistics kept as running totals, so the results page reads
+# one row instead of aggregating every result of the exam
+
+from django.conf import settings
+from main.models import ExamResult, ExamStats
+
+
+def pass_percentage():
+    return getattr(settings, 'EXAM_PASS_PERCENTAGE', 50)
+
+
+def _add(stats, percentage):
+    percentage = percentage or 0
+    stats.count += 1
+    stats.percentage_sum += percentage
+    stats.percentage_sum_squares += percentage ** 2
+    stats.pass_count += percentage >= pass_percentage()
+    stats.histogram[ExamStats.bucket(percentage)] += 1
+
+
+def record_result(exam_result):
+    """Add a new result to its exam's statistics.
+
+    Must run inside the transaction that creates the result. The stats row
+    is locked first, so concurrent submits of the same exam do not lose
+    each other's updates.
+    """
+    ExamStats.objects.get_or_create(exam_id=exam_result.exam_id)
+    stats = ExamStats.objects.select_for_update().get(exam_id=exam_result.exam_id)
+    _add(stats, exam_result.percentage)
+    stats.save()
+
+
+def rebuild_exam_stats(exam_id):
+    """Recompute an exam's statistics from its results, e.g. after results were deleted or edited.
+
+    Run it inside a transaction: the stats row stays locked against
+    record_result until the new totals are saved.
+    """
+    ExamStats.objects.get_or_create(exam_id=exam_id)
+    stats = ExamStats.objects.select_for_update().get(exam_id=exam_id)
+    stats.count = stats.pass_count = 0
+    stats.percentage_sum = stats.percentage_sum_squares = 0
+    stats.histogram = [0] * ExamStats.HISTOGRAM_BUCKETS
+    percentages = ExamResult.objects.filter(exam_id=exam_id).values_list('percentage', flat=True)
+    for percentage in percentages.iterator(chunk_size=2000):
+        _add(stats, percentage)
+    stats.save()
+    return stats
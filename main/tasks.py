@@ -0,0 +1,210 @@
+# Background jobs kept in the database and run by `manage.py runworker`.
+#
+# Tasks are functions registered with @task and called as fn(job, **kwargs);
+# they report progress with job.set_progress(). enqueue() writes a Job row in
+# the caller's transaction, so a job is only visible to workers once the work
+# that asked for it has committed. Workers claim queued jobs with a
+# conditional UPDATE, which needs no row locks and works on every database.
+
+import datetime
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from main.models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(name, max_attempts=3):
+    """Register a function as the task called name."""
+    def register(function):
+        _registry[name] = {'function': function, 'max_attempts': max_attempts}
+        return function
+    return register
+
+
+def retry_delay():
+    return getattr(settings, 'TASK_RETRY_DELAY', 30)
+
+
+def job_timeout():
+    return getattr(settings, 'TASK_TIMEOUT', 600)
+
+
+def enqueue(name, key=None, user=None, run_at=None, **kwargs):
+    """Queue the task name with kwargs and return its Job.
+
+    With a key, enqueuing work that is already queued, running or done
+    returns the existing job instead of adding another one.
+    """
+    if name not in _registry:
+        raise ValueError(f'Unknown task: {name}')
+    if key is not None:
+        existing = Job.objects.filter(idempotency_key=key).first()
+        if existing:
+            return existing
+    job = Job(
+        task=name,
+        kwargs=kwargs,
+        idempotency_key=key,
+        created_by=user,
+        max_attempts=_registry[name]['max_attempts'],
+        run_at=run_at or timezone.now(),
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # Another request enqueued the same key in the meantime
+        return Job.objects.get(idempotency_key=key)
+    return job
+
+
+def claim_job(worker):
+    """Mark the next due job as running for worker and return it, or None."""
+    now = timezone.now()
+    candidates = (
+        Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        .order_by('run_at', 'pk').values_list('pk', flat=True)[:10]
+    )
+    for job_id in candidates:
+        job = _claim(job_id, worker)
+        if job:
+            return job
+    return None
+
+
+def _claim(job_id, worker):
+    # Only one worker's UPDATE finds the job still queued
+    now = timezone.now()
+    claimed = Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+    )
+    return Job.objects.get(pk=job_id) if claimed else None
+
+
+def run_now(job, worker='inline'):
+    """Run a queued job in this thread rather than on a worker, unless one has claimed it already."""
+    claimed = _claim(job.pk, worker)
+    return run_job(claimed) if claimed else job
+
+
+def run_job(job):
+    """Run a claimed job and record its outcome; failures are retried with backoff."""
+    entry = _registry.get(job.task)
+    job.attempts += 1
+    Job.objects.filter(pk=job.pk).update(attempts=job.attempts)
+    try:
+        if entry is None:
+            raise LookupError(f'Unknown task: {job.task}')
+        result = entry['function'](job, **job.kwargs)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + datetime.timedelta(seconds=retry_delay() * 2 ** (job.attempts - 1))
+            logger.warning('Job %s failed, retrying at %s', job, job.run_at, exc_info=True)
+        else:
+            job.status = Job.FAILED
+            job.finished_at = timezone.now()
+            logger.exception('Job %s failed', job)
+        Job.objects.filter(pk=job.pk).update(status=job.status, run_at=job.run_at, error=job.error, finished_at=job.finished_at)
+        return job
+    job.status = Job.SUCCEEDED
+    job.result = result
+    job.error = ''
+    job.finished_at = timezone.now()
+    if job.total is not None:
+        job.progress = job.total
+    Job.objects.filter(pk=job.pk).update(
+        status=job.status, result=job.result, error='', progress=job.progress, finished_at=job.finished_at,
+    )
+    return job
+
+
+def run_job_by_id(job_id):
+    # Entry point of pool workers: processes cannot be handed model instances
+    try:
+        return run_job(Job.objects.get(pk=job_id)).status
+    finally:
+        # Pool threads and processes are long-lived, so don't leave connections open
+        connections.close_all()
+
+
+def requeue_stale():
+    """Requeue running jobs whose worker stopped sending heartbeats, e.g. after it was killed."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=job_timeout())
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff).update(status=Job.QUEUED, worker='')
+
+
+def run_pending(worker='inline'):
+    """Run every due job in this thread until none are left; returns how many ran."""
+    ran = 0
+    while (job := claim_job(worker)) is not None:
+        run_job(job)
+        ran += 1
+    return ran
+
+
+def _drop_inherited_connections():
+    # A forked process must open its own connections. Closing the copies it
+    # inherited could end the parent's sessions, so they are only dropped.
+    for connection in connections.all(initialized_only=True):
+        connection.connection = None
+
+
+class Worker:
+    """Claims due jobs and runs them on a pool of threads or processes."""
+
+    def __init__(self, concurrency=4, pool='thread', poll_interval=1.0, name=None):
+        self.concurrency = concurrency
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self, burst=False):
+        """Run jobs until stop() is called, or until the queue is empty when burst."""
+        if self.pool == 'process':
+            # Children are forked with a copy of the parent's connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(self.concurrency, initializer=_drop_inherited_connections)
+        else:
+            executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix='job')
+        running = set()
+        ran = 0
+        last_requeue = 0
+        with executor:
+            while not self._stopping.is_set():
+                # Jobs of a live worker never look stale, however long they run
+                Job.objects.filter(worker=self.name, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+                if time.monotonic() - last_requeue > self.poll_interval * 10:
+                    requeue_stale()
+                    last_requeue = time.monotonic()
+                while len(running) < self.concurrency and (job := claim_job(self.name)) is not None:
+                    running.add(executor.submit(run_job_by_id, job.pk))
+                if not running:
+                    if burst:
+                        break
+                    self._stopping.wait(self.poll_interval)
+                    continue
+                done, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ran += 1
+                    if future.exception():
+                        logger.error('Job runner crashed', exc_info=future.exception())
+            # Leaving the block lets running jobs finish rather than leave them to be requeued
+        connections.close_all()
+        return ran + len(running)
@@ -13,4 +13,12 @@ def duration(td):
     elif minutes > 0:
         return f'{minutes} minute(s)'
     else:
-        return f'{seconds} second(s)'
\ No newline at end of file
+        return f'{seconds} second(s)'
+
+@register.filter
+def clock(td):
+    # Minutes and seconds, e.g. 2:05, for tables comparing short durations
+    if td is None:
+        return '-'
+    minutes, seconds = divmod(int(td.total_seconds()), 60)
+    return f'{minutes}:{seconds:02d}'
@@ -1,3 +1,1369 @@
-from django.test import TestCase
+import csv
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from io import StringIO
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, models
+from django.core.management import CommandError, call_command
+from django.test.utils import CaptureQueriesContext
+from django.test import AsyncRequestFactory, Client, TestCase, TransactionTestCase, override_settings
+from django.http import Http404
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth.models import AnonymousUser, Group, User
+from main.models import Course, Exam, Choice, Question, UserAnswer, ExamResult, ExamAttempt, AnswerInterval, SearchEntry, ExamStats, Job
+from .grading import grade_exam, submit_exam
+from .manifest import get_exam_manifest, bump_manifest_version
+from .autosave import AnswerBuffer, answer_buffer
+from .timing import get_exam_time_heatmap, get_result_question_times
+from .analytics import get_cached_item_analysis, get_item_analysis
+from .gradebook import gradebook_rows
+from .cloning import clone_exam
+from .purge import delete_later
+from .checks import check_shared_cache
+from .tasks import claim_job, enqueue, requeue_stale, run_pending, task
+from .stats import rebuild_exam_stats
+from .search import MySQLFulltextBackend, index_objects, search, search_ordering
+from .importer import detect_format, import_questions
+from .pagination import MAX_PAGE_SIZE, KeysetPaginator
+from .middleware.instrumentation import QueryBudgetExceeded, fingerprint, stats_registry
+from .routing import websocket_urlpatterns
+from . import async_views, views
 
-# Create your tests here.
+
+def make_exam(teacher, num_questions, name='Exam'):
+    course = Course.objects.create(name='Course', description='Course', teacher=teacher)
+    exam = Exam.objects.create(name=name, description=name, course=course, duration=datetime.timedelta(minutes=30))
+    for i in range(num_questions):
+        question = Question.objects.create(exam=exam, question_text=f'Question {i}')
+        Choice.objects.create(question=question, choice_text='Right', is_correct=True)
+        Choice.objects.create(question=question, choice_text='Wrong', is_correct=False)
+    return exam
+
+
+def in_this_test_database():
+    # Benchmark commands create and destroy their own test database; in tests they run in this one
+    return mock.patch.multiple(connection.creation, create_test_db=mock.DEFAULT, destroy_test_db=mock.DEFAULT)
+
+
+class GradeExamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+
+    def answer(self, question, is_correct):
+        choice = question.choices.get(is_correct=is_correct)
+        UserAnswer.objects.create(user=self.student, question=question, choice=choice)
+
+    def test_counts(self):
+        exam = make_exam(self.teacher, 4)
+        questions = list(exam.questions.order_by('id'))
+        self.answer(questions[0], True)
+        self.answer(questions[1], True)
+        self.answer(questions[2], False)
+        # A visited but unanswered question has an answer row with no choice
+        UserAnswer.objects.create(user=self.student, question=questions[3])
+
+        grade = grade_exam(exam, self.student)
+        self.assertEqual(grade['score'], 2)
+        self.assertEqual(grade['incorrect_answers'], 1)
+        self.assertEqual(grade['unanswered_questions'], 1)
+        self.assertEqual(grade['total_questions'], 4)
+        self.assertEqual(grade['percentage'], 50.0)
+
+    def test_ignores_other_users_answers(self):
+        exam = make_exam(self.teacher, 2)
+        other = User.objects.create_user('other', password='secret')
+        for question in exam.questions.all():
+            UserAnswer.objects.create(user=other, question=question, choice=question.choices.get(is_correct=True))
+
+        grade = grade_exam(exam, self.student)
+        self.assertEqual(grade['score'], 0)
+        self.assertEqual(grade['unanswered_questions'], 2)
+
+    def test_constant_query_count(self):
+        for num_questions in (1, 25, 100):
+            exam = make_exam(self.teacher, num_questions, name=f'Exam {num_questions}')
+            for question in exam.questions.all():
+                self.answer(question, True)
+            get_exam_manifest(exam.id)
+            with self.assertNumQueries(1):
+                grade = grade_exam(exam, self.student)
+            self.assertEqual(grade['score'], num_questions)
+
+
+class ExamManifestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 3)
+
+    def test_contents(self):
+        manifest = get_exam_manifest(self.exam.id)
+        questions = list(self.exam.questions.order_by('id'))
+        self.assertEqual(manifest.question_ids, [question.id for question in questions])
+        self.assertEqual(manifest.correct_choice_ids, set(Choice.objects.filter(is_correct=True).values_list('id', flat=True)))
+        self.assertEqual(manifest.page_number(questions[2].id), 3)
+        wrong = questions[0].choices.get(is_correct=False)
+        self.assertTrue(manifest.has_choice(questions[0].id, wrong.id))
+        self.assertFalse(manifest.has_choice(questions[1].id, wrong.id))
+
+    def test_cached_until_version_bump(self):
+        get_exam_manifest(self.exam.id)
+        with self.assertNumQueries(0):
+            manifest = get_exam_manifest(self.exam.id)
+        Question.objects.create(exam=self.exam, question_text='Added')
+        self.assertEqual(len(get_exam_manifest(self.exam.id)), len(manifest))
+
+        bump_manifest_version(self.exam.id)
+        self.assertEqual(len(get_exam_manifest(self.exam.id)), len(manifest) + 1)
+
+    def test_orm_edits_bump_the_version_once_committed(self):
+        # As the admin edits them, without calling bump_manifest_version
+        question = self.exam.questions.order_by('id').first()
+        right = question.choices.get(is_correct=True)
+        get_exam_manifest(self.exam.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            right.choice_text = 'Edited'
+            right.save()
+        self.assertEqual(get_exam_manifest(self.exam.id).question(question.id)['correct_answer']['choice_text'], 'Edited')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            question.delete()
+        self.assertEqual(len(get_exam_manifest(self.exam.id)), 2)
+
+
+class AnswerExamFlowTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+        self.exam = make_exam(self.teacher, 3)
+        self.questions = list(self.exam.questions.order_by('id'))
+        self.client.force_login(self.student)
+
+    def test_answer_and_submit(self):
+        url = reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['unanswered_question_ids'], [question.id for question in self.questions])
+
+        right = self.questions[0].choices.get(is_correct=True)
+        response = self.client.post(url, {f'question_{self.questions[0].id}': right.id, 'next': ''})
+        self.assertRedirects(response, reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 2}), fetch_redirect_response=False)
+
+        # A choice from another question is ignored
+        url = reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 2})
+        self.client.get(url)
+        self.client.post(url, {f'question_{self.questions[1].id}': right.id, 'next': ''})
+        self.assertIsNone(UserAnswer.objects.get(user=self.student, question=self.questions[1]).choice_id)
+
+        url = reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 3})
+        response = self.client.get(url)
+        self.assertEqual(response.context['first_unanswered_page_number'], 2)
+        wrong = self.questions[2].choices.get(is_correct=False)
+        response = self.client.post(url, {f'question_{self.questions[2].id}': wrong.id, 'submit': 'Submit', 'remaining_time': 100})
+
+        exam_result = ExamResult.objects.get(user=self.student, exam=self.exam)
+        self.assertRedirects(response, reverse('student_view_results', kwargs={'exam_result_id': exam_result.pk}), fetch_redirect_response=False)
+        self.assertEqual((exam_result.score, exam_result.incorrect_answers, exam_result.unanswered_questions), (1, 1, 1))
+
+        response = self.client.get(reverse('student_view_results', kwargs={'exam_result_id': exam_result.pk}))
+        self.assertContains(response, 'Your answer: Right')
+        self.assertContains(response, 'Question not answered')
+
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('teacher_view_exam_result', kwargs={'exam_result_id': exam_result.pk}))
+        self.assertContains(response, 'Your answer: Wrong')
+
+
+class ResultSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+        self.exam = make_exam(self.teacher, 3)
+        self.questions = list(self.exam.questions.order_by('id'))
+        right = self.questions[0].choices.get(is_correct=True)
+        UserAnswer.objects.create(user=self.student, question=self.questions[0], choice=right, time_spent=datetime.timedelta(seconds=42))
+        self.client.force_login(self.student)
+        self.client.get(reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 3}))
+        self.client.post(reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 3}), {'submit': 'Submit', 'remaining_time': 100})
+        self.exam_result = ExamResult.objects.get(user=self.student, exam=self.exam)
+
+    def test_snapshot_written_at_submit(self):
+        rows = self.exam_result.snapshot['questions']
+        self.assertEqual([row[0] for row in rows], [question.id for question in self.questions])
+        self.assertEqual(rows[0][1:4], ['Question 0', self.questions[0].choices.get(is_correct=True).id, 'Right'])
+        self.assertEqual((rows[0][6], rows[0][7]), (1, 42))
+        self.assertEqual((rows[1][2], rows[1][6]), (None, 0))
+
+    def test_result_pages_render_from_snapshot(self):
+        # Later edits to the exam do not change the graded paper
+        Question.objects.filter(pk=self.questions[0].pk).update(question_text='Edited')
+        Choice.objects.filter(question=self.questions[0], is_correct=True).update(choice_text='Edited')
+        bump_manifest_version(self.exam.id)
+
+        url = reverse('student_view_results', kwargs={'exam_result_id': self.exam_result.pk})
+        self.client.get(url)
+        # Session, user and the result itself
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, 'Question 0')
+        self.assertContains(response, 'Your answer: Right')
+        self.assertNotContains(response, 'Edited')
+
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('teacher_view_exam_result', kwargs={'exam_result_id': self.exam_result.pk}))
+        self.assertContains(response, 'Your answer: Right')
+
+    def test_result_pages_show_visits(self):
+        UserAnswer.objects.filter(user=self.student, question=self.questions[0]).update(visit_count=2)
+        self.client.force_login(self.teacher)
+        for name in ('results', 'teacher_view_exam_result'):
+            response = self.client.get(reverse(name, kwargs={'exam_result_id': self.exam_result.pk}))
+            self.assertEqual([answer['visit_count'] for answer in response.context['user_answers']], [2, 0, 1])
+
+    def test_results_graded_before_snapshots_are_backfilled(self):
+        ExamResult.objects.filter(pk=self.exam_result.pk).update(snapshot=None)
+        response = self.client.get(reverse('student_view_results', kwargs={'exam_result_id': self.exam_result.pk}))
+        self.assertContains(response, 'Your answer: Right')
+        self.assertIsNotNone(ExamResult.objects.get(pk=self.exam_result.pk).snapshot)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class HotPathIndexTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 1)
+        self.question = self.exam.questions.get()
+
+    def assertUsesIndex(self, queryset, lookup):
+        plan = queryset.explain()
+        self.assertIn('USING INDEX', plan)
+        self.assertIn(lookup, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_exam_result_lookup(self):
+        self.assertUsesIndex(ExamResult.objects.filter(user=self.teacher, exam=self.exam), '(user_id=? AND exam_id=?)')
+
+    def test_user_answer_lookup(self):
+        self.assertUsesIndex(UserAnswer.objects.filter(user=self.teacher, question=self.question), '(user_id=? AND question_id=?)')
+
+    def test_answer_intervals_in_order(self):
+        self.assertUsesIndex(AnswerInterval.objects.filter(useranswer_id=1).order_by('start_time'), '(useranswer_id=?)')
+
+    def test_duplicate_answers_rejected(self):
+        UserAnswer.objects.create(user=self.teacher, question=self.question)
+        with self.assertRaises(IntegrityError):
+            UserAnswer.objects.create(user=self.teacher, question=self.question)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.course = Course.objects.create(name='Biology', description='Cells and genetics', teacher=self.teacher)
+        self.other_course = Course.objects.create(name='Physics', description='Forces', teacher=self.teacher)
+        self.exam = Exam.objects.create(name='Midterm', description='Photosynthesis', course=self.course)
+        self.other_exam = Exam.objects.create(name='Midterm', description='Newton', course=self.other_course)
+        self.client.force_login(self.teacher)
+
+    def test_index_follows_saves_and_deletes(self):
+        question = Question.objects.create(exam=self.exam, question_text='What does mitochondria produce?')
+        self.assertEqual(list(search(Question.objects.all(), 'mitochond')), [question])
+
+        question.question_text = 'What does a ribosome build?'
+        question.save()
+        self.assertFalse(search(Question.objects.all(), 'mitochondria').exists())
+        self.assertEqual(list(search(Question.objects.all(), 'ribosome')), [question])
+
+        question.delete()
+        self.assertFalse(SearchEntry.objects.filter(kind='question').exists())
+
+    def test_exams_found_by_renamed_course(self):
+        self.course.name = 'Botany'
+        self.course.save()
+        self.assertEqual(list(search(Exam.objects.all(), 'botany')), [self.exam])
+
+    def test_ranked_results(self):
+        Question.objects.create(exam=self.exam, question_text='Cell wall')
+        best = Question.objects.create(exam=self.exam, question_text='Cell cell cell')
+        self.assertEqual(search(Question.objects.all(), 'cell').first(), best)
+
+    def test_exam_list_filters_by_course(self):
+        response = self.client.get(reverse('teacher_exam_list', kwargs={'course_id': self.course.id}), {'search': 'midterm'})
+        self.assertEqual(list(response.context['exams']), [self.exam])
+
+    def test_question_list_matches_substrings(self):
+        question = Question.objects.create(exam=self.exam, question_text='What does mitochondria produce?')
+        Question.objects.create(exam=self.other_exam, question_text='What does mitochondria produce?')
+        response = self.client.get(reverse('question_list', kwargs={'exam_id': self.exam.id}), {'search': 'chondria prod'})
+        self.assertEqual(list(response.context['questions']), [question])
+
+    def test_mysql_matches_unindexed_words_with_like(self):
+        # Only the SQL is built here; stopwords and short words would match nothing as +term*
+        sql, params = MySQLFulltextBackend().search(Question.objects.all(), 'the cell ab').query.sql_with_params()
+        self.assertIn('+cell*', params)
+        self.assertNotIn('+the*', ' '.join(str(param) for param in params))
+        self.assertIn('%the%', params)
+        self.assertIn('%ab%', params)
+        sql, params = MySQLFulltextBackend().search(Question.objects.all(), 'of ab').query.sql_with_params()
+        self.assertNotIn('MATCH', sql)
+        self.assertIn('%of ab%', params)
+
+    def test_rebuild_search_index(self):
+        SearchEntry.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(list(search(Course.objects.all(), 'genetics')), [self.course])
+
+    def test_bench_search(self):
+        out = StringIO()
+        with in_this_test_database():
+            call_command('bench_search', questions=30, questions_per_exam=10, vocabulary=50, searches=3, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['questions'], 30)
+        self.assertEqual(sorted(report['exam']), ['index', 'like'])
+        self.assertEqual(sorted(report['all']['index']), ['max_ms', 'mean_rows', 'p50_ms'])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.course = Course.objects.create(name='Course', description='Course', teacher=self.teacher)
+        self.exams = [Exam.objects.create(name=f'Exam {i}', description='Weekly quiz', course=self.course) for i in range(7)]
+        self.client.force_login(self.teacher)
+
+    def walk(self, paginator):
+        page = paginator.page()
+        pages = [[exam.name for exam in page]]
+        while page.has_next():
+            page = paginator.page(page.next_token())
+            pages.append([exam.name for exam in page])
+        return page, pages
+
+    def test_forward_and_back(self):
+        paginator = KeysetPaginator(Exam.objects.all(), ['-pk'], per_page=3)
+        page, pages = self.walk(paginator)
+        self.assertEqual(pages, [['Exam 6', 'Exam 5', 'Exam 4'], ['Exam 3', 'Exam 2', 'Exam 1'], ['Exam 0']])
+
+        page = paginator.page(page.previous_token())
+        self.assertEqual([exam.name for exam in page], ['Exam 3', 'Exam 2', 'Exam 1'])
+        page = paginator.page(page.previous_token())
+        self.assertEqual([exam.name for exam in page], ['Exam 6', 'Exam 5', 'Exam 4'])
+        self.assertFalse(page.has_previous())
+
+    def test_deep_pages_skip_count_and_offset(self):
+        paginator = KeysetPaginator(Exam.objects.all(), ['-pk'], per_page=2)
+        token = paginator.page(paginator.page().next_token()).next_token()
+        with CaptureQueriesContext(connection) as context:
+            list(paginator.page(token))
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('OFFSET', context.captured_queries[0]['sql'])
+        self.assertNotIn('COUNT', context.captured_queries[0]['sql'])
+
+    def test_search_results_paginate_by_rank(self):
+        Exam.objects.filter(pk=self.exams[2].pk).update(description='Quiz quiz quiz')
+        index_objects(Exam.objects.select_related('course'))
+        _, pages = self.walk(KeysetPaginator(search(Exam.objects.all(), 'quiz'), search_ordering('quiz', '-pk'), per_page=3))
+        self.assertEqual(pages[0][0], 'Exam 2')
+        self.assertEqual(sorted(sum(pages, [])), sorted(exam.name for exam in self.exams))
+
+    def test_page_size_is_capped_and_tokens_are_opaque(self):
+        response = self.client.get(reverse('teacher_exam_list', kwargs={'course_id': self.course.id}), {'per_page': 1000000, 'exam_page': 'garbage'})
+        self.assertEqual(response.context['per_page'], MAX_PAGE_SIZE)
+        self.assertEqual(len(response.context['exams']), len(self.exams))
+
+        response = self.client.get(reverse('teacher_exam_list', kwargs={'course_id': self.course.id}), {'per_page': 5})
+        self.assertTrue(response.context['exams'].has_next())
+        self.assertContains(response, 'exam_page=')
+
+
+class UserRoleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('teacher', password='secret')
+        self.user.groups.add(Group.objects.get_or_create(name='Teacher')[0])
+        self.client.force_login(self.user)
+
+    def test_page_render_runs_no_group_queries(self):
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('home'))
+        self.assertTrue(response.context['is_teacher'])
+        self.assertFalse([query for query in context.captured_queries if 'auth_group' in query['sql']])
+
+    def test_membership_change_invalidates_cached_role(self):
+        self.client.get(reverse('home'))
+        self.user.groups.clear()
+        Group.objects.get_or_create(name='Student')[0].user_set.add(self.user)
+        response = self.client.get(reverse('home'))
+        self.assertFalse(response.context['is_teacher'])
+        self.assertTrue(response.context['is_student'])
+
+    def test_deploy_check_requires_a_shared_cache(self):
+        # Role versions in a per-process cache would not reach other workers
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['main.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_create_course_requires_teacher_role(self):
+        self.client.post(reverse('teacher_course'), {'name': 'Algebra', 'description': 'Algebra'})
+        self.assertTrue(Course.objects.filter(name='Algebra', teacher=self.user).exists())
+
+
+class RequestInstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        stats_registry.reset()
+        self.teacher = User.objects.create_user('teacher', password='secret', is_staff=True)
+        self.exam = make_exam(self.teacher, 3)
+        for i in range(5):
+            Exam.objects.create(name=f'Exam {i}', description='', course=self.exam.course, duration=datetime.timedelta(minutes=30))
+        self.client.force_login(self.teacher)
+
+    def instrumented(self, **kwargs):
+        middleware = ['main.middleware.instrumentation.RequestInstrumentationMiddleware', *settings.MIDDLEWARE]
+        return override_settings(MIDDLEWARE=middleware, QUERY_BUDGETS_RAISE=True, REQUEST_INSTRUMENTATION_LOG=False, **kwargs)
+
+    def test_list_pages_stay_within_budget(self):
+        with self.instrumented():
+            self.client.get(reverse('teacher_exam_list', kwargs={'course_id': self.exam.course_id}))
+            self.client.get(reverse('question_list', kwargs={'exam_id': self.exam.id}))
+            self.client.get(reverse('exam_results', kwargs={'exam_id': self.exam.id}))
+        stats = stats_registry.snapshot()
+        self.assertEqual(stats['teacher_exam_list']['requests'], 1)
+        self.assertEqual(stats['teacher_exam_list']['over_budget'], 0)
+        # The course of every exam on the page comes from one join
+        self.assertFalse(stats['teacher_exam_list']['duplicate_queries'])
+
+    def test_over_budget_raises(self):
+        with self.instrumented(), mock.patch.object(views.home, 'query_budget', 0, create=True):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs('django.request', 'ERROR'):
+                self.client.get(reverse('home'))
+        self.assertEqual(stats_registry.snapshot()['home']['over_budget'], 1)
+
+    def test_fingerprint_collapses_in_lists(self):
+        self.assertEqual(fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)'), fingerprint('SELECT 1 WHERE id IN (%s)'))
+
+    def test_stats_endpoint_is_staff_only(self):
+        # A client of its own, so the instrumented middleware chain is not reused below
+        client = Client()
+        client.force_login(self.teacher)
+        with self.instrumented():
+            client.get(reverse('home'))
+        response = self.client.get(reverse('instrumentation_stats'))
+        self.assertEqual(response.json()['home']['requests'], 1)
+
+        self.client.post(reverse('instrumentation_stats'), {'reset': '1'})
+        self.assertNotIn('home', self.client.get(reverse('instrumentation_stats')).json())
+
+        self.client.force_login(User.objects.create_user('student', password='secret'))
+        self.assertEqual(self.client.get(reverse('instrumentation_stats')).status_code, 302)
+
+
+class SeedDataTests(TestCase):
+    def test_seed_data(self):
+        call_command('seed_data', teachers=1, courses=2, exams=2, questions=3, students=4, started=1, submitted=0.5, stdout=StringIO())
+        self.assertEqual(Course.objects.filter(teacher__username='seed-teacher-0').count(), 2)
+        self.assertEqual(Question.objects.filter(exam__course__teacher__username='seed-teacher-0').count(), 12)
+        self.assertEqual(ExamAttempt.objects.count(), 16)
+        # Every question has exactly one correct choice
+        self.assertEqual(Choice.objects.filter(is_correct=True).count(), 12)
+        self.assertTrue(UserAnswer.objects.exists())
+        self.assertTrue(ExamResult.objects.filter(snapshot__isnull=False).exists())
+        self.assertTrue(User.objects.get(username='seed-student-0').groups.filter(name='Student').exists())
+        self.assertEqual(search(Exam.objects.all(), 'seed').count(), 4)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_data', stdout=StringIO())
+
+
+class LoadExamStartTests(TransactionTestCase):
+    def test_small_storm(self):
+        request_logger = logging.getLogger('django.request')
+        self.addCleanup(request_logger.setLevel, request_logger.level)
+        out = StringIO()
+        with in_this_test_database(), mock.patch.dict(connection.settings_dict['TEST']):
+            # One student, as concurrent writers on the shared in-memory database fail with table locks
+            call_command('load_exam_start', students=1, questions=2, ramp=0, think=0, stdout=out)
+            if connection.vendor == 'sqlite':
+                # The command points the throwaway database at a temporary file it left unused here
+                os.remove(connection.settings_dict['TEST']['NAME'])
+        report = json.loads(out.getvalue())
+        self.assertEqual((report['mode'], report['students'], report['questions']), ('in-process', 1, 2))
+        self.assertEqual(report['completed_students'], 1)
+        self.assertEqual(report['errors']['total'], 0)
+        self.assertEqual(sorted(report['steps']), ['answer', 'navigate', 'results', 'save_answer', 'start', 'submit'])
+        self.assertIn('UPDATE main_useranswer', report['lock_contention']['statements'])
+
+
+class QuestionImportTests(TestCase):
+    CSV = (
+        'question_text,choice_1,choice_2,choice_3,correct,explanation_video\n'
+        'What is 2 + 2?,3,4,5,2,\n'
+        'Pick the primes,2,4,7,"1,3",https://example.com/primes\n'
+        'No answer,a,b,,,\n'
+        'One choice,a,,,1,\n'
+        'Bad link,a,b,,1,not a url\n'
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.teacher.groups.add(Group.objects.get_or_create(name='Teacher')[0])
+        self.exam = make_exam(self.teacher, 0)
+
+    def test_csv_reports_bad_rows_and_imports_the_rest(self):
+        report = import_questions(self.exam, StringIO(self.CSV), 'csv', batch_size=2)
+        self.assertEqual((report['rows'], report['created']), (5, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 5])
+        self.assertIn('At least one choice must be marked as correct.', report['errors'][0]['errors'])
+        primes = Question.objects.get(exam=self.exam, question_text='Pick the primes')
+        self.assertEqual(sorted(primes.choices.filter(is_correct=True).values_list('choice_text', flat=True)), ['2', '7'])
+        self.assertEqual(search(Question.objects.all(), 'primes').get(), primes)
+
+        # Importing the same file again only reports duplicates
+        report = import_questions(self.exam, StringIO(self.CSV), 'csv')
+        self.assertEqual(report['created'], 0)
+        self.assertIn('The exam already has this question.', report['errors'][0]['errors'])
+
+    def test_json_is_decoded_in_chunks(self):
+        rows = [
+            {'question_text': f'Question {i}', 'choices': [{'text': 'Right', 'is_correct': True}, {'text': 'Wrong', 'is_correct': 'false'}]}
+            for i in range(5)
+        ]
+        with mock.patch('main.importer._JSON_READ_SIZE', 7):
+            report = import_questions(self.exam, StringIO(json.dumps(rows)), 'json')
+            self.assertEqual(report['created'], 5)
+            report = import_questions(make_exam(self.teacher, 0), StringIO('\n'.join(json.dumps(row) for row in rows) + '\n{"question'), 'json')
+        self.assertEqual(report['created'], 5)
+        self.assertIn('Could not parse the file', report['errors'][0]['errors'][0])
+        self.assertEqual(Choice.objects.filter(question__exam=self.exam, is_correct=True).count(), 5)
+
+    def test_yaml_documents(self):
+        bank = 'question_text: First\nchoices:\n- {text: A, is_correct: true}\n- B\n---\n- question_text: Second\n  choices: [{text: A}, {text: B, is_correct: yes}]\n'
+        report = import_questions(self.exam, StringIO(bank), 'yaml')
+        self.assertEqual((report['created'], report['errors']), (2, []))
+
+        # Items of a list are read one at a time, so those before a malformed one are kept
+        bank = '- question_text: Third\n  choices: [{text: A, is_correct: true}, B]\n- question_text: [\n'
+        report = import_questions(self.exam, StringIO(bank), 'yaml')
+        self.assertEqual(report['created'], 1)
+        self.assertIn('Could not parse the file', report['errors'][0]['errors'][0])
+
+    def test_json_lines_report_bad_lines(self):
+        row = {'choices': [{'text': 'Right', 'is_correct': True}, 'Wrong']}
+        lines = [json.dumps({**row, 'question_text': 'First'}), '{"question_text": ', '', json.dumps({**row, 'question_text': 'Third'}), json.dumps({**row, 'question_text': 'Fourth'})]
+        report = import_questions(self.exam, StringIO('\n'.join(lines)), detect_format('bank.jsonl'))
+        self.assertEqual((report['rows'], report['created']), (4, 3))
+        self.assertEqual([error['row'] for error in report['errors']], [2])
+        self.assertIn('Could not parse the line', report['errors'][0]['errors'][0])
+
+    def test_upload_view_and_command(self):
+        self.client.force_login(self.teacher)
+        url = reverse('import_questions', kwargs={'exam_id': self.exam.id})
+        response = self.client.post(url, {'file': SimpleUploadedFile('bank.csv', ('\ufeff' + self.CSV).encode())})
+        self.assertContains(response, 'Imported 2 of 5 questions')
+        self.assertContains(response, 'A question needs at least two choices.')
+
+        other = make_exam(User.objects.create_user('other', password='secret'), 0)
+        # Another teacher's exam is not found, which the app turns into a redirect home
+        self.assertRedirects(self.client.get(reverse('import_questions', kwargs={'exam_id': other.id})), reverse('home'), fetch_redirect_response=False)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as bank:
+            bank.write(self.CSV)
+        self.addCleanup(os.remove, bank.name)
+        out = StringIO()
+        call_command('import_questions', other.id, bank.name, stdout=out, stderr=StringIO())
+        self.assertIn('Done: 2 of 5 questions imported', out.getvalue())
+
+
+class CSVExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.other_exam = Exam.objects.create(name='=Final', description='', course=self.exam.course)
+        questions = list(self.exam.questions.order_by('id'))
+        for username, picks in [('ann', [True, True]), ('ben', [True, False])]:
+            student = User.objects.create_user(username, password='secret', first_name='@' + username)
+            for question, correct in zip(questions, picks):
+                UserAnswer.objects.create(user=student, question=question, choice=question.choices.get(is_correct=correct))
+            submit_exam(self.exam, student, ExamAttempt.start(student, self.exam))
+        self.client.force_login(self.teacher)
+
+    def rows(self, response):
+        self.assertTrue(response.streaming)
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+    def test_exam_results(self):
+        response = self.client.get(reverse('exam_results_csv', kwargs={'exam_id': self.exam.id}))
+        self.assertIn('attachment', response['Content-Disposition'])
+        rows = self.rows(response)
+        self.assertEqual([row[:2] + row[4:5] for row in rows[1:]], [['ann', "'@ann", '2'], ['ben', "'@ben", '1']])
+
+    def test_course_gradebook(self):
+        rows = self.rows(self.client.get(reverse('course_gradebook_csv', kwargs={'course_id': self.exam.course_id})))
+        self.assertEqual(rows[0][4:], ['Exam (%)', "'=Final (%)", 'Average (%)'])
+        self.assertEqual(rows[2][4:], ['50.0', '', '50.0'])
+
+    def test_course_gradebook_leaves_out_deleted_exams(self):
+        deleted = Exam.objects.create(name='Deleted', description='', course=self.exam.course)
+        ExamResult.objects.create(exam=deleted, user=User.objects.get(username='ann'), score=1, total_questions=1, percentage=100)
+        delete_later(deleted, self.teacher)
+        rows = self.rows(self.client.get(reverse('course_gradebook_csv', kwargs={'course_id': self.exam.course_id})))
+        self.assertEqual(rows[0][4:], ['Exam (%)', "'=Final (%)", 'Average (%)'])
+        self.assertEqual(rows[1][4:], ['100.0', '', '100.0'])
+        response = self.client.get(reverse('teacher_student_exams', kwargs={'student_id': User.objects.get(username='ann').pk}))
+        self.assertEqual(list(response.context['exam_results'].values_list('exam__name', flat=True)), ['Exam'])
+
+    def test_answer_matrix(self):
+        # Session, user, exam and a single streamed query for every answer
+        with self.assertNumQueries(4):
+            rows = self.rows(self.client.get(reverse('exam_answers_csv', kwargs={'exam_id': self.exam.id})))
+        self.assertEqual(rows[1], ['Answer key', '', '', 'Right', 'Right', '2'])
+        self.assertEqual(rows[3], ['ben', "'@ben", '', 'Right', 'Wrong', '1'])
+
+    def test_only_the_course_teacher_can_export(self):
+        self.client.force_login(User.objects.create_user('other', password='secret'))
+        response = self.client.get(reverse('exam_results_csv', kwargs={'exam_id': self.exam.id}))
+        self.assertFalse(response.streaming)
+
+
+class CourseGradebookTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.other_exam = Exam.objects.create(name='Final', description='', course=self.exam.course)
+        self.students = [User.objects.create_user(f's{i}', password='secret', last_name=name) for i, name in enumerate('CAB')]
+        for student, percentage in zip(self.students, [100, 50, 0]):
+            ExamResult.objects.create(exam=self.exam, user=student, score=0, total_questions=2, percentage=percentage, submitted=True)
+        ExamResult.objects.create(exam=self.other_exam, user=self.students[1], score=0, total_questions=0, percentage=70, submitted=True, time_up=True)
+
+    def test_rows_from_one_query(self):
+        exams = [self.exam, self.other_exam]
+        with self.assertNumQueries(1):
+            rows = gradebook_rows(exams, self.students)
+        self.assertEqual([row['average'] for row in rows], [100, 60, 0])
+        self.assertEqual(rows[1]['cells'][1], {'percentage': 70, 'submitted': True, 'time_up': True})
+        self.assertIsNone(rows[0]['cells'][1])
+
+    def test_page(self):
+        self.client.force_login(self.teacher)
+        url = reverse('course_gradebook', kwargs={'course_id': self.exam.course_id})
+        response = self.client.get(url, {'per_page': 2})
+        self.assertEqual([row['student'].last_name for row in response.context['rows']], ['A', 'B'])
+        response = self.client.get(url, {'per_page': 2, 'page': response.context['page'].next_token()})
+        self.assertEqual([row['student'].last_name for row in response.context['rows']], ['C'])
+        self.client.force_login(User.objects.create_user('other', password='secret'))
+        self.assertRedirects(self.client.get(url), reverse('home'), fetch_redirect_response=False)
+
+
+class QuestionEditingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 1)
+        self.question = self.exam.questions.get()
+        self.right, self.wrong = self.question.choices.order_by('-is_correct')
+        self.client.force_login(self.teacher)
+        self.url = reverse('edit_question', kwargs={'exam_id': self.exam.id, 'question_id': self.question.id})
+
+    def post(self, rows, **extra):
+        data = {
+            'question_text': 'Edited',
+            'choice_text[]': [text for choice_id, text, correct in rows],
+            'choice_id[]': [choice_id or '' for choice_id, text, correct in rows],
+            'is_correct[]': ['on' if correct else '' for choice_id, text, correct in rows],
+            **extra,
+        }
+        return self.client.post(self.url, data)
+
+    def test_edit(self):
+        response = self.post(
+            [(self.right.id, 'Right', False), (self.wrong.id, 'Now right', True), (None, 'New', False)],
+            **{f'delete_choice_{self.right.id}': ''},
+        )
+        self.assertRedirects(response, reverse('question_list', kwargs={'exam_id': self.exam.id}), fetch_redirect_response=False)
+        self.assertEqual(
+            list(self.question.choices.order_by('pk').values_list('choice_text', 'is_correct')),
+            [('Now right', True), ('New', False)],
+        )
+        self.assertEqual(get_exam_manifest(self.exam.id).question(self.question.id)['question_text'], 'Edited')
+
+    def test_choice_deleted_from_the_page_keeps_other_answers(self):
+        # The page deletes a choice by AJAX and still submits the other rows
+        other = self.question.choices.create(choice_text='Other', is_correct=False)
+        student = User.objects.create_user('student', password='secret')
+        UserAnswer.objects.create(user=student, question=self.question, choice=other)
+        self.client.post(reverse('delete_choice', kwargs={'choice_id': self.wrong.id}), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+        self.post([(self.right.id, 'Right', True), (other.id, 'Other', True)])
+        self.assertEqual(
+            list(self.question.choices.order_by('pk').values_list('pk', 'is_correct')),
+            [(self.right.id, True), (other.id, True)],
+        )
+        self.assertTrue(UserAnswer.objects.filter(user=student, choice=other).exists())
+
+        # Choices without a row are only removed by their delete button
+        self.post([(self.right.id, 'Right', True)])
+        self.assertTrue(self.question.choices.filter(pk=other.pk).exists())
+
+    def test_query_count_does_not_grow_with_choices(self):
+        def queries(new_choices):
+            # Every existing choice is updated and new ones are added
+            rows = [(choice.id, f'{choice.choice_text}!', choice.is_correct) for choice in self.question.choices.all()]
+            rows += [(None, f'New {i}', False) for i in range(new_choices)]
+            with CaptureQueriesContext(connection) as context:
+                self.post(rows)
+            return len(context)
+
+        self.assertEqual(queries(1), queries(10))
+
+    def test_no_correct_choice_saves_nothing(self):
+        response = self.post([(self.right.id, 'Right', False), (self.wrong.id, 'Wrong', False)])
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.question_text, 'Question 0')
+        self.assertTrue(self.question.choices.get(pk=self.right.id).is_correct)
+
+    def test_create(self):
+        url = reverse('create_question', kwargs={'exam_id': self.exam.id})
+        self.client.post(url, {'question_text': 'Empty', 'choice_text[]': ['A', 'B']})
+        self.assertFalse(Question.objects.filter(question_text='Empty').exists())
+        self.client.post(url, {'question_text': 'New', 'choice_text[]': ['A', 'B'], 'is_correct[]': ['', 'on']})
+        question = Question.objects.get(question_text='New')
+        self.assertEqual(list(question.choices.order_by('pk').values_list('choice_text', 'is_correct')), [('A', False), ('B', True)])
+
+
+class ExamCloneTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 3)
+        self.exam.questions.update(explanation_video='https://example.com/video', explanation_image='explanations/a.png')
+
+    def test_clone(self):
+        other = Course.objects.create(name='Next term', description='', teacher=self.teacher)
+        # Savepoint, the exam and its index entry, reading and inserting questions and
+        # choices, indexing the questions; independent of the number of questions
+        with self.assertNumQueries(11):
+            copy = clone_exam(self.exam, other)
+        self.assertEqual((copy.name, copy.course, copy.duration), ('Exam', other, self.exam.duration))
+        self.assertNotEqual(copy.exam_hash, self.exam.exam_hash)
+        self.assertEqual(
+            list(Choice.objects.filter(question__exam=copy).order_by('pk').values_list('question__question_text', 'choice_text', 'is_correct')),
+            list(Choice.objects.filter(question__exam=self.exam).order_by('pk').values_list('question__question_text', 'choice_text', 'is_correct')),
+        )
+        question = copy.questions.order_by('pk').first()
+        self.assertEqual((question.explanation_video, question.explanation_image.name), ('https://example.com/video', 'explanations/a.png'))
+        self.assertEqual(search(Question.objects.all(), 'Question').count(), 6)
+
+    def test_page(self):
+        self.client.force_login(self.teacher)
+        url = reverse('exam_duplicate', kwargs={'id': self.exam.id})
+        self.assertContains(self.client.get(url), 'value="Exam (copy)"')
+        self.client.post(url, {'course': self.exam.course_id, 'name': 'Exam (copy)'})
+        self.assertEqual(Question.objects.filter(exam__name='Exam (copy)', exam__course=self.exam.course).count(), 3)
+        self.client.force_login(User.objects.create_user('other', password='secret'))
+        self.assertRedirects(self.client.get(url), reverse('home'), fetch_redirect_response=False)
+
+    def test_command(self):
+        call_command('copy_course_exams', self.exam.course_id, '--new-course', 'Next term', stdout=StringIO())
+        copy = Exam.objects.get(course__name='Next term')
+        self.assertEqual((copy.name, copy.course.teacher, copy.questions.count()), ('Exam', self.teacher, 3))
+
+
+class PurgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.kept = Exam.objects.create(name='Kept', description='', course=self.exam.course)
+        Question.objects.create(exam=self.kept, question_text='Kept question')
+        student = User.objects.create_user('student', password='secret')
+        for question in self.exam.questions.all():
+            answer = UserAnswer.objects.create(user=student, question=question, choice=question.choices.first())
+            AnswerInterval.objects.create(useranswer=answer, start_time=timezone.now())
+        submit_exam(self.exam, student, ExamAttempt.start(student, self.exam))
+        self.client.force_login(self.teacher)
+
+    def assertPurged(self, exam_ids):
+        self.assertFalse(Exam.all_objects.filter(pk__in=exam_ids).exists())
+        for model in (Question, ExamResult, ExamAttempt, ExamStats):
+            self.assertFalse(model.objects.filter(exam_id__in=exam_ids).exists(), model)
+        self.assertFalse(Choice.objects.filter(question__exam_id__in=exam_ids).exists())
+        self.assertFalse(UserAnswer.objects.filter(question__exam_id__in=exam_ids).exists())
+        self.assertFalse(AnswerInterval.objects.exists())
+        self.assertFalse(SearchEntry.objects.filter(kind='question', body__startswith='Question').exists())
+
+    @override_settings(PURGE_IN_BACKGROUND=False)
+    def test_exam_delete(self):
+        url = reverse('exam_delete', kwargs={'id': self.exam.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url, HTTP_REFERER='/course-list')
+        self.assertPurged([self.exam.id])
+        self.assertTrue(Question.objects.filter(exam=self.kept).exists())
+        response = self.client.get(reverse('purge_status', kwargs={'kind': 'exam', 'id': self.exam.id}))
+        self.assertEqual(
+            {key: response.json()[key] for key in ('status', 'progress', 'total', 'result')},
+            {'status': 'succeeded', 'progress': 3, 'total': 3, 'result': {'kind': 'exam', 'id': self.exam.id}},
+        )
+
+    def test_hidden_until_purged(self):
+        course = self.exam.course
+        self.client.get(reverse('course_delete', kwargs={'id': course.id}), HTTP_REFERER='/course-list')
+        self.assertFalse(Course.objects.filter(pk=course.id).exists())
+        self.assertFalse(Exam.objects.filter(course=course).exists())
+        self.assertEqual(Exam.all_objects.filter(course=course).count(), 2)
+        self.assertEqual(self.client.get(reverse('purge_status', kwargs={'kind': 'course', 'id': course.id})).json()['status'], 'queued')
+        run_pending()
+        self.assertPurged([self.exam.id, self.kept.id])
+        self.assertFalse(Course.all_objects.exists())
+        self.assertFalse(SearchEntry.objects.exists())
+
+    def test_only_the_course_teacher_can_delete(self):
+        self.client.force_login(User.objects.create_user('other', password='secret'))
+        self.client.get(reverse('exam_delete', kwargs={'id': self.exam.id}), HTTP_REFERER='/course-list')
+        self.assertTrue(Exam.objects.filter(pk=self.exam.id).exists())
+
+    def test_bench_delete(self):
+        out = StringIO()
+        with in_this_test_database():
+            call_command('bench_delete', exams=2, questions=2, choices=2, students=3, started=1, submitted=1, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['rows']['exams'], 2)
+        self.assertTrue(report['rows']['answers'])
+        self.assertEqual(report['rows']['answer_intervals'], 2 * report['rows']['answers'])
+        self.assertEqual(sorted(report['purge']), ['peak_memory_mb', 'queries', 'seconds'])
+        self.assertFalse(Course.all_objects.filter(teacher__username__startswith='bench-').exists())
+
+
+@task('test-flaky', max_attempts=2)
+def flaky_task(job, fail):
+    job.set_progress(1, total=2, message='Halfway')
+    if fail:
+        raise RuntimeError('Flaky')
+    return 'ok'
+
+
+class TaskTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('teacher', password='secret')
+
+    def test_run_and_status(self):
+        job = enqueue('test-flaky', user=self.user, fail=False)
+        self.assertEqual(run_pending(), 1)
+        self.client.force_login(self.user)
+        status = self.client.get(reverse('job_status', kwargs={'job_id': job.pk})).json()
+        self.assertEqual(
+            {key: status[key] for key in ('status', 'progress', 'total', 'message', 'result', 'attempts')},
+            {'status': 'succeeded', 'progress': 2, 'total': 2, 'message': 'Halfway', 'result': 'ok', 'attempts': 1},
+        )
+        self.client.force_login(User.objects.create_user('other', password='secret'))
+        self.assertRedirects(self.client.get(reverse('job_status', kwargs={'job_id': job.pk})), reverse('home'), fetch_redirect_response=False)
+
+    @override_settings(TASK_RETRY_DELAY=0)
+    def test_retries_then_fails(self):
+        job = enqueue('test-flaky', fail=True)
+        with self.assertLogs('main.tasks', 'WARNING'):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('RuntimeError: Flaky', job.error)
+
+    def test_idempotency_key(self):
+        first = enqueue('test-flaky', key='once', fail=False)
+        self.assertEqual(enqueue('test-flaky', key='once', fail=True), first)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_claimed_once_and_stale_jobs_requeued(self):
+        job = enqueue('test-flaky', fail=False)
+        self.assertEqual(claim_job('a').pk, job.pk)
+        self.assertIsNone(claim_job('b'))
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(claim_job('b').worker, 'b')
+
+
+class ItemAnalysisTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 3)
+        questions = list(self.exam.questions.order_by('id'))
+        # Correct answers per student; None leaves the question unanswered
+        for username, picks in [('s1', [True, True, True]), ('s2', [True, True, False]), ('s3', [True, False, False]), ('s4', [False, False, None])]:
+            student = User.objects.create_user(username, password='secret')
+            for question, correct in zip(questions, picks):
+                choice = question.choices.get(is_correct=correct) if correct is not None else None
+                UserAnswer.objects.create(user=student, question=question, choice=choice)
+            ExamResult.objects.create(exam=self.exam, user=student, score=sum(filter(None, picks)), total_questions=3)
+        # Answers of a student who never submitted are left out
+        dropout = User.objects.create_user('dropout', password='secret')
+        UserAnswer.objects.create(user=dropout, question=questions[0], choice=questions[0].choices.get(is_correct=False))
+
+    def test_statistics(self):
+        analysis = get_item_analysis(self.exam.id, get_exam_manifest(self.exam.id))
+        self.assertEqual(analysis['students'], 4)
+        self.assertEqual([item['p_value'] for item in analysis['items']], [0.75, 0.5, 0.25])
+        self.assertEqual(analysis['kr20'], 0.75)
+        self.assertEqual(analysis['items'][0]['point_biserial'], 0.522)
+        self.assertEqual([entry['rate'] for entry in analysis['items'][2]['choices']], [0.25, 0.5])
+        self.assertEqual(analysis['items'][2]['unanswered_rate'], 0.25)
+
+    def test_cached_until_a_new_result(self):
+        manifest = get_exam_manifest(self.exam.id)
+        get_item_analysis(self.exam.id, manifest)
+        with self.assertNumQueries(1):
+            get_item_analysis(self.exam.id, manifest)
+        ExamResult.objects.create(exam=self.exam, user=User.objects.get(username='dropout'), score=0, total_questions=3)
+        self.assertEqual(get_item_analysis(self.exam.id, manifest)['students'], 5)
+
+    def test_page(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('exam_results', kwargs={'exam_id': self.exam.id}))
+        self.assertContains(response, reverse('exam_item_analysis', kwargs={'exam_id': self.exam.id}))
+        url = reverse('exam_item_analysis', kwargs={'exam_id': self.exam.id})
+        # The matrix is loaded by a job, never in the request
+        response = self.client.get(url)
+        self.assertContains(response, 'The analysis is being computed')
+        self.client.get(url)
+        self.assertEqual(run_pending(), 1)
+        response = self.client.get(url)
+        self.assertContains(response, 'Reliability (KR-20): 0.75')
+
+        # Until the job for a new submission has run, the previous analysis is shown
+        ExamResult.objects.create(exam=self.exam, user=User.objects.get(username='dropout'), score=0, total_questions=3)
+        response = self.client.get(url)
+        self.assertContains(response, 'below is the previous one')
+        self.assertContains(response, 'Submissions: 4')
+        run_pending()
+        self.assertContains(self.client.get(url), 'Submissions: 5')
+
+    @override_settings(ITEM_ANALYSIS_DELAY=10 ** 9)
+    def test_submissions_queue_one_refresh_per_window(self):
+        for username in ('late1', 'late2'):
+            student = User.objects.create_user(username, password='secret')
+            submit_exam(self.exam, student, ExamAttempt.start(student, self.exam))
+        job = Job.objects.get(task='item_analysis')
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.update(run_at=timezone.now())
+        run_pending()
+        self.assertEqual(get_cached_item_analysis(self.exam.id, get_exam_manifest(self.exam.id))[0]['students'], 6)
+
+    def test_bench_item_analysis(self):
+        out = StringIO()
+        with in_this_test_database():
+            call_command('bench_item_analysis', students=5, questions=3, choices=2, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual((report['students'], report['questions']), (5, 3))
+        self.assertIn('cached_ms', report)
+
+    def test_students_cannot_see_the_answer_key(self):
+        student = User.objects.get(username='s1')
+        student.groups.add(Group.objects.get_or_create(name='Student')[0])
+        self.client.force_login(student)
+        response = self.client.get(reverse('exam_item_analysis', kwargs={'exam_id': self.exam.id}))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+
+class ExamStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 4)
+        questions = list(self.exam.questions.order_by('id'))
+        # 4, 3, 1 and 0 correct answers: 100%, 75%, 25% and 0%
+        for i, correct in enumerate([4, 3, 1, 0]):
+            student = User.objects.create_user(f's{i}', password='secret')
+            for question in questions[:correct]:
+                UserAnswer.objects.create(user=student, question=question, choice=question.choices.get(is_correct=True))
+            submit_exam(self.exam, student, ExamAttempt.start(student, self.exam))
+
+    def test_updated_on_submit(self):
+        stats = ExamStats.objects.get(exam=self.exam)
+        self.assertEqual(stats.count, 4)
+        self.assertEqual(stats.mean, 50)
+        self.assertAlmostEqual(stats.std, 39.528, places=3)
+        self.assertEqual(stats.pass_rate, 50)
+        self.assertEqual(stats.histogram, [1, 0, 1, 0, 0, 0, 0, 1, 0, 1])
+        # The exact median is 50; from the bands the middle falls in the
+        # 20-30% band, which holds the 25% result
+        self.assertEqual(stats.median_estimate, 30)
+        # A second submit returns the first result and is not counted again
+        submit_exam(self.exam, User.objects.get(username='s0'), ExamAttempt.objects.get(user__username='s0', exam=self.exam))
+        self.assertEqual(ExamStats.objects.get(exam=self.exam).count, 4)
+
+    def test_rebuild(self):
+        ExamResult.objects.filter(user__username='s0').delete()
+        stats = rebuild_exam_stats(self.exam.id)
+        self.assertEqual((stats.count, stats.pass_count, stats.percentage_sum), (3, 1, 100))
+        self.assertEqual(stats.histogram, [1, 0, 1, 0, 0, 0, 0, 1, 0, 0])
+        ExamStats.objects.all().delete()
+        call_command('rebuild_exam_stats', stdout=StringIO())
+        self.assertEqual(ExamStats.objects.get(exam=self.exam).count, 3)
+
+    def test_page(self):
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('exam_results', kwargs={'exam_id': self.exam.id}))
+        self.assertContains(response, 'Mean: 50.00%')
+        self.assertContains(response, 'Pass rate: 50.0%')
+        self.assertContains(response, 'Median (est.): 30.0%')
+
+
+class ExamAttemptTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+        self.client.force_login(self.student)
+
+    def test_attempt_replaces_session_state(self):
+        exam = make_exam(self.teacher, 2)
+        question = exam.questions.order_by('id').first()
+        UserAnswer.objects.create(user=self.student, question=question, choice=question.choices.first())
+
+        self.client.get(reverse('answer_exam', kwargs={'exam_id': exam.id, 'page_number': 2}))
+        attempt = ExamAttempt.objects.get(user=self.student, exam=exam)
+        self.assertEqual(attempt.current_position, 2)
+        self.assertEqual(attempt.answered_count, 1)
+        self.assertEqual(attempt.deadline, attempt.started_at + exam.duration)
+        self.assertNotIn('start_time', self.client.session)
+        self.assertNotIn('unanswered_question_ids', self.client.session)
+
+    def test_each_exam_has_its_own_clock(self):
+        first = make_exam(self.teacher, 1, name='First')
+        second = make_exam(self.teacher, 1, name='Second')
+        self.client.get(reverse('answer_exam', kwargs={'exam_id': first.id}))
+        ExamAttempt.objects.filter(exam=first).update(started_at=timezone.now() - datetime.timedelta(minutes=20), deadline=timezone.now() + datetime.timedelta(minutes=10))
+
+        response = self.client.get(reverse('answer_exam', kwargs={'exam_id': second.id}))
+        self.assertGreater(response.context['remaining_time'], 29 * 60)
+        response = self.client.get(reverse('answer_exam', kwargs={'exam_id': first.id}))
+        self.assertLess(response.context['remaining_time'], 11 * 60)
+
+
+class WriteBehindAutosaveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        answer_buffer.flush_interval = None
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.questions = list(self.exam.questions.order_by('id'))
+        self.client.force_login(self.student)
+
+    def tearDown(self):
+        answer_buffer.flush()
+
+    def test_buffer_coalesces_writes(self):
+        buffer = AnswerBuffer()
+        right, wrong = self.questions[0].choices.get(is_correct=True), self.questions[0].choices.get(is_correct=False)
+        UserAnswer.objects.create(user=self.student, question=self.questions[0])
+        for choice in (right, wrong, right):
+            buffer.add(self.student.id, self.questions[0].id, choice.id)
+        buffer.add(self.student.id, self.questions[1].id, None)
+        self.assertEqual(len(buffer), 2)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(UserAnswer.objects.get(question=self.questions[0]).choice_id, right.id)
+        self.assertIsNone(UserAnswer.objects.get(question=self.questions[1]).choice_id)
+
+    def test_timer_flush_cannot_overwrite_a_later_submit_flush(self):
+        buffer = AnswerBuffer()
+        written = {}
+        snapshot_taken = threading.Event()
+        release = threading.Event()
+
+        def upsert(answers):
+            if threading.current_thread().name == 'timer':
+                # The timer flush has its snapshot and is slow to write it
+                snapshot_taken.set()
+                release.wait(5)
+            written.update(answers)
+
+        key = (self.student.id, self.questions[0].id)
+        buffer.add(*key, 1)
+        with mock.patch('main.autosave.upsert_answers', upsert):
+            timer = threading.Thread(target=buffer.flush, name='timer')
+            timer.start()
+            snapshot_taken.wait(5)
+            buffer.add(*key, 2)
+            submit = threading.Thread(target=buffer.flush, args=(self.student.id,), name='submit')
+            submit.start()
+            submit.join(0.1)
+            release.set()
+            timer.join(5)
+            submit.join(5)
+        self.assertEqual(written[key], 2)
+
+    @override_settings(AUTOSAVE_WRITE_BEHIND=True)
+    def test_submit_flushes_buffered_answers(self):
+        right = self.questions[0].choices.get(is_correct=True)
+        self.client.post(reverse('save_answer'), {'exam_id': self.exam.id, 'question_id': self.questions[0].id, 'choice_id': right.id})
+        self.assertFalse(UserAnswer.objects.filter(choice=right).exists())
+
+        # Buffered answers are visible to the student before they reach the database
+        url = reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.context['unanswered_question_ids'], [self.questions[1].id])
+        self.assertEqual(response.context['user_answer'].choice_id, right.id)
+
+        self.client.get(reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 2}))
+        self.client.post(reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 2}), {'submit': 'Submit', 'remaining_time': 100})
+        exam_result = ExamResult.objects.get(user=self.student, exam=self.exam)
+        self.assertEqual((exam_result.score, exam_result.unanswered_questions), (1, 1))
+
+    @override_settings(AUTOSAVE_WRITE_BEHIND=True)
+    def test_answered_count_includes_buffered_answers(self):
+        self.client.get(reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 1}))
+        right = self.questions[0].choices.get(is_correct=True)
+        self.client.post(reverse('save_answer'), {'exam_id': self.exam.id, 'question_id': self.questions[0].id, 'choice_id': right.id})
+        response = self.client.post(reverse('remove_unanswered_question'), {'question_id': self.questions[0].id})
+        self.assertEqual(response.json()['answered_count'], 1)
+        self.assertEqual(ExamAttempt.objects.get(user=self.student, exam=self.exam).answered_count, 1)
+
+        # Missing or malformed ids are not found, which the app turns into a redirect home
+        for data in ({}, {'question_id': 'x'}):
+            response = self.client.post(reverse('remove_unanswered_question'), data)
+            self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_save_answer_rejects_choice_of_another_question(self):
+        wrong_question_choice = self.questions[1].choices.first()
+        response = self.client.post(reverse('save_answer'), {'exam_id': self.exam.id, 'question_id': self.questions[0].id, 'choice_id': wrong_question_choice.id})
+        self.assertNotEqual(response.status_code, 200)
+        self.assertFalse(UserAnswer.objects.exists())
+
+
+class QuestionTimeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.question = self.exam.questions.order_by('id').first()
+        self.client.force_login(self.student)
+
+    def test_visits_accumulate_on_answer(self):
+        url = reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 1})
+        for i in range(2):
+            self.client.get(url)
+            UserAnswer.objects.update(visit_started_at=models.F('visit_started_at') - datetime.timedelta(seconds=30))
+            self.client.post(url, {'next': ''})
+
+        user_answer = UserAnswer.objects.get(user=self.student, question=self.question)
+        self.assertEqual(user_answer.visit_count, 2)
+        self.assertIsNone(user_answer.visit_started_at)
+        self.assertGreaterEqual(user_answer.time_spent, datetime.timedelta(seconds=60))
+        self.assertLess(user_answer.time_spent, datetime.timedelta(seconds=70))
+        self.assertFalse(AnswerInterval.objects.exists())
+
+        # A repeated POST does not count the same visit twice
+        self.client.post(url, {'next': ''})
+        self.assertEqual(UserAnswer.objects.get(pk=user_answer.pk).time_spent, user_answer.time_spent)
+
+    def test_compact_answer_intervals(self):
+        user_answer = UserAnswer.objects.create(user=self.student, question=self.question, time_spent=datetime.timedelta(seconds=5), visit_count=1)
+        start = timezone.now() - datetime.timedelta(hours=1)
+        AnswerInterval.objects.create(useranswer=user_answer, start_time=start, end_time=start + datetime.timedelta(seconds=40))
+        AnswerInterval.objects.create(useranswer=user_answer, start_time=start + datetime.timedelta(minutes=5), end_time=start + datetime.timedelta(minutes=6))
+        AnswerInterval.objects.create(useranswer=user_answer, start_time=start + datetime.timedelta(minutes=10), end_time=None)
+
+        call_command('compact_answer_intervals', batch_size=1, stdout=StringIO())
+        call_command('compact_answer_intervals', stdout=StringIO())
+
+        user_answer.refresh_from_db()
+        self.assertEqual(user_answer.time_spent, datetime.timedelta(seconds=105))
+        self.assertEqual(user_answer.visit_count, 4)
+        self.assertEqual(user_answer.first_visited_at, start)
+        self.assertEqual(user_answer.last_visited_at, start + datetime.timedelta(minutes=10))
+        self.assertFalse(AnswerInterval.objects.exists())
+
+
+class QuestionTimeAggregationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.questions = list(self.exam.questions.order_by('id'))
+        self.students = [User.objects.create_user(f'student{i}', password='secret') for i in range(10)]
+        now = timezone.now()
+        for i, student in enumerate(self.students):
+            for question in self.questions:
+                UserAnswer.objects.create(
+                    user=student, question=question, time_spent=datetime.timedelta(seconds=10 * (i + 1)),
+                    visit_count=2, first_visited_at=now, last_visited_at=now + datetime.timedelta(minutes=1),
+                )
+            ExamResult.objects.create(exam=self.exam, user=student, score=0, total_questions=2)
+
+    def test_result_question_times_in_one_query(self):
+        exam_result = ExamResult.objects.get(user=self.students[2])
+        with self.assertNumQueries(1):
+            times = get_result_question_times(exam_result)
+        self.assertEqual(set(times), {question.id for question in self.questions})
+        self.assertEqual(times[self.questions[0].id]['time_spent'], datetime.timedelta(seconds=30))
+        self.assertEqual(times[self.questions[0].id]['visit_count'], 2)
+
+    def test_time_heatmap(self):
+        # Students who have not submitted are left out
+        UserAnswer.objects.create(user=self.teacher, question=self.questions[0], time_spent=datetime.timedelta(hours=1))
+        manifest = get_exam_manifest(self.exam.id)
+        with self.assertNumQueries(1):
+            heatmap = get_exam_time_heatmap(self.exam, manifest)
+        self.assertEqual(heatmap[0]['students'], 10)
+        self.assertEqual(heatmap[0]['median'], datetime.timedelta(seconds=50))
+        self.assertEqual(heatmap[0]['p90'], datetime.timedelta(seconds=90))
+        self.assertEqual(heatmap[0]['heat'], 1)
+
+        self.client.force_login(self.teacher)
+        response = self.client.get(reverse('exam_time_heatmap', kwargs={'exam_id': self.exam.id}))
+        self.assertContains(response, '1:30')
+
+        # Only the course teacher sees the heatmap
+        self.client.force_login(self.students[0])
+        response = self.client.get(reverse('exam_time_heatmap', kwargs={'exam_id': self.exam.id}))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+
+class ExamConsumerTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.questions = list(self.exam.questions.order_by('id'))
+
+    async def receive(self, communicator, message_type):
+        # Skip countdown ticks until the expected message arrives
+        while True:
+            message = await communicator.receive_json_from(timeout=5)
+            if message['type'] == message_type:
+                return message
+
+    def connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/answer-exam/{self.exam.id}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    def test_answer_navigate_and_submit(self):
+        right = self.questions[1].choices.get(is_correct=True)
+
+        async def run():
+            communicator = self.connect(self.student)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            message = await self.receive(communicator, 'question')
+            self.assertEqual(message['question']['id'], self.questions[0].id)
+            self.assertNotIn('is_correct', message['question']['choices'][0])
+            self.assertEqual(message['unanswered_question_ids'], [question.id for question in self.questions])
+
+            await communicator.send_json_to({'type': 'navigate', 'page': 2})
+            message = await self.receive(communicator, 'question')
+            self.assertEqual(message['question']['id'], self.questions[1].id)
+
+            await communicator.send_json_to({'type': 'answer', 'question_id': self.questions[1].id, 'choice_id': right.id})
+            message = await self.receive(communicator, 'saved')
+            self.assertEqual(message['unanswered_question_ids'], [self.questions[0].id])
+
+            await communicator.send_json_to({'type': 'submit'})
+            message = await self.receive(communicator, 'submitted')
+            await communicator.wait()
+            return message
+
+        message = async_to_sync(run)()
+        exam_result = ExamResult.objects.get(user=self.student, exam=self.exam)
+        self.assertEqual(message['result_url'], reverse('student_view_results', kwargs={'exam_result_id': exam_result.pk}))
+        self.assertEqual((exam_result.score, exam_result.unanswered_questions), (1, 1))
+        self.assertEqual(ExamAttempt.objects.get(user=self.student, exam=self.exam).current_position, 2)
+
+    def test_visits_are_counted_once(self):
+        self.client.force_login(self.student)
+        self.client.get(reverse('answer_exam', kwargs={'exam_id': self.exam.id, 'page_number': 1}))
+
+        async def run():
+            communicator = self.connect(self.student)
+            await communicator.connect()
+            await self.receive(communicator, 'question')
+            # A repeated navigate and a teacher edit stay on the same question
+            await communicator.send_json_to({'type': 'navigate', 'page': 1})
+            await self.receive(communicator, 'question')
+            await communicator.send_input({'type': 'exam_changed'})
+            await self.receive(communicator, 'question')
+            await communicator.send_json_to({'type': 'navigate', 'page': 2})
+            await self.receive(communicator, 'question')
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+        visits = dict(UserAnswer.objects.filter(user=self.student).values_list('question_id', 'visit_count'))
+        self.assertEqual(visits, {self.questions[0].id: 1, self.questions[1].id: 1})
+
+    def test_rejects_anonymous_users(self):
+        async def run():
+            communicator = self.connect(AnonymousUser())
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(run)())
+
+
+class AsyncStudentViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.teacher = User.objects.create_user('teacher', password='secret')
+        self.student = User.objects.create_user('student', password='secret')
+        self.exam = make_exam(self.teacher, 2)
+        self.questions = list(self.exam.questions.order_by('id'))
+
+    def request(self, method, path, user, data=None):
+        request = getattr(self.factory, method)(path, data or {})
+        request.user = user
+        return request
+
+    async def test_answer_exam_page(self):
+        request = self.request('get', '/answer-exam/', self.student)
+        response = await async_views.answer_exam(request, self.exam.id, 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Question 1')
+
+        attempt = await ExamAttempt.objects.aget(user=self.student, exam=self.exam)
+        self.assertEqual(attempt.current_position, 2)
+        user_answer = await UserAnswer.objects.aget(user=self.student, question=self.questions[1])
+        self.assertEqual(user_answer.visit_count, 1)
+
+    async def test_save_answer(self):
+        choice = await self.questions[0].choices.aget(is_correct=True)
+        data = {'exam_id': self.exam.id, 'question_id': self.questions[0].id, 'choice_id': choice.id}
+        response = await async_views.save_answer(self.request('post', '/save-answer/', self.student, data))
+        self.assertEqual(response.status_code, 200)
+        user_answer = await UserAnswer.objects.aget(user=self.student, question=self.questions[0])
+        self.assertEqual(user_answer.choice_id, choice.id)
+
+        await ExamAttempt.astart(self.student, self.exam)
+        response = await async_views.remove_unanswered_question(self.request('post', '/remove-unanswered-question/', self.student, {'question_id': self.questions[0].id}))
+        self.assertContains(response, '"answered_count": 1')
+        for data in ({}, {'question_id': 'x'}):
+            with self.assertRaises(Http404):
+                await async_views.remove_unanswered_question(self.request('post', '/remove-unanswered-question/', self.student, data))
+
+    async def test_login_required(self):
+        response = await async_views.save_answer(self.request('post', '/save-answer/', AnonymousUser()))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,75 @@
+from django.db.models import Max, Min, Sum
+from main.models import ExamResult, UserAnswer
+
+# Percentiles shown on the time heatmap
+HEATMAP_PERCENTILES = {'median': 50, 'p90': 90}
+
+
+def question_time_totals(exam_id, user_id):
+    # Total time, visit count and first and last visit per question for one
+    # student, in a single grouped query over the accumulated answer records.
+    # Legacy AnswerInterval rows are not counted; fold them in first with
+    # the compact_answer_intervals command.
+    rows = (
+        UserAnswer.objects.filter(user_id=user_id, question__exam_id=exam_id)
+        .values('question_id')
+        .order_by('question_id')
+        .annotate(
+            time_spent=Sum('time_spent'),
+            visit_count=Sum('visit_count'),
+            first_visited_at=Min('first_visited_at'),
+            last_visited_at=Max('last_visited_at'),
+        )
+    )
+    return {row.pop('question_id'): row for row in rows}
+
+
+def get_result_question_times(exam_result):
+    return question_time_totals(exam_result.exam_id, exam_result.user_id)
+
+
+def percentile(ordered, percent):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[rank - 1]
+
+
+def get_exam_time_heatmap(exam, manifest):
+    """Median and p90 time per question across every student who submitted.
+
+    Times are streamed sorted by question and duration, so each question's
+    percentiles are read off its run of rows without holding more than one
+    question's times in memory.
+    """
+    submitted_user_ids = ExamResult.objects.filter(exam=exam).values('user_id')
+    rows = (
+        UserAnswer.objects.filter(question__exam_id=exam.id, user_id__in=submitted_user_ids)
+        .order_by('question_id', 'time_spent')
+        .values_list('question_id', 'time_spent')
+    )
+
+    stats = {}
+    current_id, times = None, []
+
+    def close_run():
+        if current_id is not None:
+            stats[current_id] = {name: percentile(times, percent) for name, percent in HEATMAP_PERCENTILES.items()}
+            stats[current_id]['students'] = len(times)
+
+    for question_id, time_spent in rows.iterator(chunk_size=2000):
+        if question_id != current_id:
+            close_run()
+            current_id, times = question_id, []
+        times.append(time_spent)
+    close_run()
+
+    # Heat is the p90 relative to the slowest question of the exam
+    slowest = max((entry['p90'] for entry in stats.values()), default=None)
+    heatmap = []
+    for question in manifest.questions:
+        entry = stats.get(question['id'], {'median': None, 'p90': None, 'students': 0})
+        heat = entry['p90'] / slowest if entry['p90'] and slowest else 0
+        heatmap.append({'question': question, 'heat': round(heat, 2), **entry})
+    return heatmap
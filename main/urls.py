@@ -6,6 +6,17 @@ from django.contrib.auth.decorators import login_required
 from .views import CustomPasswordResetView
 from django.conf import settings
 from django.conf.urls.static import static
+from . import async_views
+
+# Under ASGI the student hot path is served by native async views
+if getattr(settings, 'ASYNC_STUDENT_VIEWS', False):
+    answer_exam_view = async_views.answer_exam
+    save_answer_view = async_views.save_answer
+    remove_unanswered_question_view = async_views.remove_unanswered_question
+else:
+    answer_exam_view = login_required(views.answer_exam)
+    save_answer_view = login_required(views.save_answer)
+    remove_unanswered_question_view = login_required(views.remove_unanswered_question)
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -24,6 +35,9 @@ urlpatterns = [
 
 
     path('<int:id>/exam-delete/', login_required(views.exam_delete), name='exam_delete'),  # Protected view
+    path('jobs/<int:job_id>/', login_required(views.job_status), name='job_status'),  # Protected view
+    path('purge-status/<str:kind>/<int:id>/', login_required(views.purge_status), name='purge_status'),  # Protected view
+    path('<int:id>/exam-duplicate/', login_required(views.exam_duplicate), name='exam_duplicate'),  # Protected view
     path('<int:id>/exam-edit/', login_required(views.exam_edit), name='exam_edit'),  # Protected view
 
     path('course-list', login_required(views.course_list), name='course_list'),  # Protected view
@@ -32,6 +46,7 @@ urlpatterns = [
     path('<int:id>/course-edit/', login_required(views.course_edit), name='course_edit'),  # Protected view
     path('question/<int:question_id>/delete/', login_required(views.delete_question), name='delete_question'),  # Protected view
     path('teacher-exam/<int:exam_id>/create-question/', login_required(views.create_question), name='create_question'),  # Protected view
+    path('teacher-exam/<int:exam_id>/import-questions/', login_required(views.import_questions), name='import_questions'),  # Protected view
     path('question-list/<int:exam_id>/', login_required(views.question_list), name='question_list'),  # Protected view
 
     path('edit-exam/<int:exam_id>/edit_question/<int:question_id>/', login_required(views.edit_question), name='edit_question'),  # Protected view
@@ -42,14 +57,21 @@ urlpatterns = [
     path('teacher/exam-result/<int:exam_result_id>/', login_required(views.teacher_view_exam_result), name='teacher_view_exam_result'),  # Protected view
 
 
-    path('answer-exam/<int:exam_id>/<int:page_number>/', login_required(views.answer_exam), name='answer_exam'),  # Protected view
-    path('answer-exam/<int:exam_id>/', login_required(views.answer_exam), name='answer_exam'),
+    path('answer-exam/<int:exam_id>/<int:page_number>/', answer_exam_view, name='answer_exam'),  # Protected view
+    path('answer-exam/<int:exam_id>/', answer_exam_view, name='answer_exam'),
     path('results/<int:exam_result_id>/', login_required(views.results), name='results'),  # Protected view
     path('exam-search/',  login_required(views.student_search_exam), name='student_search_exam'),
     path('exam-results/<int:exam_id>/', login_required(views.exam_results), name='exam_results'),  # Protected view
+    path('exam-results/<int:exam_id>/results.csv', login_required(views.exam_results_csv), name='exam_results_csv'),  # Protected view
+    path('exam-results/<int:exam_id>/answers.csv', login_required(views.exam_answers_csv), name='exam_answers_csv'),  # Protected view
+    path('course/<int:course_id>/gradebook/', login_required(views.course_gradebook), name='course_gradebook'),  # Protected view
+    path('course/<int:course_id>/gradebook.csv', login_required(views.course_gradebook_csv), name='course_gradebook_csv'),  # Protected view
+    path('exam-results/<int:exam_id>/item-analysis/', login_required(views.exam_item_analysis), name='exam_item_analysis'),  # Protected view
+    path('exam-results/<int:exam_id>/time-heatmap/', login_required(views.exam_time_heatmap), name='exam_time_heatmap'),  # Protected view
     path('student-view-results/<int:exam_result_id>/', login_required(views.student_view_results), name='student_view_results'),
-    path('save-answer/', login_required(views.save_answer), name='save_answer'),
-    path('remove-unanswered-question/', login_required(views.remove_unanswered_question), name='remove_unanswered_question'),
+    path('save-answer/', save_answer_view, name='save_answer'),
+    path('staff/instrumentation/', views.instrumentation_stats, name='instrumentation_stats'),
+    path('remove-unanswered-question/', remove_unanswered_question_view, name='remove_unanswered_question'),
 
     path('password-reset/', CustomPasswordResetView.as_view(), name='password_reset'),
 
@@ -1,9 +1,10 @@
 from django.http import request
-from django.contrib.auth.models import Group
+from .roles import get_user_role
 
 def get_user_group_context(request):
+    role = get_user_role(request)
     context = {
-        'is_teacher': request.user.groups.filter(name='Teacher').exists(),
-        'is_student': request.user.groups.filter(name='Student').exists(),
+        'is_teacher': role.is_teacher,
+        'is_student': role.is_student,
     }
-    return context
\ No newline at end of file
+    return context
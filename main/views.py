@@ -3,19 +3,35 @@ import uuid
 from django.forms import ValidationError
 from django.shortcuts import get_object_or_404, render, redirect
 from django.db import models
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.db.models import Sum, ExpressionWrapper, DurationField
 from django.contrib.auth.decorators import login_required
-from main.models import Course, Exam, Choice, Question, ExamResult, UserAnswer, AnswerInterval
-from .forms import RegisterForm, LoginForm, CourseForm, ExamForm, QuestionForm, ChoiceForm, CustomPasswordResetForm
+from django.contrib.admin.views.decorators import staff_member_required
+from main.models import Course, Exam, Choice, Question, ExamResult, UserAnswer, ExamAttempt, Job
+from .forms import RegisterForm, LoginForm, CourseForm, ExamForm, QuestionForm, QuestionImportForm, ExamCloneForm, CustomPasswordResetForm
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.urls import reverse
 from django.contrib.auth.models import Group, User
 from django.utils import timezone
 from .utils import get_user_group_context
-from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.http import HttpResponseRedirect, JsonResponse, HttpResponse
+from .roles import resolve_user_role
+from .grading import get_answered_question_ids, get_result_sheet, submit_exam
+from .manifest import get_exam_manifest
+from .autosave import answer_buffer, pending_answers_for, record_answer, write_behind_enabled
+from .timing import get_exam_time_heatmap, get_result_question_times
+from .analytics import get_cached_item_analysis
+from .search import search, search_ordering
+from .pagination import KeysetPaginator, get_page_size
+from .gradebook import gradebook_rows
+from .cloning import clone_exam, copy_name
+from .purge import delete_later, latest_job as latest_purge_job
+from .questions import choices_from_post, save_question
+from .exports import export_answer_matrix, export_course_gradebook, export_exam_results
+from .importer import detect_format, import_questions as import_question_bank, open_upload
+from .middleware.instrumentation import query_budget, stats_registry
+from django.core.paginator import Paginator
+from django.http import HttpResponseRedirect, JsonResponse, HttpResponse, Http404
 from uuid import UUID
 from datetime import timedelta
 from django.views.decorators.csrf import csrf_exempt
@@ -49,9 +65,10 @@ def login_user(request):
                 messages.success(request, 'You are now logged in.')
                 
                 # Set session expiry here
-                if user.groups.filter(name='Teacher').exists():
+                request.user_role = resolve_user_role(request)
+                if request.user_role.is_teacher:
                     request.session.set_expiry(3600)  # 1 hour for teachers
-                elif user.groups.filter(name='Student').exists():
+                elif request.user_role.is_student:
                     request.session.set_expiry(3600)  # 1 hour for students
                 else:
                     request.session.set_expiry(None)  # none minutes for others
@@ -94,8 +111,6 @@ def sign_up(request):
 
 def logout_view(request):
     if request.user.is_authenticated:
-        if 'start_time' in request.session:
-            del request.session['start_time']
         logout(request)
         messages.error(request, 'You have been logged out.')
         return redirect(reverse('home'))
@@ -110,7 +125,7 @@ def teacher_home(request):
 
 @login_required
 def create_course(request):
-    if request.user.groups.filter(name='Teacher').exists():
+    if request.user_role.is_teacher:
         if request.method == 'POST':
             form = CourseForm(request.POST)
             if form.is_valid():
@@ -129,9 +144,11 @@ def create_course(request):
 
 @login_required    
 def course_delete(request, id):
-    course = get_object_or_404(Course, id=id)
-    course.delete()
-    return redirect(request.META.get('HTTP_REFERER'))
+    course = get_object_or_404(Course, id=id, teacher=request.user)
+    # Hidden right away; its exams, questions and answers are purged in the background
+    delete_later(course, request.user)
+    messages.success(request, f'{course.name} was deleted.')
+    return redirect(request.META.get('HTTP_REFERER') or 'course_list')
 
 @login_required
 def course_edit(request, id):
@@ -147,38 +164,27 @@ def course_edit(request, id):
     return render(request, 'teacher/course_edit.html', {'form': form})
     
 @login_required
+@query_budget(10)
 def course_list(request):
     # Get the search query from the user.
     search_query = request.GET.get('search', '')
 
     # Filter the list of courses based on the search query and the current user.
-    courses = Course.objects.filter(
-        Q(name__icontains=search_query) | Q(description__icontains=search_query),
-        teacher=request.user  # Only include courses created by the current user.
+    courses = search(
+        Course.objects.filter(teacher=request.user),  # Only include courses created by the current user.
+        search_query
     )
 
     # Get the number of rows to display per page from the user.
-    per_page = request.GET.get('per_page', 10)
-
-    pagination = Paginator(courses, per_page=per_page)
-
-    # Get the current page.
-    course_page = request.GET.get('course_page')
+    per_page = get_page_size(request)
 
-    # Get the courses for the current page.
-    try:
-        courses_on_page = pagination.page(course_page)
-    except PageNotAnInteger:
-        # If course_page is not an integer, show the first page.
-        courses_on_page = pagination.page(1)
-    except EmptyPage:
-        # If course_page is out of range, show the last page.
-        courses_on_page = pagination.page(pagination.num_pages)
+    # Newest first; course_page is the cursor token of the current page.
+    pagination = KeysetPaginator(courses, search_ordering(search_query, '-pk'), per_page=per_page)
+    courses_on_page = pagination.page(request.GET.get('course_page'))
 
     context = {
         
         'courses': courses_on_page,
-        'num_pages': pagination.num_pages,
         'search_query': search_query,
         'per_page': per_page,
     }
@@ -192,7 +198,7 @@ def course_detail(request, id):
 
 @login_required
 def create_exam(request, course_id):
-    if request.user.groups.filter(name='Teacher').exists():
+    if request.user_role.is_teacher:
         course = get_object_or_404(Course, id=course_id)
         if request.method == 'POST':
             form = ExamForm(request.POST)
@@ -222,6 +228,7 @@ def create_exam(request, course_id):
 
 
 @login_required
+@query_budget(10)
 def exam_list(request, course_id):
      
     # Get the search query from the user.
@@ -229,35 +236,18 @@ def exam_list(request, course_id):
     search_query = request.GET.get('search', '')
 
     # Filter the list of exams based on the search query and the given course_id.
-    exams = Exam.objects.filter(
-        Q(name__icontains=search_query) |
-        Q(description__icontains=search_query) |
-        Q(exam_type__icontains=search_query) |
-        Q(course__name__icontains=search_query)
-    )
+    exams = search(Exam.objects.filter(course_id=course_id).select_related('course'), search_query)
 
     # Get the number of rows to display per page from the user.
-    per_page = request.GET.get('per_page', 10)
-
-    pagination = Paginator(exams, per_page=per_page)
-
-    # Get the current page.
-    exam_page = request.GET.get('exam_page')
-
-    # Get the exams for the current page.
-    try:
-        exams_on_page = pagination.page(exam_page)
-    except PageNotAnInteger:
-        # If exam_page is not an integer, show the first page.
-        exams_on_page = pagination.page(1)
-    except EmptyPage:
-        # If exam_page is out of range, show the last page.
-        exams_on_page = pagination.page(pagination.num_pages)
+    per_page = get_page_size(request)
+
+    # Newest first; exam_page is the cursor token of the current page.
+    pagination = KeysetPaginator(exams, search_ordering(search_query, '-pk'), per_page=per_page)
+    exams_on_page = pagination.page(request.GET.get('exam_page'))
     course = get_object_or_404(Course, id=course_id)
     context = {
         'course': course,
         'exams': exams_on_page,
-        'num_pages': pagination.num_pages,
         'search_query': search_query,
         'per_page': per_page,
     }
@@ -266,6 +256,7 @@ def exam_list(request, course_id):
 
 
 @login_required
+@query_budget(10)
 def search_exam_list(request):
      
 
@@ -273,37 +264,17 @@ def search_exam_list(request):
     
     search_query = request.GET.get('search', '')
     current_user = request.user
-    # Filter the list of exams based on the search query and the given course_id.
-    exams = Exam.objects.filter(
-        Q(name__icontains=search_query) |
-        Q(description__icontains=search_query) |
-        Q(exam_type__icontains=search_query) |
-        Q(course__name__icontains=search_query),
-        course__teacher=current_user
-    )
+    # Filter the list of exams based on the search query and the current user.
+    exams = search(Exam.objects.filter(course__teacher=current_user).select_related('course'), search_query)
 
     # Get the number of rows to display per page from the user.
-    per_page = request.GET.get('per_page', 10)
-
-    pagination = Paginator(exams, per_page=per_page)
-
-    # Get the current page.
-    exam_page = request.GET.get('exam_page')
-
-    # Get the exams for the current page.
-    try:
-        exams_on_page = pagination.page(exam_page)
-    except PageNotAnInteger:
-        # If exam_page is not an integer, show the first page.
-        exams_on_page = pagination.page(1)
-    except EmptyPage:
-        # If exam_page is out of range, show the last page.
-        exams_on_page = pagination.page(pagination.num_pages)
-    course = get_object_or_404(Course)
+    per_page = get_page_size(request)
+
+    # Newest first; exam_page is the cursor token of the current page.
+    pagination = KeysetPaginator(exams, search_ordering(search_query, '-pk'), per_page=per_page)
+    exams_on_page = pagination.page(request.GET.get('exam_page'))
     context = {
-        'course': course,
         'exams': exams_on_page,
-        'num_pages': pagination.num_pages,
         'search_query': search_query,
         'per_page': per_page,
     }
@@ -314,9 +285,42 @@ def search_exam_list(request):
 
 @login_required
 def exam_delete(request, id):
-    exam = get_object_or_404(Exam, id=id)
-    exam.delete()
-    return redirect(request.META.get('HTTP_REFERER'))
+    exam = get_object_or_404(Exam, id=id, course__teacher=request.user)
+    # Hidden right away; its questions, answers and results are purged in the background
+    delete_later(exam, request.user)
+    messages.success(request, f'{exam.name} was deleted.')
+    return redirect(request.META.get('HTTP_REFERER') or reverse('teacher_exam_list', kwargs={'course_id': exam.course_id}))
+
+
+@login_required
+def job_status(request, job_id):
+    # Polled by pages waiting on background work; only its creator and staff may see a job
+    job = get_object_or_404(Job, pk=job_id)
+    if job.created_by_id != request.user.id and not request.user.is_staff:
+        raise Http404
+    return JsonResponse(job.as_dict())
+
+
+@login_required
+def purge_status(request, kind, id):
+    # The job of the latest background delete of a course or exam
+    job = latest_purge_job(kind, id)
+    if job is None:
+        raise Http404
+    return job_status(request, job.pk)
+
+@login_required
+def exam_duplicate(request, id):
+    exam = get_object_or_404(Exam.objects.select_related('course'), id=id, course__teacher=request.user)
+    if request.method == 'POST':
+        form = ExamCloneForm(request.POST, teacher=request.user)
+        if form.is_valid():
+            copy = clone_exam(exam, form.cleaned_data['course'], form.cleaned_data['name'])
+            messages.success(request, f'Copied {exam.name} to {copy.course.name}.')
+            return redirect('teacher_exam_list', course_id=copy.course_id)
+    else:
+        form = ExamCloneForm(teacher=request.user, initial={'course': exam.course, 'name': copy_name(exam, exam.course)})
+    return render(request, 'teacher/exam_duplicate.html', {'form': form, 'exam': exam})
 
 @login_required
 def exam_edit(request, id):
@@ -361,21 +365,12 @@ def create_question(request, exam_id):
         if question_form.is_valid():
             question = question_form.save(commit=False)
             question.exam = exam
-            question.save()
-            # Handle creation of choices
-            correct_choices = 0  # Initialize counter for correct choices
-            for i, choice_text in enumerate(request.POST.getlist('choice_text[]')):
-                is_correct_value = request.POST.get(f'is_correct_{i}', '') == 'on'
-                if is_correct_value:
-                    correct_choices += 1  # Increment counter if choice is correct
-                # Create new choice
-                choice_form = ChoiceForm({'choice_text': choice_text, 'is_correct': is_correct_value})
-                if choice_form.is_valid():
-                    choice = choice_form.save(commit=False)
-                    choice.question = question
-                    choice.save()
-            if correct_choices == 0:  # If no choices are marked as correct
-                messages.error(request, 'Error: At least one choice must be marked as correct.')
+            choices, deleted = choices_from_post(request.POST)
+            try:
+                save_question(question, choices, deleted)
+            except ValidationError as error:
+                # Nothing was saved
+                messages.error(request, f'Error: {error.messages[0]}')
                 return redirect('create_question', exam_id=exam_id)  # Redirect back to the form
             return redirect('question_list', exam_id=exam_id)
     else:
@@ -383,15 +378,40 @@ def create_question(request, exam_id):
     return render(request, 'teacher/create_question.html', {'form': question_form, 'exam': exam})
 
 
+@login_required
+def import_questions(request, exam_id):
+    if not request.user_role.is_teacher:
+        raise PermissionDenied
+    exam = get_object_or_404(Exam.objects.select_related('course'), pk=exam_id, course__teacher=request.user)
+    report = None
+    if request.method == 'POST':
+        form = QuestionImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            format = form.cleaned_data['format'] or detect_format(upload.name)
+            if format is None:
+                form.add_error('format', 'Cannot tell the format from the file name; choose one.')
+            else:
+                # Bad rows are listed in the report; the valid ones are imported
+                report = import_question_bank(exam, open_upload(upload), format)
+                messages.success(request, f"Imported {report['created']} of {report['rows']} questions.")
+    else:
+        form = QuestionImportForm()
+    return render(request, 'teacher/import_questions.html', {'form': form, 'exam': exam, 'report': report})
+
+
 @login_required   
+@query_budget(10)
 def question_list(request, exam_id):
     search_query = request.GET.get('search', '')
-    per_page = int(request.GET.get('per_page', 10))
+    per_page = get_page_size(request)
     exam = Exam.objects.get(pk=exam_id)
+    # The exam_id index leaves LIKE a few hundred rows to scan, which is
+    # faster than joining the full-text index (see bench_search)
     questions = Question.objects.filter(exam_id=exam_id, question_text__icontains=search_query)
-    paginator = Paginator(questions, per_page)
-    page_number = request.GET.get('question_page')
-    questions = paginator.get_page(page_number)
+    # Questions in exam order; question_page is the cursor token of the current page
+    paginator = KeysetPaginator(questions, ['pk'], per_page=per_page)
+    questions = paginator.page(request.GET.get('question_page'))
     context = {
         'questions': questions,
         'search_query': search_query,
@@ -404,62 +424,58 @@ def question_list(request, exam_id):
     
 
 @login_required
+@query_budget(25)
 def answer_exam(request, exam_id, page_number=1):
     exam = get_object_or_404(Exam, pk=exam_id)
     exam_result = ExamResult.objects.filter(user=request.user, exam=exam).first()
     if exam_result:
         return redirect('student_view_results', exam_result_id=exam_result.pk)
 
-    questions = exam.questions.all()
-    paginator = Paginator(questions, 1)
+    # Questions and choices come from the cached exam manifest, not the ORM
+    manifest = get_exam_manifest(exam.id)
+    paginator = Paginator(manifest.questions, 1)
     page_obj = paginator.get_page(page_number)
     
     if page_obj:
         question = page_obj.object_list[0]
-        user_answer = UserAnswer.objects.filter(user=request.user, question=question).first()
-        intervals = AnswerInterval.objects.filter(useranswer=user_answer)
-        total_time_previous_sessions = sum((interval.end_time - interval.start_time).total_seconds() for interval in intervals if interval.start_time and interval.end_time)
+        user_answer = UserAnswer.objects.filter(user=request.user, question_id=question['id']).first()
+        total_time_previous_sessions = user_answer.time_spent.total_seconds() if user_answer else 0
     else:
         question = None
         user_answer = None
         total_time_previous_sessions = 0
 
-    start_time = request.session.get('start_time')
-    if not start_time:
-        start_time = timezone.now()
-        request.session['start_time'] = start_time.isoformat()
-    else:
-        start_time = datetime.datetime.fromisoformat(start_time)
-
-    elapsed_time = (timezone.now() - start_time).total_seconds()
-    remaining_time = max(0, exam.duration.total_seconds() - elapsed_time)
+    # The attempt holds the server-side clock for this user and exam
+    attempt = ExamAttempt.start(request.user, exam)
+    remaining_time = attempt.remaining_seconds()
 
-    # Get all question IDs for the current exam
-    all_question_ids = set(question.id for question in questions)
+    # Get answered question IDs for the current user and exam, including buffered autosaves
+    answered_question_ids = get_answered_question_ids(manifest, request.user)
+    pending_answers = pending_answers_for(request.user.id)
 
-    # Get answered question IDs for the current user and exam
-    answered_question_ids = set(UserAnswer.objects.filter(user=request.user, question__in=questions).exclude(choice__isnull=True).values_list('question__id', flat=True))
+    # Unanswered question IDs, in exam order
+    unanswered_question_ids = [question_id for question_id in manifest.question_ids if question_id not in answered_question_ids]
 
-    # Get unanswered question IDs by subtracting the sets
-    unanswered_question_ids = list(all_question_ids - answered_question_ids)
-
-    # Store unanswered_question_ids in the session
-    request.session['unanswered_question_ids'] = unanswered_question_ids
-    # Add this line to reload the session data
-    request.session.modified = True
+    # Only write the attempt back when the position or answered count moved
+    attempt.track(page_obj.number, len(answered_question_ids))
     if request.method == 'POST':
-        answer = request.POST.get(f'question_{question.id}')
-    
-        choice = Choice.objects.filter(pk=answer).first() if answer else None
+        answer = request.POST.get(f"question_{question['id']}")
+        choice_id = int(answer) if answer and answer.isdigit() else None
+        # Only accept choices that belong to this question
+        if not manifest.has_choice(question['id'], choice_id):
+            choice_id = None
+        # The posted answer supersedes any buffered autosave for this question
+        pending_answers.pop(question['id'], None)
+        if write_behind_enabled():
+            answer_buffer.discard(request.user.id, question['id'])
         user_answer, created = UserAnswer.objects.update_or_create(
             user=request.user,
-            question=question,
-            defaults={'choice': choice} if choice else {}
+            question_id=question['id'],
+            defaults={'choice_id': choice_id} if choice_id else {}
         )
         
-        latest_interval = AnswerInterval.objects.filter(useranswer=user_answer).latest('start_time')
-        latest_interval.end_time = timezone.now()
-        latest_interval.save()
+        # Close the visit opened by the last GET of this page
+        user_answer.end_visit()
 
         if 'next' in request.POST and page_obj.has_next():
             return redirect('answer_exam', exam_id=exam_id, page_number=page_obj.next_page_number())
@@ -468,58 +484,22 @@ def answer_exam(request, exam_id, page_number=1):
             return redirect('answer_exam', exam_id=exam_id, page_number=page_obj.previous_page_number())
         
         elif 'submit' in request.POST or int(request.POST.get('remaining_time', 0)) <= 0:
-            score = 0
-            incorrect_answers = 0
-            unanswered_questions = 0
-            total_questions = paginator.count
-            for question in questions:
-                user_answer = UserAnswer.objects.filter(user=request.user, question=question).first()
-                if user_answer and user_answer.choice:
-                    if user_answer.choice.is_correct:
-                        score += 1
-                    else:
-                        incorrect_answers += 1
-                else:
-                    unanswered_questions += 1
-
-            percentage = round((score / total_questions) * 100, 2)
-            
-            end_time = timezone.now()
-
-            exam_result = ExamResult.objects.create(
-                exam=exam,
-                user=request.user,
-                score=score,
-                total_questions=total_questions,
-                percentage=percentage,
-                unanswered_questions=unanswered_questions,
-                incorrect_answers=incorrect_answers,
-                answered_at=end_time,
-                start_time=start_time,
-                end_time=end_time,
-                submitted=True  
-            )
+            exam_result = submit_exam(exam, request.user, attempt)
             return redirect('student_view_results', exam_result_id=exam_result.pk)
         
     else:
         user_answer, created = UserAnswer.objects.get_or_create(
             user=request.user,
-            question=question
-        )
-        AnswerInterval.objects.create(
-            useranswer=user_answer,
-            start_time=timezone.now(),
-            end_time=None
+            question_id=question['id']
         )
+        user_answer.start_visit()
+
+    if question and question['id'] in pending_answers:
+        user_answer.choice_id = pending_answers[question['id']]
     
     # Calculate the page number of the first unanswered question
     first_unanswered_question_id = unanswered_question_ids[0] if unanswered_question_ids else None
-    first_unanswered_page_number = None
-    if first_unanswered_question_id:
-        for i, question in enumerate(questions, start=1):
-            if question.id == first_unanswered_question_id:
-                first_unanswered_page_number = (i - 1) // paginator.per_page + 1
-                break
+    first_unanswered_page_number = manifest.page_number(first_unanswered_question_id)
     
     # If there are no unanswered questions, set first_unanswered_page_number to the last page
     if first_unanswered_page_number is None:
@@ -528,6 +508,7 @@ def answer_exam(request, exam_id, page_number=1):
     context = {
         'exam': exam,
         'page_obj': page_obj,
+        'question': question,
         'user_answer': user_answer,
         'total_time_previous_sessions': total_time_previous_sessions,
         'remaining_time': remaining_time,
@@ -538,77 +519,157 @@ def answer_exam(request, exam_id, page_number=1):
     return render(request, 'student/answer_exam.html', context)
 
 @login_required
+@query_budget(8)
 def save_answer(request):
     if request.method == 'POST':
-        question_id = request.POST.get('question_id')
-        choice_id = request.POST.get('choice_id')
+        try:
+            question_id = int(request.POST.get('question_id'))
+            choice_id = int(request.POST['choice_id']) if request.POST.get('choice_id') else None
+            exam_id = int(request.POST['exam_id']) if request.POST.get('exam_id') else None
+        except (TypeError, ValueError):
+            raise Http404
         
-        question = get_object_or_404(Question, pk=question_id)
-        choice = get_object_or_404(Choice, pk=choice_id) if choice_id else None
+        if exam_id is not None:
+            # Validate against the cached exam manifest instead of the database
+            manifest = get_exam_manifest(exam_id)
+            if manifest.question(question_id) is None:
+                raise Http404
+            if choice_id is not None and not manifest.has_choice(question_id, choice_id):
+                raise Http404
+        else:
+            question = get_object_or_404(Question, pk=question_id)
+            if choice_id is not None:
+                get_object_or_404(Choice, pk=choice_id, question=question)
         
-        user_answer, created = UserAnswer.objects.update_or_create(
-            user=request.user,
-            question=question,
-            defaults={'choice': choice}
-        )
+        record_answer(request.user.id, question_id, choice_id)
         
         return JsonResponse({'status': 'success'})
 
 @login_required
+@query_budget(6)
 def remove_unanswered_question(request):
     if request.method == 'POST':
-        question_id = request.POST.get('question_id')
+        try:
+            question_id = int(request.POST.get('question_id'))
+        except (TypeError, ValueError):
+            raise Http404
         
-        # Remove question_id from unanswered_question_ids in the session
-        unanswered_question_ids = request.session.get('unanswered_question_ids', [])
-        if question_id in unanswered_question_ids:
-            unanswered_question_ids.remove(question_id)
-            request.session['unanswered_question_ids'] = unanswered_question_ids
+        # The attempt at the exam of the question, found in one lookup
+        attempt = get_object_or_404(ExamAttempt, user=request.user, exam__questions=question_id)
         
-        return JsonResponse({'status': 'success'})
+        # Refresh the answered count of the attempt, including buffered autosaves
+        answered_count = len(get_answered_question_ids(get_exam_manifest(attempt.exam_id), request.user))
+        attempt.track(attempt.current_position, answered_count)
+        
+        return JsonResponse({'status': 'success', 'answered_count': answered_count})
+
+def exam_result_context(exam_result):
+    # Answers, correctness and time per question come from the result snapshot,
+    # visits from one grouped query over the student's answers
+    user_answers = get_result_sheet(exam_result)
+    question_times = get_result_question_times(exam_result)
+    for answer in user_answers:
+        visits = question_times.get(answer['question_id'], {})
+        answer['visit_count'] = visits.get('visit_count', 0)
+        answer['first_visited_at'] = visits.get('first_visited_at')
+        answer['last_visited_at'] = visits.get('last_visited_at')
+
+    return {
+        'exam_result': exam_result,
+        'user_answers': user_answers,
+        'student': exam_result.user,
+        'course': exam_result.exam.course,
+        'total_time': exam_result.end_time - exam_result.start_time,
+    }
+
 
 @login_required
+@query_budget(6)
 def results(request, exam_result_id):
-    exam_result = get_object_or_404(ExamResult, pk=exam_result_id)
-    student = exam_result.user
-    course = exam_result.exam.course
-    questions = exam_result.exam.questions.all()
-    user_answers = []
-    for question in questions:
-        user_answer = UserAnswer.objects.filter(user=exam_result.user, question=question).first()
-        user_answers.append((question, user_answer))
-    
-    # Calculate total time taken for the exam
-    total_time = exam_result.end_time - exam_result.start_time
+    exam_result = get_object_or_404(ExamResult.objects.select_related('user', 'exam__course'), pk=exam_result_id)
+    return render(request, 'teacher/teacher_view_exam_result.html', exam_result_context(exam_result))
+
+
+@login_required
+@query_budget(8)
+def exam_results(request, exam_id):
+    # The statistics are running totals kept by main.stats, joined in with the exam
+    exam = get_object_or_404(Exam.objects.select_related('stats'), pk=exam_id)
+    exam_results = ExamResult.objects.filter(exam=exam).select_related('user')
+    # Latest submissions first; page is the cursor token of the current page
+    paginator = KeysetPaginator(exam_results, ['-pk'], per_page=get_page_size(request, default=25))
+    exam_results = paginator.page(request.GET.get('page'))
+    context = {'exam': exam, 'exam_results': exam_results, 'stats': getattr(exam, 'stats', None)}
+    return render(request, 'teacher/exam_results.html', context)
+
+
+@login_required
+@query_budget(8)
+def exam_item_analysis(request, exam_id):
+    # The page shows the answer key, so only the course teacher may see it
+    exam = get_object_or_404(Exam, pk=exam_id, course__teacher=request.user)
+    analysis, up_to_date = get_cached_item_analysis(exam.id, get_exam_manifest(exam.id))
+    context = {'exam': exam, 'analysis': analysis, 'up_to_date': up_to_date}
+    return render(request, 'teacher/exam_item_analysis.html', context)
+
+
+@login_required
+def exam_results_csv(request, exam_id):
+    exam = get_object_or_404(Exam, pk=exam_id, course__teacher=request.user)
+    return export_exam_results(exam)
+
+
+@login_required
+def exam_answers_csv(request, exam_id):
+    # Answer matrix: one row per student, one column per question
+    exam = get_object_or_404(Exam, pk=exam_id, course__teacher=request.user)
+    return export_answer_matrix(exam)
+
+
+@login_required
+def course_gradebook_csv(request, course_id):
+    course = get_object_or_404(Course, pk=course_id, teacher=request.user)
+    return export_course_gradebook(course)
+
 
+@login_required
+@query_budget(8)
+def course_gradebook(request, course_id):
+    course = get_object_or_404(Course, pk=course_id, teacher=request.user)
+    exams = list(Exam.objects.filter(course=course).order_by('pk').only('pk', 'name'))
+    # Students with a result in the course, a page at a time. The EXISTS probes
+    # the (user, exam) unique index instead of collecting every result of the course
+    students = User.objects.filter(
+        Exists(ExamResult.objects.filter(user=OuterRef('pk'), exam_id__in=[exam.pk for exam in exams])),
+    ).only('pk', 'username', 'first_name', 'last_name')
+    per_page = get_page_size(request, default=25)
+    paginator = KeysetPaginator(students, ['last_name', 'first_name', 'pk'], per_page=per_page)
+    page = paginator.page(request.GET.get('page'))
     context = {
-        'exam_result': exam_result,
-        'user_answers': user_answers,
-        'student': student,
         'course': course,
-        'total_time': total_time,  # Pass total_time to the context
+        'exams': exams,
+        'page': page,
+        'rows': gradebook_rows(exams, page.object_list),
+        'per_page': per_page,
     }
-    
-    return render(request, 'teacher/teacher_view_exam_result.html', context)
+    return render(request, 'teacher/course_gradebook.html', context)
 
 
 @login_required
-def exam_results(request, exam_id):
-    exam = get_object_or_404(Exam, pk=exam_id)
-    exam_results = ExamResult.objects.filter(exam=exam)
-    context = {'exam': exam, 'exam_results': exam_results}
-    return render(request, 'teacher/exam_results.html', context)
+@query_budget(8)
+def exam_time_heatmap(request, exam_id):
+    exam = get_object_or_404(Exam, pk=exam_id, course__teacher=request.user)
+    heatmap = get_exam_time_heatmap(exam, get_exam_manifest(exam.id))
+    context = {'exam': exam, 'heatmap': heatmap}
+    return render(request, 'teacher/exam_time_heatmap.html', context)
 
 @login_required
+@query_budget(6)
 def student_view_results(request, exam_result_id):
-    exam_result = get_object_or_404(ExamResult, pk=exam_result_id)
+    exam_result = get_object_or_404(ExamResult.objects.select_related('user', 'exam__course'), pk=exam_result_id)
     student = exam_result.user
     course = exam_result.exam.course
-    questions = exam_result.exam.questions.all()
-    user_answers = []
-    for question in questions:
-        user_answer = UserAnswer.objects.filter(user=exam_result.user, question=question).first()
-        user_answers.append((question, user_answer))
+    user_answers = get_result_sheet(exam_result)
 
     context = {
         'exam_result': exam_result,
@@ -622,39 +683,17 @@ def student_view_results(request, exam_result_id):
 @login_required
 def edit_question(request, exam_id, question_id):
     exam = get_object_or_404(Exam, pk=exam_id)
-    question = get_object_or_404(Question, pk=question_id)
+    question = get_object_or_404(Question, pk=question_id, exam=exam)
     if request.method == 'POST':
         question_form = QuestionForm(request.POST, request.FILES, instance=question)
         if question_form.is_valid():
             question = question_form.save(commit=False)
-            question.exam = exam
-            question.save()
-            # Handle deletion of choices
-            for choice in question.choices.all():
-                if f'delete_choice_{choice.id}' in request.POST:
-                    choice.delete()
-            # Handle updating and creation of choices
-            correct_choices = 0  # Initialize counter for correct choices
-            for i, choice_text in enumerate(request.POST.getlist('choice_text[]')):
-                is_correct_value = request.POST.get(f'is_correct_{i}', '') == 'on'
-                if is_correct_value:
-                    correct_choices += 1  # Increment counter if choice is correct
-                choice_id = request.POST.get(f'choice_id_{i}')
-                if choice_id:
-                    # Update existing choice
-                    choice = Choice.objects.get(pk=choice_id)
-                    choice.choice_text = choice_text
-                    choice.is_correct = is_correct_value
-                    choice.save()
-                else:
-                    # Create new choice
-                    choice_form = ChoiceForm({'choice_text': choice_text, 'is_correct': is_correct_value})
-                    if choice_form.is_valid():
-                        choice = choice_form.save(commit=False)
-                        choice.question = question
-                        choice.save()
-            if correct_choices == 0:  # If no choices are marked as correct
-                messages.error(request, 'Error: At least one choice must be marked as correct.')
+            choices, deleted = choices_from_post(request.POST)
+            try:
+                save_question(question, choices, deleted)
+            except ValidationError as error:
+                # The question and its choices are left as they were
+                messages.error(request, f'Error: {error.messages[0]}')
                 return redirect('edit_question', exam_id=exam_id, question_id=question_id)  # Redirect back to the form
             return redirect('question_list', exam_id=exam_id)
     else:
@@ -666,7 +705,7 @@ def edit_question(request, exam_id, question_id):
 def delete_choice(request, choice_id):
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         logger.info('Received AJAX request to delete choice')
-        choice = get_object_or_404(Choice, pk=choice_id)
+        choice = get_object_or_404(Choice.objects.select_related('question'), pk=choice_id)
         choice.delete()
         logger.info(f'Deleted choice with ID {choice_id}')
         return JsonResponse({'success': True})
@@ -680,7 +719,10 @@ def teacher_search_student(request):
     if request.method == 'GET':
         search_query = request.GET.get('search', '')
         current_user = request.user
-        students = User.objects.filter(username__icontains=search_query, groups__name='Student', examresult__exam__course__teacher=current_user)
+        students = User.objects.filter(
+            username__icontains=search_query, groups__name='Student',
+            examresult__exam__course__teacher=current_user, examresult__exam__deleted_at__isnull=True,
+        )
         context = {'students': students}
         return render(request, 'teacher/teacher_search_student.html', context)
 
@@ -688,39 +730,17 @@ def teacher_search_student(request):
 @login_required
 def teacher_student_exams(request, student_id):
     student = get_object_or_404(User, pk=student_id)
-    exam_results = ExamResult.objects.filter(user=student)
+    # Results of exams that are deleted but not purged yet are left out
+    exam_results = ExamResult.objects.filter(user=student, exam__deleted_at__isnull=True)
     context = {'student': student, 'exam_results': exam_results}
     return render(request, 'teacher/teacher_student_exams.html', context)
 
 # View to view the result of a specific exam
 @login_required
+@query_budget(6)
 def teacher_view_exam_result(request, exam_result_id):
-    exam_result = get_object_or_404(ExamResult, pk=exam_result_id)
-    student = exam_result.user
-    course = exam_result.exam.course
-    questions = exam_result.exam.questions.all()
-    user_answers = []
-    for question in questions:
-        user_answer = UserAnswer.objects.filter(user=exam_result.user, question=question).first()
-        
-        # Calculate total time spent on this question in this session
-        intervals = AnswerInterval.objects.filter(useranswer=user_answer)
-        total_time_question = datetime.timedelta(seconds=sum((interval.end_time - interval.start_time).total_seconds() for interval in intervals if interval.start_time and interval.end_time))
-        
-        user_answers.append((question, user_answer, total_time_question))
-    
-    # Calculate total time taken for the exam
-    total_time = exam_result.end_time - exam_result.start_time
-
-    context = {
-        'exam_result': exam_result,
-        'user_answers': user_answers,
-        'student': student,
-        'course': course,
-        'total_time': total_time,  # Pass total_time to the context
-    }
-    
-    return render(request, 'teacher/teacher_view_exam_result.html', context)
+    exam_result = get_object_or_404(ExamResult.objects.select_related('user', 'exam__course'), pk=exam_result_id)
+    return render(request, 'teacher/teacher_view_exam_result.html', exam_result_context(exam_result))
 
 @login_required
 def delete_question(request, question_id):
@@ -742,4 +762,12 @@ def student_search_exam(request):
         except (ValueError, Exam.DoesNotExist):
             messages.error(request, 'Exam not found. Please enter a valid code.')  # Add an error message
 
-    return render(request, 'student/exam_search.html', {'exams': exams})
\ No newline at end of file
+    return render(request, 'student/exam_search.html', {'exams': exams})
+
+
+@staff_member_required
+def instrumentation_stats(request):
+    # Per-view latency and query histograms collected by RequestInstrumentationMiddleware
+    if request.method == 'POST' and request.POST.get('reset'):
+        stats_registry.reset()
+    return JsonResponse(stats_registry.snapshot())
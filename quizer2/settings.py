@@ -22,6 +22,7 @@ ALLOWED_HOSTS = ['*', '34.217.214.151' ]
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -48,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.middleware.custom_middleware.UserRoleMiddleware',
 
     
     'main.middleware.custom_middleware.RedirectUnauthenticatedMiddleware',
@@ -79,6 +81,22 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'quizer2.wsgi.application'
+ASGI_APPLICATION = 'quizer2.asgi.application'
+
+# Serve answer_exam page views, save_answer and remove_unanswered_question with
+# native async views. Only worth enabling when running under an ASGI server.
+
+ASYNC_STUDENT_VIEWS = False
+
+# Channels
+# https://channels.readthedocs.io/en/stable/topics/channel_layers.html
+# The in-memory layer only works within one process; use channels_redis in production.
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
 
 
 # Database
@@ -99,6 +117,71 @@ DATABASES = {
 
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Exam manifests and the versions of exam manifests and user roles are cached
+# here; use a shared backend (e.g. Memcached or Redis) when running more than one
+# worker process so version bumps reach every worker. `manage.py check --deploy`
+# warns about a per-process backend (main.W001). Role versions are kept per
+# user next to manifests and item analyses, so the cache holds far more than
+# LocMemCache's default of 300 entries; culling would drop role versions and
+# manifests under load.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'quizer',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+}
+
+
+# Buffer save_answer autosaves in memory and write them in batches every
+# AUTOSAVE_FLUSH_INTERVAL seconds and at submit. The buffer is per process.
+
+AUTOSAVE_WRITE_BEHIND = False
+AUTOSAVE_FLUSH_INTERVAL = 2
+
+
+# Results at or above this percentage count as passed in the exam statistics.
+# Changing it only affects new results until `manage.py rebuild_exam_stats` runs.
+
+EXAM_PASS_PERCENTAGE = 50
+
+
+# Background jobs (see main.tasks) are run by `manage.py runworker`. Failed
+# jobs are retried after TASK_RETRY_DELAY seconds, doubling each time; running
+# jobs whose worker sent no heartbeat for TASK_TIMEOUT seconds are requeued.
+
+TASK_RETRY_DELAY = 30
+TASK_TIMEOUT = 600
+
+
+# Deleted courses and exams are hidden at once and purged by a background job
+# (see main.purge). Set to False to purge before the response instead, e.g.
+# where no worker runs.
+
+PURGE_IN_BACKGROUND = True
+
+
+# Item analysis is computed by a background job (see main.analytics), queued
+# ITEM_ANALYSIS_DELAY seconds after a burst of submissions and when a teacher
+# opens a stale analysis. Set to False to compute it in the request instead.
+
+ITEM_ANALYSIS_IN_BACKGROUND = True
+ITEM_ANALYSIS_DELAY = 60
+
+
+# Request instrumentation is opt-in: put
+# 'main.middleware.instrumentation.RequestInstrumentationMiddleware' first in
+# MIDDLEWARE to log one JSON line per request and collect per-view histograms
+# (served to staff at /staff/instrumentation/). Views declare query budgets
+# with @query_budget; QUERY_BUDGETS_RAISE turns going over one into an error.
+
+REQUEST_INSTRUMENTATION_LOG = True
+QUERY_BUDGETS_RAISE = False
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 